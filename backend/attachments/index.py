@@ -0,0 +1,233 @@
+'''
+Business: Вложения пользователей - загрузка частями, скачивание с поддержкой Range, удаление
+Args: event - dict с httpMethod, body, queryStringParameters, headers
+      context - объект с атрибутами request_id, function_name
+Returns: HTTP response dict; содержимое файла отдаётся в base64
+'''
+
+import base64
+import json
+import os
+import re
+from typing import Dict, Any, List
+from urllib.parse import quote
+import db
+from psycopg2.extras import RealDictCursor
+import store
+
+SCHEMA = 't_p76735805_video_surveillance_s'
+
+# Ограничение размера одного ответа функции; большие файлы скачиваются диапазонами
+MAX_RESPONSE_BYTES = 4 * 1024 * 1024
+
+
+def json_response(status: int, payload: Any) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps(payload, default=str),
+        'isBase64Encoded': False
+    }
+
+
+def content_disposition(file_name: str) -> str:
+    '''attachment с ASCII-именем для старых клиентов и filename* (RFC 5987) с исходным'''
+    fallback = re.sub(r'[^\x20-\x7e]|["\\]', '_', file_name).strip() or 'file'
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(file_name, safe='')}"
+
+
+def parse_ids(value: str) -> List[int]:
+    '''?ids=1,2,3; ValueError при нечисловом id'''
+    try:
+        return [int(i) for i in value.split(',') if i.strip()]
+    except ValueError:
+        raise ValueError('ids must be a comma-separated list of integers')
+
+
+def parse_id(params: Dict[str, Any]) -> int:
+    value = str(params.get('id') or '')
+    if not value.isdigit():
+        raise ValueError('id must be an integer')
+    return int(value)
+
+
+def lock_blob(cursor, sha256: str) -> None:
+    '''
+    Блокировка содержимого до конца транзакции. Ей сериализуются перенос
+    загрузки в blobs со вставкой ссылки и удаление файла без ссылок.
+    '''
+    cursor.execute('SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))', (sha256,))
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, Range, X-Auth-Token',
+                'Access-Control-Expose-Headers': 'Content-Range, Accept-Ranges, Content-Disposition',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    params = event.get('queryStringParameters') or {}
+
+    if method == 'PUT':
+        # Часть файла: тело в base64, смещение в ?offset=
+        try:
+            chunk = base64.b64decode(event.get('body') or '')
+            received = store.append_chunk(params.get('upload_id', ''), int(params.get('offset', 0)), chunk)
+        except (store.StoreError, ValueError) as e:
+            return json_response(400, {'error': str(e)})
+        return json_response(200, {'upload_id': params.get('upload_id'), 'received': received})
+
+    if method == 'POST':
+        try:
+            body_data = json.loads(event.get('body') or '{}')
+        except json.JSONDecodeError:
+            body_data = None
+        if not isinstance(body_data, dict):
+            return json_response(400, {'error': 'Invalid JSON body'})
+        if body_data.get('action') == 'start':
+            try:
+                upload_id = store.start_upload(
+                    str(body_data.get('file_name') or 'file'),
+                    str(body_data.get('content_type') or 'application/octet-stream'),
+                    int(body_data.get('size', -1))
+                )
+            except (store.StoreError, ValueError, TypeError) as e:
+                return json_response(400, {'error': str(e)})
+            return json_response(201, {'upload_id': upload_id, 'received': 0})
+        if body_data.get('action') != 'complete':
+            return json_response(400, {'error': 'action must be start or complete'})
+        upload_id = str(body_data.get('upload_id') or '')
+        expected_sha256 = body_data.get('sha256')
+        try:
+            stored = store.hash_upload(upload_id, str(expected_sha256) if expected_sha256 else None)
+        except store.StoreError as e:
+            return json_response(400, {'error': str(e)})
+
+    try:
+        if method == 'GET' and params.get('ids'):
+            ids = parse_ids(params['ids'])
+        elif method in ('GET', 'DELETE'):
+            attachment_id = parse_id(params)
+    except ValueError as e:
+        return json_response(400, {'error': str(e)})
+
+    conn = db.connect(os.environ['DATABASE_URL'])
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+
+    try:
+        if method == 'POST':
+            lock_blob(cursor, stored['sha256'])
+            try:
+                stored['deduplicated'] = store.commit_upload(upload_id, stored['sha256'])
+            except FileNotFoundError:
+                # Ту же загрузку параллельно завершил другой запрос
+                return json_response(400, {'error': 'Upload not found'})
+
+            cursor.execute(f'''
+                INSERT INTO {SCHEMA}.attachments (sha256, size, file_name, content_type)
+                VALUES (%s, %s, %s, %s)
+                RETURNING id, sha256, size, file_name, content_type, created_at
+            ''', (stored['sha256'], stored['size'], stored['file_name'], stored['content_type']))
+            attachment = dict(cursor.fetchone())
+            conn.commit()
+            attachment['deduplicated'] = stored['deduplicated']
+            return json_response(201, attachment)
+
+        if method == 'GET' and params.get('ids'):
+            cursor.execute(f'''
+                SELECT id, sha256, size, file_name, content_type, created_at
+                FROM {SCHEMA}.attachments
+                WHERE id = ANY(%s::integer[])
+                ORDER BY id
+            ''', (ids,))
+            return json_response(200, [dict(row) for row in cursor.fetchall()])
+
+        if method == 'GET':
+            cursor.execute(f'''
+                SELECT sha256, size, file_name, content_type
+                FROM {SCHEMA}.attachments
+                WHERE id = %s
+            ''', (attachment_id,))
+            attachment = cursor.fetchone()
+            if not attachment:
+                return json_response(404, {'error': 'Attachment not found'})
+
+            size = attachment['size']
+            headers = event.get('headers') or {}
+            try:
+                requested = store.parse_range(headers.get('Range') or headers.get('range'), size)
+            except store.StoreError as e:
+                return {
+                    'statusCode': 416,
+                    'headers': {'Content-Range': f'bytes */{size}', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': str(e)}),
+                    'isBase64Encoded': False
+                }
+
+            start, end = requested or (0, size - 1)
+            end = min(end, start + MAX_RESPONSE_BYTES - 1)
+            partial = requested is not None or end < size - 1
+            content_type = attachment['content_type']
+            if not store.CONTENT_TYPE_RE.fullmatch(content_type):
+                content_type = 'application/octet-stream'
+            response_headers = {
+                'Content-Type': content_type,
+                'Content-Disposition': content_disposition(attachment['file_name']),
+                'Accept-Ranges': 'bytes',
+                'ETag': f'"{attachment["sha256"]}"',
+                'Cache-Control': 'private, max-age=31536000, immutable',
+                'Access-Control-Allow-Origin': '*'
+            }
+            if partial:
+                response_headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+            return {
+                'statusCode': 206 if partial else 200,
+                'headers': response_headers,
+                'body': base64.b64encode(store.read_range(attachment['sha256'], start, end)).decode(),
+                'isBase64Encoded': True
+            }
+
+        if method == 'DELETE':
+            cursor.execute(f'''
+                WITH removed AS (
+                    DELETE FROM {SCHEMA}.attachments WHERE id = %s RETURNING sha256
+                ), unlinked AS (
+                    UPDATE system_users
+                    SET attachment_ids = array_remove(attachment_ids, %s)
+                    WHERE attachment_ids @> ARRAY[%s]
+                )
+                SELECT sha256 FROM removed
+            ''', (attachment_id, attachment_id, attachment_id))
+            removed = cursor.fetchone()
+            if not removed:
+                return json_response(404, {'error': 'Attachment not found'})
+            conn.commit()
+
+            # Файл удаляется только когда на содержимое не осталось ссылок.
+            # Проверка идёт под блокировкой содержимого после фиксации удаления:
+            # завершение загрузки с тем же sha256 либо уже вставило ссылку,
+            # либо дождётся блокировки и заново положит файл в blobs
+            lock_blob(cursor, removed['sha256'])
+            cursor.execute(f'''
+                SELECT EXISTS (SELECT 1 FROM {SCHEMA}.attachments WHERE sha256 = %s) AS referenced
+            ''', (removed['sha256'],))
+            if not cursor.fetchone()['referenced']:
+                store.remove_blob(removed['sha256'])
+            conn.commit()
+            return json_response(200, {'success': True})
+
+        return json_response(405, {'error': 'Method not allowed'})
+
+    finally:
+        cursor.close()
+        conn.close()
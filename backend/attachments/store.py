@@ -0,0 +1,200 @@
+'''
+Контентно-адресуемое хранилище файлов.
+Содержимое лежит в ATTACHMENTS_DIR/blobs/<sha[:2]>/<sha[2:4]>/<sha> и
+записывается один раз: одинаковые файлы разных пользователей занимают место
+однократно. Загрузка идёт частями во временный файл uploads/<upload_id>, при
+завершении файл хэшируется потоково и атомарно переносится в blobs. Чтение
+диапазонов выполняется через mmap без загрузки файла целиком.
+
+ATTACHMENTS_DIR обязателен и должен указывать на хранилище, общее для всех
+экземпляров функции: части одной загрузки и скачивание могут попасть на разные
+экземпляры. Загрузки, не менявшиеся дольше UPLOAD_TTL_SECONDS, удаляются при
+старте новых загрузок.
+'''
+
+import hashlib
+import json
+import mmap
+import os
+import re
+import secrets
+import time
+from typing import Dict, Any, Optional, Tuple
+
+MAX_FILE_BYTES = 100 * 1024 * 1024
+HASH_BLOCK_BYTES = 1024 * 1024
+UPLOAD_TTL_SECONDS = 24 * 3600
+CLEANUP_INTERVAL_SECONDS = 3600.0
+
+UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Тип с необязательными параметрами: text/plain; charset=utf-8
+CONTENT_TYPE_RE = re.compile(r'^[\w.+-]+/[\w.+-]+(\s*;\s*[\w.+-]+=(?:"[^"\r\n]*"|[\w.+-]+))*$')
+
+_cleaned_at = 0.0
+
+
+class StoreError(ValueError):
+    pass
+
+
+def _root() -> str:
+    return os.environ['ATTACHMENTS_DIR']
+
+
+def _uploads_dir() -> str:
+    path = os.path.join(_root(), 'uploads')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def blob_path(sha256: str) -> str:
+    if not SHA256_RE.match(sha256):
+        raise StoreError('Invalid sha256')
+    return os.path.join(_root(), 'blobs', sha256[:2], sha256[2:4], sha256)
+
+
+def _upload_paths(upload_id: str) -> Tuple[str, str]:
+    if not UPLOAD_ID_RE.match(upload_id or ''):
+        raise StoreError('Invalid upload_id')
+    base = os.path.join(_uploads_dir(), upload_id)
+    return base, base + '.json'
+
+
+def cleanup_uploads(max_age: float = UPLOAD_TTL_SECONDS) -> int:
+    '''Удаляет брошенные загрузки старше max_age секунд; возвращает их число'''
+    uploads_dir = _uploads_dir()
+    threshold = time.time() - max_age
+    removed = 0
+    for name in os.listdir(uploads_dir):
+        if not UPLOAD_ID_RE.match(name):
+            continue
+        data_path, meta_path = _upload_paths(name)
+        try:
+            if os.path.getmtime(data_path) >= threshold:
+                continue
+            os.remove(data_path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.remove(meta_path)
+        except FileNotFoundError:
+            pass
+        removed += 1
+    return removed
+
+
+def start_upload(file_name: str, content_type: str, size: int) -> str:
+    global _cleaned_at
+    if size < 0 or size > MAX_FILE_BYTES:
+        raise StoreError(f'File size must be between 0 and {MAX_FILE_BYTES} bytes')
+    if not CONTENT_TYPE_RE.fullmatch(content_type):
+        raise StoreError('Invalid content_type')
+    if time.monotonic() - _cleaned_at >= CLEANUP_INTERVAL_SECONDS:
+        _cleaned_at = time.monotonic()
+        cleanup_uploads()
+    upload_id = secrets.token_hex(16)
+    data_path, meta_path = _upload_paths(upload_id)
+    with open(meta_path, 'w') as meta:
+        json.dump({'file_name': file_name, 'content_type': content_type, 'size': size}, meta)
+    open(data_path, 'wb').close()
+    return upload_id
+
+
+def upload_meta(upload_id: str) -> Dict[str, Any]:
+    _, meta_path = _upload_paths(upload_id)
+    try:
+        with open(meta_path) as meta:
+            return json.load(meta)
+    except FileNotFoundError:
+        raise StoreError('Upload not found')
+
+
+def append_chunk(upload_id: str, offset: int, chunk: bytes) -> int:
+    '''
+    Дописывает часть по смещению offset и возвращает принятый размер.
+    Повтор уже принятой части (offset + len <= принятого) игнорируется.
+    '''
+    meta = upload_meta(upload_id)
+    data_path, _ = _upload_paths(upload_id)
+    received = os.path.getsize(data_path)
+    if offset + len(chunk) <= received:
+        return received
+    if offset != received:
+        raise StoreError(f'Expected offset {received}')
+    if received + len(chunk) > meta['size']:
+        raise StoreError('Chunk exceeds declared file size')
+    with open(data_path, 'ab') as data:
+        data.write(chunk)
+    return received + len(chunk)
+
+
+def hash_upload(upload_id: str, expected_sha256: Optional[str] = None) -> Dict[str, Any]:
+    '''Проверяет, что загрузка завершена, и потоково хэширует её'''
+    meta = upload_meta(upload_id)
+    data_path, _ = _upload_paths(upload_id)
+    if os.path.getsize(data_path) != meta['size']:
+        raise StoreError('Upload is incomplete')
+
+    digest = hashlib.sha256()
+    with open(data_path, 'rb') as data:
+        for block in iter(lambda: data.read(HASH_BLOCK_BYTES), b''):
+            digest.update(block)
+    sha256 = digest.hexdigest()
+    if expected_sha256 and expected_sha256.lower() != sha256:
+        raise StoreError('Checksum mismatch')
+    return {**meta, 'sha256': sha256}
+
+
+def commit_upload(upload_id: str, sha256: str) -> bool:
+    '''
+    Переносит загрузку в blobs; дубликат просто удаляется. Возвращает True для
+    дубликата. Вызывается под блокировкой содержимого (см. index.lock_blob),
+    чтобы не разойтись с удалением последней ссылки на тот же sha256.
+    '''
+    data_path, meta_path = _upload_paths(upload_id)
+    target = blob_path(sha256)
+    deduplicated = os.path.exists(target)
+    if deduplicated:
+        os.remove(data_path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(data_path, target)
+    os.remove(meta_path)
+    return deduplicated
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    '''Диапазон Range: bytes=a-b как (start, end) включительно; None - весь файл'''
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        raise StoreError('Invalid Range header')
+    first, last = match.groups()
+    if first == '':
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise StoreError('Range not satisfiable')
+    return start, end
+
+
+def read_range(sha256: str, start: int, end: int) -> bytes:
+    '''Читает байты [start, end] через mmap'''
+    path = blob_path(sha256)
+    if end < start:
+        return b''
+    with open(path, 'rb') as blob:
+        with mmap.mmap(blob.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return mapped[start:end + 1]
+
+
+def remove_blob(sha256: str) -> None:
+    try:
+        os.remove(blob_path(sha256))
+    except FileNotFoundError:
+        pass
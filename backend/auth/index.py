@@ -5,15 +5,25 @@
 
 import json
 import os
-import hashlib
 from typing import Dict, Any
-import psycopg2
+import db
 from psycopg2.extras import RealDictCursor
+from session_tokens import issue_token
+from passwords import verify_password, needs_rehash, hash_password, PasswordHasherBusy, DUMMY_HASH
+from throttle import throttle, shared_enabled, shared_lockout, shared_record_failure, shared_record_success
 
 
-def hash_password(password: str) -> str:
-    """Хэширование пароля SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+def too_many_attempts(retry_after: int) -> Dict[str, Any]:
+    return {
+        'statusCode': 429,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Retry-After': str(retry_after)
+        },
+        'body': json.dumps({'error': 'Слишком много попыток входа, повторите позже', 'retry_after': retry_after}),
+        'isBase64Encoded': False
+    }
 
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -65,27 +75,60 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        password_hash = hash_password(password)
+        source_ip = ((event.get('requestContext') or {}).get('identity') or {}).get('sourceIp')
+        retry_after = throttle.check(login, source_ip)
+        if retry_after:
+            return too_many_attempts(retry_after)
         
-        login_escaped = login.replace("'", "''")
-        password_hash_escaped = password_hash.replace("'", "''")
-        
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = db.connect(os.environ['DATABASE_URL'])
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        query = f"""
+        if shared_enabled():
+            retry_after = shared_lockout(conn, login)
+            if retry_after:
+                throttle.lock_until(login, retry_after)
+                cur.close()
+                conn.close()
+                return too_many_attempts(retry_after)
+        
+        cur.execute("""
             SELECT id, full_name, email, login, role_id, user_group_id, 
-                   camera_group_id, company, position
+                   camera_group_id, company, position, password_hash
             FROM t_p76735805_video_surveillance_s.system_users 
-            WHERE login = '{login_escaped}' AND password_hash = '{password_hash_escaped}'
-        """
-        
-        cur.execute(query)
+            WHERE login = %s
+        """, (login,))
         user = cur.fetchone()
         
+        try:
+            # Для несуществующего логина тоже считаем scrypt, чтобы время ответа не выдавало его
+            password_ok = verify_password(password, user['password_hash'] if user else DUMMY_HASH)
+            new_hash = hash_password(password) if user and password_ok and needs_rehash(user['password_hash']) else None
+        except PasswordHasherBusy:
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 503,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*',
+                    'Retry-After': '1'
+                },
+                'body': json.dumps({'error': 'Сервис авторизации перегружен, повторите попытку'}),
+                'isBase64Encoded': False
+            }
+        
+        if user and not password_ok:
+            user = None
+        
         if not user:
+            lockout = throttle.record_failure(login)
+            if shared_enabled():
+                shared_record_failure(conn, login)
+                conn.commit()
             cur.close()
             conn.close()
+            if lockout:
+                return too_many_attempts(lockout)
             return {
                 'statusCode': 401,
                 'headers': {
@@ -96,27 +139,41 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        update_query = f"""
+        # Устаревший или ослабленный хэш заменяется текущим форматом при успешном входе
+        cur.execute("""
             UPDATE t_p76735805_video_surveillance_s.system_users 
-            SET last_login = NOW(), is_online = true 
-            WHERE id = {user['id']}
-        """
-        cur.execute(update_query)
+            SET last_login = NOW(), is_online = true, last_seen_at = NOW(),
+                password_hash = COALESCE(%s, password_hash)
+            WHERE id = %s
+        """, (new_hash, user['id']))
+        throttle.record_success(login)
+        if shared_enabled():
+            shared_record_success(conn, login)
         conn.commit()
         
         cur.close()
         conn.close()
         
+        user = dict(user)
+        del user['password_hash']
+        
+        response = {
+            'success': True,
+            'user': user
+        }
+        
+        signed = issue_token(user['id'], user['role_id'])
+        if signed:
+            response['token'] = signed['token']
+            response['token_expires_at'] = signed['expires_at']
+        
         return {
             'statusCode': 200,
             'headers': {
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
             },
-            'body': json.dumps({
-                'success': True,
-                'user': dict(user)
-            }),
+            'body': json.dumps(response),
             'isBase64Encoded': False
         }
         
@@ -0,0 +1,147 @@
+'''
+Ограничение частоты попыток входа.
+Token bucket на логин и на IP хранится в памяти процесса и проверяется до
+обращения к БД. Подряд идущие неудачи по логину включают блокировку с
+экспоненциально растущим сроком. При LOGIN_THROTTLE_SHARED=1 блокировки
+дополнительно пишутся в login_lockouts, чтобы их видели все экземпляры функции.
+'''
+
+import os
+import time
+from typing import Dict, Optional, Tuple
+from psycopg2.extras import RealDictCursor
+
+SCHEMA = 't_p76735805_video_surveillance_s'
+
+# (ёмкость, пополнение в секунду)
+LOGIN_BUCKET = (10.0, 0.1)
+IP_BUCKET = (30.0, 0.5)
+
+LOCKOUT_THRESHOLD = 5
+LOCKOUT_BASE_SECONDS = 30
+LOCKOUT_MAX_SECONDS = 900
+FAILURES_RESET_SECONDS = 3600
+
+MAX_KEYS = 50000
+
+
+def lockout_seconds(failures: int) -> int:
+    '''30 c после 5-й неудачи, далее удваивается до 15 минут'''
+    if failures < LOCKOUT_THRESHOLD:
+        return 0
+    return min(LOCKOUT_BASE_SECONDS * 2 ** (failures - LOCKOUT_THRESHOLD), LOCKOUT_MAX_SECONDS)
+
+
+def shared_enabled() -> bool:
+    return os.environ.get('LOGIN_THROTTLE_SHARED') == '1'
+
+
+class LoginThrottle:
+    def __init__(self) -> None:
+        # ключ -> (токены, time.monotonic() последнего пополнения)
+        self.buckets: Dict[str, Tuple[float, float]] = {}
+        # логин -> (неудач подряд, блокировка до (monotonic), время последней неудачи)
+        self.failures: Dict[str, Tuple[int, float, float]] = {}
+
+    def _take(self, key: str, capacity: float, rate: float, now: float) -> float:
+        '''Забирает токен; возвращает 0 или число секунд до появления токена'''
+        tokens, updated = self.buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        if tokens < 1:
+            self.buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+        self.buckets[key] = (tokens - 1, now)
+        return 0.0
+
+    def check(self, login: str, ip: Optional[str]) -> int:
+        '''Возвращает 0, если попытку можно выполнить, иначе Retry-After в секундах'''
+        now = time.monotonic()
+        self._prune(now)
+        login_key = login.lower()
+
+        failures = self.failures.get(login_key)
+        if failures and failures[1] > now:
+            return int(failures[1] - now) + 1
+
+        wait = self._take(f'login:{login_key}', *LOGIN_BUCKET, now)
+        if ip and not wait:
+            wait = self._take(f'ip:{ip}', *IP_BUCKET, now)
+        return int(wait) + 1 if wait else 0
+
+    def lock_until(self, login: str, seconds: float) -> None:
+        '''Применяет блокировку, полученную от другого экземпляра через БД'''
+        login_key = login.lower()
+        count, _, last = self.failures.get(login_key, (LOCKOUT_THRESHOLD, 0.0, time.monotonic()))
+        self.failures[login_key] = (count, time.monotonic() + seconds, last)
+
+    def record_failure(self, login: str) -> int:
+        '''Учитывает неудачный вход; возвращает срок блокировки в секундах (0 - без блокировки)'''
+        now = time.monotonic()
+        login_key = login.lower()
+        count, _, last = self.failures.get(login_key, (0, 0.0, now))
+        if now - last > FAILURES_RESET_SECONDS:
+            count = 0
+        count += 1
+        seconds = lockout_seconds(count)
+        self.failures[login_key] = (count, now + seconds, now)
+        return seconds
+
+    def record_success(self, login: str) -> None:
+        self.failures.pop(login.lower(), None)
+
+    def _prune(self, now: float) -> None:
+        if len(self.buckets) + len(self.failures) < MAX_KEYS:
+            return
+        self.buckets = {
+            key: (tokens, updated) for key, (tokens, updated) in self.buckets.items()
+            if now - updated < 600
+        }
+        self.failures = {
+            key: value for key, value in self.failures.items()
+            if value[1] > now or now - value[2] < FAILURES_RESET_SECONDS
+        }
+
+
+def shared_lockout(conn, login: str) -> int:
+    '''Оставшиеся секунды общей блокировки логина'''
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur.execute(f'''
+        SELECT CEIL(EXTRACT(EPOCH FROM (locked_until - NOW())))::int AS seconds
+        FROM {SCHEMA}.login_lockouts
+        WHERE login = %s AND locked_until > NOW()
+    ''', (login.lower(),))
+    row = cur.fetchone()
+    cur.close()
+    return row['seconds'] if row else 0
+
+
+def shared_record_failure(conn, login: str) -> None:
+    '''Атомарно увеличивает счётчик неудач и выставляет блокировку по той же формуле'''
+    cur = conn.cursor()
+    cur.execute(f'''
+        INSERT INTO {SCHEMA}.login_lockouts AS l (login, failures, locked_until, updated_at)
+        VALUES (%(login)s, 1, NULL, NOW())
+        ON CONFLICT (login) DO UPDATE
+        SET failures = CASE
+                WHEN l.updated_at < NOW() - %(reset)s * INTERVAL '1 second' THEN 1
+                ELSE l.failures + 1
+            END,
+            locked_until = CASE
+                WHEN l.updated_at >= NOW() - %(reset)s * INTERVAL '1 second'
+                     AND l.failures + 1 >= %(threshold)s
+                THEN NOW() + LEAST(%(base)s * power(2, l.failures + 1 - %(threshold)s), %(max)s) * INTERVAL '1 second'
+                ELSE l.locked_until
+            END,
+            updated_at = NOW()
+    ''', {'login': login.lower(), 'reset': FAILURES_RESET_SECONDS, 'threshold': LOCKOUT_THRESHOLD,
+          'base': LOCKOUT_BASE_SECONDS, 'max': LOCKOUT_MAX_SECONDS})
+    cur.close()
+
+
+def shared_record_success(conn, login: str) -> None:
+    cur = conn.cursor()
+    cur.execute(f'DELETE FROM {SCHEMA}.login_lockouts WHERE login = %s', (login.lower(),))
+    cur.close()
+
+
+throttle = LoginThrottle()
@@ -3,13 +3,28 @@ Business: CRUD операции для управления группами к
 Args: event - dict с httpMethod, body, queryStringParameters
       context - объект с атрибутами request_id, function_name
 Returns: HTTP response dict с данными групп камер
+
+GET ?camera_id=N - группы, содержащие камеру (GIN-индекс по camera_ids)
+POST action=add_cameras|remove_cameras - точечное изменение состава группы
+POST action=resolve_membership - группы для списка камер одним запросом
+POST/PUT с полем rule - динамическая группа, состав вычисляется по правилу
 '''
 
 import json
 import os
-from typing import Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from typing import Dict, Any, List
+import db
+from psycopg2.extras import RealDictCursor, Json
+from group_rules import normalize_rule, materialize_group
+
+def parse_camera_ids(values: Any) -> List[int]:
+    '''Список id камер из тела запроса; ValueError при неверном формате'''
+    if not isinstance(values, list):
+        raise ValueError('camera_ids must be a list of integers')
+    try:
+        return [int(cid) for cid in values]
+    except (ValueError, TypeError):
+        raise ValueError('camera_ids must be a list of integers')
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -36,16 +51,35 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(dsn)
+    conn = db.connect(dsn)
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
         if method == 'GET':
-            cursor.execute('''
-                SELECT id, name, description, camera_ids, created_at, updated_at
-                FROM t_p76735805_video_surveillance_s.camera_groups
-                ORDER BY created_at DESC
-            ''')
+            params = event.get('queryStringParameters') or {}
+            camera_id = params.get('camera_id')
+            
+            if camera_id and not camera_id.isdigit():
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'camera_id must be an integer'}),
+                    'isBase64Encoded': False
+                }
+            
+            if camera_id:
+                cursor.execute('''
+                    SELECT id, name, description, camera_ids, rule, created_at, updated_at
+                    FROM t_p76735805_video_surveillance_s.camera_groups
+                    WHERE camera_ids @> ARRAY[%s]::integer[]
+                    ORDER BY created_at DESC
+                ''', (int(camera_id),))
+            else:
+                cursor.execute('''
+                    SELECT id, name, description, camera_ids, rule, created_at, updated_at
+                    FROM t_p76735805_video_surveillance_s.camera_groups
+                    ORDER BY created_at DESC
+                ''')
             groups = cursor.fetchall()
             
             result = []
@@ -55,6 +89,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'name': group['name'],
                     'description': group['description'],
                     'camera_ids': group['camera_ids'] if group['camera_ids'] else [],
+                    'rule': group['rule'],
                     'created_at': group['created_at'].isoformat() if group['created_at'] else None,
                     'updated_at': group['updated_at'].isoformat() if group['updated_at'] else None
                 })
@@ -68,19 +103,134 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         elif method == 'POST':
             body_data = json.loads(event.get('body', '{}'))
+            action = body_data.get('action')
+            
+            if action in ('resolve_membership', 'add_cameras', 'remove_cameras'):
+                try:
+                    camera_ids = parse_camera_ids(body_data.get('camera_ids', []))
+                    group_id = int(body_data['id']) if body_data.get('id') is not None else None
+                except (ValueError, TypeError) as e:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': str(e)}),
+                        'isBase64Encoded': False
+                    }
+            
+            if action == 'resolve_membership':
+                membership = {str(cid): [] for cid in camera_ids}
+                
+                if camera_ids:
+                    cursor.execute('''
+                        SELECT m.camera_id, g.id AS group_id
+                        FROM t_p76735805_video_surveillance_s.camera_groups g
+                        CROSS JOIN LATERAL unnest(g.camera_ids) AS m(camera_id)
+                        WHERE g.camera_ids && %s::integer[]
+                          AND m.camera_id = ANY(%s::integer[])
+                        ORDER BY m.camera_id, g.id
+                    ''', (camera_ids, camera_ids))
+                    
+                    for row in cursor.fetchall():
+                        membership[str(row['camera_id'])].append(row['group_id'])
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps(membership),
+                    'isBase64Encoded': False
+                }
+            
+            if action in ('add_cameras', 'remove_cameras'):
+                if not group_id or not camera_ids:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Group ID and camera_ids required'}),
+                        'isBase64Encoded': False
+                    }
+                
+                if action == 'add_cameras' and len(camera_ids) == 1:
+                    cursor.execute('''
+                        UPDATE t_p76735805_video_surveillance_s.camera_groups
+                        SET camera_ids = array_append(camera_ids, %s),
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE id = %s AND rule IS NULL AND NOT camera_ids @> ARRAY[%s]::integer[]
+                    ''', (camera_ids[0], group_id, camera_ids[0]))
+                elif action == 'add_cameras':
+                    cursor.execute('''
+                        UPDATE t_p76735805_video_surveillance_s.camera_groups
+                        SET camera_ids = camera_ids || ARRAY(
+                                SELECT DISTINCT c FROM unnest(%s::integer[]) AS c
+                                WHERE c <> ALL(camera_ids)
+                            ),
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE id = %s AND rule IS NULL AND NOT camera_ids @> %s::integer[]
+                    ''', (camera_ids, group_id, camera_ids))
+                elif len(camera_ids) == 1:
+                    cursor.execute('''
+                        UPDATE t_p76735805_video_surveillance_s.camera_groups
+                        SET camera_ids = array_remove(camera_ids, %s),
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE id = %s AND rule IS NULL AND camera_ids @> ARRAY[%s]::integer[]
+                    ''', (camera_ids[0], group_id, camera_ids[0]))
+                else:
+                    cursor.execute('''
+                        UPDATE t_p76735805_video_surveillance_s.camera_groups
+                        SET camera_ids = ARRAY(
+                                SELECT c FROM unnest(camera_ids) AS c
+                                WHERE c <> ALL(%s::integer[])
+                            ),
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE id = %s AND rule IS NULL AND camera_ids && %s::integer[]
+                    ''', (camera_ids, group_id, camera_ids))
+                
+                changed = cursor.rowcount
+                if not changed:
+                    cursor.execute(
+                        'SELECT 1 FROM t_p76735805_video_surveillance_s.camera_groups WHERE id = %s',
+                        (group_id,)
+                    )
+                    if not cursor.fetchone():
+                        return {
+                            'statusCode': 404,
+                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                            'body': json.dumps({'error': 'Camera group not found'}),
+                            'isBase64Encoded': False
+                        }
+                conn.commit()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'changed': changed > 0, 'message': 'Camera group members updated'}),
+                    'isBase64Encoded': False
+                }
+            
+            try:
+                rule = normalize_rule(body_data['rule']) if body_data.get('rule') is not None else None
+            except (ValueError, TypeError) as e:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': str(e)}),
+                    'isBase64Encoded': False
+                }
             
             cursor.execute('''
                 INSERT INTO t_p76735805_video_surveillance_s.camera_groups
-                (name, description, camera_ids)
-                VALUES (%s, %s, %s)
+                (name, description, camera_ids, rule)
+                VALUES (%s, %s, %s, %s)
                 RETURNING id
             ''', (
                 body_data.get('name'),
                 body_data.get('description'),
-                body_data.get('camera_ids', [])
+                [] if rule is not None else body_data.get('camera_ids', []),
+                Json(rule) if rule is not None else None
             ))
             
             group_id = cursor.fetchone()['id']
+            if rule is not None:
+                materialize_group(conn, group_id, rule)
             conn.commit()
             
             return {
@@ -102,17 +252,41 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            cursor.execute('''
-                UPDATE t_p76735805_video_surveillance_s.camera_groups
-                SET name = %s, description = %s, camera_ids = %s,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE id = %s
-            ''', (
-                body_data.get('name'),
-                body_data.get('description'),
-                body_data.get('camera_ids', []),
-                group_id
-            ))
+            try:
+                rule = normalize_rule(body_data['rule']) if body_data.get('rule') is not None else None
+            except (ValueError, TypeError) as e:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': str(e)}),
+                    'isBase64Encoded': False
+                }
+            
+            if rule is not None:
+                cursor.execute('''
+                    UPDATE t_p76735805_video_surveillance_s.camera_groups
+                    SET name = %s, description = %s, rule = %s,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                ''', (
+                    body_data.get('name'),
+                    body_data.get('description'),
+                    Json(rule),
+                    group_id
+                ))
+                materialize_group(conn, group_id, rule)
+            else:
+                cursor.execute('''
+                    UPDATE t_p76735805_video_surveillance_s.camera_groups
+                    SET name = %s, description = %s, camera_ids = %s, rule = NULL,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                ''', (
+                    body_data.get('name'),
+                    body_data.get('description'),
+                    body_data.get('camera_ids', []),
+                    group_id
+                ))
             
             conn.commit()
             
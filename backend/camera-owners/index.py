@@ -2,7 +2,7 @@ import json
 import os
 from typing import Dict, Any, List, Optional
 from pydantic import BaseModel, Field
-import psycopg2
+import db
 from psycopg2.extras import RealDictCursor
 
 class OwnerCreate(BaseModel):
@@ -37,7 +37,7 @@ class OwnerDelete(BaseModel):
 
 def get_db_connection():
     dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    return db.connect(dsn, cursor_factory=RealDictCursor)
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
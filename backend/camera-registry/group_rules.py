@@ -0,0 +1,220 @@
+'''
+Правила динамических групп камер и их инкрементальная материализация.
+
+Правило - JSONB в camera_groups.rule, например:
+    {"owners": ["ГИБДД"], "divisions": ["Ленинский район"], "model_ids": [1],
+     "tag_ids": [7], "bbox": {"min_lat": 57.9, "min_lng": 56.1, "max_lat": 58.1, "max_lng": 56.4}}
+Все условия объединяются через AND, tag_ids требует наличия всех тегов.
+Состав группы хранится в camera_ids и пересчитывается только для правил,
+которые могут зависеть от изменившихся полей камеры.
+'''
+
+from typing import Dict, Any, List, Optional, Set, Tuple
+from psycopg2.extras import RealDictCursor
+
+SCHEMA = 't_p76735805_video_surveillance_s'
+
+RULE_FIELDS: Dict[str, Set[str]] = {
+    'owners': {'owner'},
+    'divisions': {'territorial_division'},
+    'model_ids': {'model_id'},
+    'tag_ids': {'tags'},
+    'bbox': {'latitude', 'longitude'},
+}
+
+CAMERA_FIELDS: Set[str] = set().union(*RULE_FIELDS.values())
+
+BBOX_KEYS = ('min_lat', 'min_lng', 'max_lat', 'max_lng')
+
+
+def normalize_rule(rule: Dict[str, Any]) -> Dict[str, Any]:
+    '''Проверяет правило и приводит значения к каноническому виду'''
+    if not isinstance(rule, dict):
+        raise ValueError('rule must be an object')
+
+    unknown = set(rule) - set(RULE_FIELDS)
+    if unknown:
+        raise ValueError(f'Unknown rule keys: {", ".join(sorted(unknown))}')
+
+    for key in ('owners', 'divisions', 'model_ids', 'tag_ids'):
+        # Строка вместо списка иначе разбилась бы на отдельные символы
+        if rule.get(key) and not isinstance(rule[key], list):
+            raise ValueError(f'{key} must be a list')
+
+    result: Dict[str, Any] = {}
+    for key in ('owners', 'divisions'):
+        if rule.get(key):
+            result[key] = sorted({str(v) for v in rule[key]})
+    for key in ('model_ids', 'tag_ids'):
+        if rule.get(key):
+            result[key] = sorted({int(v) for v in rule[key]})
+    if rule.get('bbox'):
+        bbox = rule['bbox']
+        if not isinstance(bbox, dict):
+            raise ValueError('bbox must be an object')
+        if any(k not in bbox for k in BBOX_KEYS):
+            raise ValueError('bbox requires min_lat, min_lng, max_lat, max_lng')
+        result['bbox'] = {k: float(bbox[k]) for k in BBOX_KEYS}
+    return result
+
+
+def compile_rule(rule: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    '''Компилирует правило в SQL-условие над cameras_registry с алиасом cr'''
+    clauses: List[str] = []
+    params: List[Any] = []
+
+    if rule.get('owners'):
+        clauses.append('cr.owner = ANY(%s)')
+        params.append(rule['owners'])
+    if rule.get('divisions'):
+        clauses.append('cr.territorial_division = ANY(%s)')
+        params.append(rule['divisions'])
+    if rule.get('model_ids'):
+        clauses.append('cr.model_id = ANY(%s::integer[])')
+        params.append(rule['model_ids'])
+    if rule.get('bbox'):
+        bbox = rule['bbox']
+        clauses.append('cr.latitude BETWEEN %s AND %s AND cr.longitude BETWEEN %s AND %s')
+        params.extend([bbox['min_lat'], bbox['max_lat'], bbox['min_lng'], bbox['max_lng']])
+    if rule.get('tag_ids'):
+        clauses.append('''cr.id IN (
+            SELECT camera_id FROM camera_tag_assignments
+            WHERE tag_id = ANY(%s::integer[])
+            GROUP BY camera_id
+            HAVING COUNT(DISTINCT tag_id) = %s
+        )''')
+        params.extend([rule['tag_ids'], len(rule['tag_ids'])])
+
+    return (' AND '.join(clauses) or 'TRUE'), params
+
+
+def rule_matches(rule: Dict[str, Any], camera: Dict[str, Any], tag_ids: Set[int]) -> bool:
+    '''Проверяет одну камеру по правилу без обращения к БД'''
+    if rule.get('owners') and camera.get('owner') not in rule['owners']:
+        return False
+    if rule.get('divisions') and camera.get('territorial_division') not in rule['divisions']:
+        return False
+    if rule.get('model_ids') and camera.get('model_id') not in rule['model_ids']:
+        return False
+    if rule.get('bbox'):
+        bbox = rule['bbox']
+        if camera.get('latitude') is None or camera.get('longitude') is None:
+            return False
+        lat, lng = float(camera['latitude']), float(camera['longitude'])
+        if not (bbox['min_lat'] <= lat <= bbox['max_lat'] and bbox['min_lng'] <= lng <= bbox['max_lng']):
+            return False
+    if rule.get('tag_ids') and not set(rule['tag_ids']) <= tag_ids:
+        return False
+    return True
+
+
+def rule_depends_on(rule: Dict[str, Any], changed_fields: Set[str]) -> bool:
+    '''True, если результат правила может зависеть от изменившихся полей'''
+    return any(rule.get(key) and fields & changed_fields for key, fields in RULE_FIELDS.items())
+
+
+def materialize_group(conn, group_id: int, rule: Dict[str, Any]) -> int:
+    '''Полный пересчёт состава одной динамической группы'''
+    where_sql, params = compile_rule(rule)
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur.execute(f'''
+        UPDATE {SCHEMA}.camera_groups
+        SET camera_ids = ARRAY(
+                SELECT cr.id FROM {SCHEMA}.cameras_registry cr
+                WHERE {where_sql}
+                ORDER BY cr.id
+            ),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = %s
+        RETURNING cardinality(camera_ids) AS camera_count
+    ''', params + [group_id])
+    row = cur.fetchone()
+    cur.close()
+    return row['camera_count'] if row else 0
+
+
+def refresh_rules_for_tags(conn, tag_ids: List[int]) -> int:
+    '''Пересчитывает только динамические группы, правила которых ссылаются на теги'''
+    if not tag_ids:
+        return 0
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur.execute(f'''
+        SELECT id, rule FROM {SCHEMA}.camera_groups
+        WHERE rule IS NOT NULL
+          AND rule ? 'tag_ids'
+          AND EXISTS (
+              -- tag_ids хранятся числами JSON, а ?| сравнивает только строки
+              SELECT 1 FROM jsonb_array_elements_text(rule -> 'tag_ids') AS t
+              WHERE t::integer = ANY(%s::integer[])
+          )
+    ''', (list(tag_ids),))
+    groups = cur.fetchall()
+    cur.close()
+    for group in groups:
+        materialize_group(conn, group['id'], group['rule'])
+    return len(groups)
+
+
+def sync_camera(conn, camera_id: int, changed_fields: Optional[Set[str]] = None) -> int:
+    '''
+    Инкрементально обновляет членство одной камеры в динамических группах.
+    changed_fields=None означает создание или удаление камеры.
+    Возвращает количество изменённых групп.
+    '''
+    changed = CAMERA_FIELDS if changed_fields is None else set(changed_fields)
+    if not changed & CAMERA_FIELDS:
+        return 0
+
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur.execute(f'''
+        SELECT id, owner, territorial_division, model_id, latitude, longitude,
+               ARRAY(SELECT tag_id FROM camera_tag_assignments WHERE camera_id = cr.id) AS tag_ids
+        FROM {SCHEMA}.cameras_registry cr
+        WHERE id = %s
+    ''', (camera_id,))
+    camera = cur.fetchone()
+
+    if camera:
+        cur.execute(f'''
+            SELECT id, rule, camera_ids @> ARRAY[%s]::integer[] AS is_member
+            FROM {SCHEMA}.camera_groups
+            WHERE rule IS NOT NULL
+              AND (camera_ids @> ARRAY[%s]::integer[]
+                   OR ((NOT rule ? 'owners' OR rule -> 'owners' ? %s)
+                       AND (NOT rule ? 'divisions' OR rule -> 'divisions' ? %s)
+                       AND (NOT rule ? 'model_ids' OR rule -> 'model_ids' @> to_jsonb(%s::integer))))
+        ''', (camera_id, camera_id, camera['owner'] or '', camera['territorial_division'] or '',
+              camera['model_id']))
+    else:
+        cur.execute(f'''
+            SELECT id, rule, TRUE AS is_member
+            FROM {SCHEMA}.camera_groups
+            WHERE rule IS NOT NULL AND camera_ids @> ARRAY[%s]::integer[]
+        ''', (camera_id,))
+    candidates = cur.fetchall()
+
+    tag_ids = set(camera['tag_ids']) if camera else set()
+    updated = 0
+    for group in candidates:
+        rule = group['rule']
+        if camera and group['is_member'] and not rule_depends_on(rule, changed):
+            continue
+        should_be_member = bool(camera) and rule_matches(rule, camera, tag_ids)
+        if should_be_member == group['is_member']:
+            continue
+        if should_be_member:
+            cur.execute(f'''
+                UPDATE {SCHEMA}.camera_groups
+                SET camera_ids = array_append(camera_ids, %s), updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            ''', (camera_id, group['id']))
+        else:
+            cur.execute(f'''
+                UPDATE {SCHEMA}.camera_groups
+                SET camera_ids = array_remove(camera_ids, %s), updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            ''', (camera_id, group['id']))
+        updated += 1
+
+    cur.close()
+    return updated
@@ -3,13 +3,56 @@ Business: CRUD операции для управления реестром к
 Args: event - dict с httpMethod, body, queryStringParameters
       context - объект с атрибутами request_id, function_name
 Returns: HTTP response dict с данными камер
+
+GET ?tags=Улица AND Высокий AND NOT Парковка - фильтр по битмап-индексу тегов,
+    сочетается с owner, territorial_division и видимостью по X-Auth-Token
 '''
 
 import json
 import os
 from typing import Dict, Any
-import psycopg2
+import db
 from psycopg2.extras import RealDictCursor
+from visibility import get_visible_camera_ids, VisibilityError
+from group_rules import sync_camera
+from tag_index import get_tag_index, TagQueryError
+
+RULE_COLUMNS = ('owner', 'territorial_division', 'model_id', 'latitude', 'longitude')
+
+# Горячие запросы чтения выполняются как подготовленные операторы (db.execute_prepared)
+CAMERAS_LIST_SQL = '''
+    SELECT id, name, rtsp_url, rtsp_login, rtsp_password, model_id,
+           ptz_ip, ptz_port, ptz_login, ptz_password, owner, address,
+           latitude, longitude, territorial_division, archive_depth_days,
+           created_at, updated_at
+    FROM t_p76735805_video_surveillance_s.cameras_registry
+    WHERE (%s::integer[] IS NULL OR id = ANY(%s::integer[]))
+      AND (%s::text IS NULL OR owner = %s::text)
+      AND (%s::text IS NULL OR territorial_division = %s::text)
+    ORDER BY created_at DESC
+'''
+
+def camera_to_dict(cam: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': cam['id'],
+        'name': cam['name'],
+        'rtsp_url': cam['rtsp_url'],
+        'rtsp_login': cam['rtsp_login'],
+        'rtsp_password': cam['rtsp_password'],
+        'model_id': cam['model_id'],
+        'ptz_ip': cam['ptz_ip'],
+        'ptz_port': cam['ptz_port'],
+        'ptz_login': cam['ptz_login'],
+        'ptz_password': cam['ptz_password'],
+        'owner': cam['owner'],
+        'address': cam['address'],
+        'latitude': float(cam['latitude']) if cam['latitude'] else None,
+        'longitude': float(cam['longitude']) if cam['longitude'] else None,
+        'territorial_division': cam['territorial_division'],
+        'archive_depth_days': cam['archive_depth_days'],
+        'created_at': cam['created_at'].isoformat() if cam['created_at'] else None,
+        'updated_at': cam['updated_at'].isoformat() if cam['updated_at'] else None
+    }
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -20,7 +63,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token, X-Min-LSN',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -36,43 +79,51 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(dsn)
+    # Чтение может обслуживаться репликой, запись - только основным сервером.
+    # ?tags тоже идёт на основной: битмап-индекс процесса один, и его догрузка
+    # с разных серверов по xid снимка пропускала бы изменения
+    if method == 'GET' and not (event.get('queryStringParameters') or {}).get('tags'):
+        conn = db.connect_read(dsn, min_lsn=db.min_lsn_from_event(event))
+    else:
+        conn = db.connect(dsn)
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
         if method == 'GET':
-            cursor.execute('''
-                SELECT id, name, rtsp_url, rtsp_login, rtsp_password, model_id,
-                       ptz_ip, ptz_port, ptz_login, ptz_password, owner, address,
-                       latitude, longitude, territorial_division, archive_depth_days,
-                       created_at, updated_at
-                FROM t_p76735805_video_surveillance_s.cameras_registry
-                ORDER BY created_at DESC
-            ''')
+            params = event.get('queryStringParameters') or {}
+            try:
+                camera_ids = get_visible_camera_ids(cursor, event)
+            except VisibilityError as e:
+                return {
+                    'statusCode': e.status,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': str(e)}),
+                    'isBase64Encoded': False
+                }
+            
+            if params.get('tags'):
+                try:
+                    tagged_ids = get_tag_index(conn).query(params['tags'])
+                except TagQueryError as e:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': str(e)}),
+                        'isBase64Encoded': False
+                    }
+                if camera_ids is not None:
+                    visible = set(camera_ids)
+                    tagged_ids = [cid for cid in tagged_ids if cid in visible]
+                camera_ids = tagged_ids
+            
+            db.execute_prepared(cursor, 'cameras_list', CAMERAS_LIST_SQL, (
+                camera_ids, camera_ids,
+                params.get('owner'), params.get('owner'),
+                params.get('territorial_division'), params.get('territorial_division')
+            ))
             cameras = cursor.fetchall()
             
-            result = []
-            for cam in cameras:
-                result.append({
-                    'id': cam['id'],
-                    'name': cam['name'],
-                    'rtsp_url': cam['rtsp_url'],
-                    'rtsp_login': cam['rtsp_login'],
-                    'rtsp_password': cam['rtsp_password'],
-                    'model_id': cam['model_id'],
-                    'ptz_ip': cam['ptz_ip'],
-                    'ptz_port': cam['ptz_port'],
-                    'ptz_login': cam['ptz_login'],
-                    'ptz_password': cam['ptz_password'],
-                    'owner': cam['owner'],
-                    'address': cam['address'],
-                    'latitude': float(cam['latitude']) if cam['latitude'] else None,
-                    'longitude': float(cam['longitude']) if cam['longitude'] else None,
-                    'territorial_division': cam['territorial_division'],
-                    'archive_depth_days': cam['archive_depth_days'],
-                    'created_at': cam['created_at'].isoformat() if cam['created_at'] else None,
-                    'updated_at': cam['updated_at'].isoformat() if cam['updated_at'] else None
-                })
+            result = [camera_to_dict(cam) for cam in cameras]
             
             return {
                 'statusCode': 200,
@@ -110,11 +161,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             ))
             
             camera_id = cursor.fetchone()['id']
+            sync_camera(conn, camera_id)
             conn.commit()
             
             return {
                 'statusCode': 201,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **db.lsn_headers(conn)},
                 'body': json.dumps({'id': camera_id, 'message': 'Camera created'}),
                 'isBase64Encoded': False
             }
@@ -131,6 +183,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
+            cursor.execute('''
+                SELECT owner, territorial_division, model_id, latitude, longitude
+                FROM t_p76735805_video_surveillance_s.cameras_registry
+                WHERE id = %s
+            ''', (camera_id,))
+            before = cursor.fetchone()
+            
             cursor.execute('''
                 UPDATE t_p76735805_video_surveillance_s.cameras_registry
                 SET name = %s, rtsp_url = %s, rtsp_login = %s, rtsp_password = %s,
@@ -139,6 +198,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     longitude = %s, territorial_division = %s, archive_depth_days = %s,
                     updated_at = CURRENT_TIMESTAMP
                 WHERE id = %s
+                RETURNING owner, territorial_division, model_id, latitude, longitude
             ''', (
                 body_data.get('name'),
                 body_data.get('rtsp_url'),
@@ -158,11 +218,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 camera_id
             ))
             
+            after = cursor.fetchone()
+            if before and after:
+                sync_camera(conn, camera_id, {col for col in RULE_COLUMNS if before[col] != after[col]})
             conn.commit()
             
             return {
                 'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **db.lsn_headers(conn)},
                 'body': json.dumps({'message': 'Camera updated'}),
                 'isBase64Encoded': False
             }
@@ -184,11 +247,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 WHERE id = %s
             ''', (camera_id,))
             
+            sync_camera(conn, camera_id)
             conn.commit()
             
             return {
                 'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **db.lsn_headers(conn)},
                 'body': json.dumps({'message': 'Camera deleted'}),
                 'isBase64Encoded': False
             }
@@ -0,0 +1,58 @@
+'''
+Business: Асинхронный вариант API реестра камер на пуле psycopg 3
+Args: event - dict с httpMethod, body, queryStringParameters
+      context - объект с атрибутами request_id, function_name
+Returns: HTTP response dict с данными камер
+
+GET списка камер выполняется в цикле событий и не занимает поток на время
+запроса к БД. Запись и фильтр ?tags (битмап-индекс процесса на psycopg2)
+передаются синхронному index.handler в потоке, по одному вызову за раз
+(adb.run_sync).
+'''
+
+import json
+import os
+from typing import Dict, Any
+import adb
+import index
+from visibility import get_visible_camera_ids_async, VisibilityError
+
+async def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+    params = event.get('queryStringParameters') or {}
+    
+    if method != 'GET' or params.get('tags') or not os.environ.get('DATABASE_URL'):
+        return await adb.run_sync(index.handler, event, context)
+    
+    try:
+        async with adb.connection() as conn:
+            camera_ids = await get_visible_camera_ids_async(conn, event)
+            cur = await conn.execute(index.CAMERAS_LIST_SQL, (
+                camera_ids, camera_ids,
+                params.get('owner'), params.get('owner'),
+                params.get('territorial_division'), params.get('territorial_division')
+            ))
+            cameras = await cur.fetchall()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps([index.camera_to_dict(cam) for cam in cameras]),
+            'isBase64Encoded': False
+        }
+    
+    except VisibilityError as e:
+        return {
+            'statusCode': e.status,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
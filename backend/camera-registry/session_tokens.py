@@ -0,0 +1,189 @@
+'''
+Подписанные HMAC-SHA256 токены сессии: id пользователя, роль и срок действия.
+Проверка подписи выполняется локально, без обращения к БД. Отозванные токены
+хранятся в revoked_tokens и зеркалируются в кэш процесса, который догружается
+не чаще раза в REVOCATION_SYNC_SECONDS. Догрузка идёт по xid транзакции отзыва
+от xmin снимка прошлой синхронизации, поэтому отзыв, зафиксированный позже
+более новых, не теряется.
+'''
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+from psycopg2.extras import RealDictCursor
+
+SCHEMA = 't_p76735805_video_surveillance_s'
+
+TOKEN_TTL_SECONDS = 24 * 3600
+REVOCATION_SYNC_SECONDS = 10.0
+
+SNAPSHOT_XMIN_SQL = 'SELECT pg_snapshot_xmin(pg_current_snapshot())::text AS xmin'
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _secret() -> Optional[bytes]:
+    secret = os.environ.get('SESSION_SECRET')
+    return secret.encode() if secret else None
+
+
+def issue_token(user_id: int, role_id: Optional[int], ttl: int = TOKEN_TTL_SECONDS) -> Optional[Dict[str, Any]]:
+    '''Возвращает {"token", "expires_at", "jti"} или None, если SESSION_SECRET не задан'''
+    secret = _secret()
+    if not secret:
+        return None
+    claims = {'uid': user_id, 'rid': role_id, 'exp': int(time.time()) + ttl, 'jti': secrets.token_hex(16)}
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+    signature = _b64encode(hmac.new(secret, payload.encode(), hashlib.sha256).digest())
+    return {'token': f'{payload}.{signature}', 'expires_at': claims['exp'], 'jti': claims['jti']}
+
+
+def decode_token(token: str) -> Optional[Dict[str, Any]]:
+    '''Проверяет подпись и срок действия; отзыв не проверяет'''
+    secret = _secret()
+    if not secret or not token or token.count('.') != 1:
+        return None
+    payload, signature = token.split('.')
+    expected = _b64encode(hmac.new(secret, payload.encode(), hashlib.sha256).digest())
+    if not hmac.compare_digest(signature, expected):
+        return None
+    try:
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, TypeError):
+        return None
+    if claims.get('exp', 0) < time.time():
+        return None
+    return claims
+
+
+class RevocationCache:
+    def __init__(self) -> None:
+        self.revoked: Dict[str, int] = {}
+        self.synced_at = 0.0
+        # Отзывы транзакций с xid не меньше этого ещё не прочитаны
+        self.min_xid: Optional[str] = None
+        # Кэш общий для асинхронного обработчика и синхронного в потоке
+        self.lock = threading.Lock()
+
+    def _due(self) -> bool:
+        return time.monotonic() - self.synced_at >= REVOCATION_SYNC_SECONDS
+
+    def _query(self) -> Tuple[str, tuple]:
+        if self.min_xid is None:
+            return f'''
+                SELECT jti, EXTRACT(EPOCH FROM expires_at)::bigint AS exp
+                FROM {SCHEMA}.revoked_tokens
+                WHERE expires_at > NOW()
+            ''', ()
+        # Отзывы, уже прочитанные, но из незавершённых тогда транзакций,
+        # читаются повторно; это безвредно
+        return f'''
+            SELECT jti, EXTRACT(EPOCH FROM expires_at)::bigint AS exp
+            FROM {SCHEMA}.revoked_tokens
+            WHERE xid >= %s::xid8
+        ''', (self.min_xid,)
+
+    def _apply(self, min_xid: str, rows) -> None:
+        now = time.time()
+        with self.lock:
+            for row in rows:
+                self.revoked[row['jti']] = row['exp']
+            self.min_xid = min_xid
+            self.revoked = {jti: exp for jti, exp in self.revoked.items() if exp > now}
+            self.synced_at = time.monotonic()
+
+    def add(self, jti: str, exp: int) -> None:
+        with self.lock:
+            self.revoked[jti] = exp
+
+    def sync(self, conn) -> None:
+        if not self._due():
+            return
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        # Граница берётся до чтения: транзакции с меньшим xid уже завершены
+        cur.execute(SNAPSHOT_XMIN_SQL)
+        min_xid = cur.fetchone()['xmin']
+        cur.execute(*self._query())
+        rows = cur.fetchall()
+        cur.close()
+        self._apply(min_xid, rows)
+
+    async def sync_async(self, aconn) -> None:
+        '''То же для асинхронного соединения psycopg 3 со строками-словарями'''
+        if not self._due():
+            return
+        cur = await aconn.execute(SNAPSHOT_XMIN_SQL)
+        min_xid = (await cur.fetchone())['xmin']
+        cur = await aconn.execute(*self._query())
+        self._apply(min_xid, await cur.fetchall())
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self.revoked
+
+
+_revocations = RevocationCache()
+
+
+def verify_token(conn, token: str) -> Optional[Dict[str, Any]]:
+    '''
+    Полная проверка токена: подпись, срок и отзыв.
+    conn используется только для периодической синхронизации кэша отзывов.
+    '''
+    claims = decode_token(token)
+    if not claims:
+        return None
+    if conn is not None:
+        _revocations.sync(conn)
+    if _revocations.is_revoked(claims['jti']):
+        return None
+    return claims
+
+
+async def verify_token_async(aconn, token: str) -> Optional[Dict[str, Any]]:
+    '''verify_token для асинхронных обработчиков'''
+    claims = decode_token(token)
+    if not claims:
+        return None
+    await _revocations.sync_async(aconn)
+    if _revocations.is_revoked(claims['jti']):
+        return None
+    return claims
+
+
+def revoke_jti(conn, jti: str, user_id: Optional[int], exp: int) -> None:
+    '''Отзывает токен по jti до момента exp (unix-время)'''
+    cur = conn.cursor()
+    cur.execute(f'''
+        INSERT INTO {SCHEMA}.revoked_tokens (jti, user_id, expires_at)
+        VALUES (%s, %s, to_timestamp(%s))
+        ON CONFLICT (jti) DO NOTHING
+    ''', (jti, user_id, exp))
+    cur.execute(f'DELETE FROM {SCHEMA}.revoked_tokens WHERE expires_at < NOW()')
+    cur.close()
+    _revocations.add(jti, exp)
+
+
+def revoke_token(conn, token: str) -> bool:
+    '''Отзывает токен до истечения его срока; возвращает False для неподписанного токена'''
+    claims = decode_token(token)
+    if not claims:
+        return False
+    revoke_jti(conn, claims['jti'], claims['uid'], claims['exp'])
+    return True
+
+
+def token_from_event(event: Dict[str, Any]) -> Optional[str]:
+    headers = event.get('headers') or {}
+    return headers.get('X-Auth-Token') or headers.get('x-auth-token')
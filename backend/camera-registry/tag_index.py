@@ -0,0 +1,232 @@
+'''
+Битмап-индекс тегов камер для булевых запросов вида
+    Улица AND Высокий AND NOT Парковка
+Каждой камере присваивается плотный порядковый номер, каждому тегу - битмап
+(Python int) по этим номерам. Индекс живёт в памяти процесса между тёплыми
+вызовами и догружает изменения из camera_tag_assignment_log.
+
+Граница догрузки - xmin снимка (pg_snapshot_xmin), взятого перед чтением:
+транзакции с меньшим xid к этому моменту завершены и видны, поэтому следующая
+догрузка перечитывает записи начиная с этого xid. Так запись транзакции,
+зафиксированной сколь угодно позже выделения её id, не теряется.
+'''
+
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+from psycopg2.extras import RealDictCursor
+
+SCHEMA = 't_p76735805_video_surveillance_s'
+
+DELTA_BATCH = 10000
+FULL_RELOAD_SECONDS = 12 * 3600
+
+SNAPSHOT_XMIN_SQL = 'SELECT pg_snapshot_xmin(pg_current_snapshot())::text AS xmin'
+
+TOKEN_RE = re.compile(r'\s*(?:(\()|(\))|"([^"]+)"|([^\s()"]+))')
+
+
+class TagQueryError(ValueError):
+    pass
+
+
+class TagBitmapIndex:
+    def __init__(self) -> None:
+        self.ordinals: Dict[int, int] = {}
+        self.camera_ids: List[int] = []
+        self.bitmaps: Dict[int, int] = {}
+        self.tag_ids_by_name: Dict[str, int] = {}
+        self.max_camera_id = 0
+        # Записи журнала транзакций с xid не меньше этого ещё не применены
+        self.min_xid = '0'
+        self.loaded_at = 0.0
+
+    def _ordinal(self, camera_id: int) -> int:
+        ordinal = self.ordinals.get(camera_id)
+        if ordinal is None:
+            ordinal = len(self.camera_ids)
+            self.ordinals[camera_id] = ordinal
+            self.camera_ids.append(camera_id)
+            self.max_camera_id = max(self.max_camera_id, camera_id)
+        return ordinal
+
+    def assign(self, camera_id: int, tag_id: int) -> None:
+        self.bitmaps[tag_id] = self.bitmaps.get(tag_id, 0) | (1 << self._ordinal(camera_id))
+
+    def unassign(self, camera_id: int, tag_id: int) -> None:
+        ordinal = self.ordinals.get(camera_id)
+        if ordinal is not None and tag_id in self.bitmaps:
+            self.bitmaps[tag_id] &= ~(1 << ordinal)
+
+    def load(self, conn) -> None:
+        '''Полная загрузка индекса из camera_tag_assignments'''
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(SNAPSHOT_XMIN_SQL)
+        min_xid = cur.fetchone()['xmin']
+
+        self.ordinals, self.camera_ids, self.bitmaps = {}, [], {}
+        self.max_camera_id = 0
+        cur.execute(f'SELECT id FROM {SCHEMA}.cameras_registry ORDER BY id')
+        for row in cur.fetchall():
+            self._ordinal(row['id'])
+
+        cur.execute(f'SELECT camera_id, tag_id FROM {SCHEMA}.camera_tag_assignments ORDER BY camera_id')
+        for row in cur.fetchall():
+            self.assign(row['camera_id'], row['tag_id'])
+
+        self._load_tag_names(cur)
+        cur.close()
+        self.min_xid = min_xid
+        self.loaded_at = time.monotonic()
+
+    def _load_tag_names(self, cur) -> None:
+        cur.execute(f'SELECT id, name FROM {SCHEMA}.camera_tags')
+        self.tag_ids_by_name = {row['name'].lower(): row['id'] for row in cur.fetchall()}
+
+    def refresh(self, conn) -> None:
+        '''Догружает новые камеры и изменения назначений тегов с момента прошлой загрузки'''
+        if not self.loaded_at or time.monotonic() - self.loaded_at > FULL_RELOAD_SECONDS:
+            self.load(conn)
+            return
+
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(SNAPSHOT_XMIN_SQL)
+        min_xid = cur.fetchone()['xmin']
+        # Уже применённые записи незавершённых тогда транзакций читаются
+        # повторно; применение в порядке id идемпотентно
+        cur.execute(f'''
+            SELECT id, camera_id, tag_id, assigned
+            FROM {SCHEMA}.camera_tag_assignment_log
+            WHERE xid >= %s::xid8
+            ORDER BY id
+            LIMIT %s
+        ''', (self.min_xid, DELTA_BATCH))
+        deltas = cur.fetchall()
+
+        if len(deltas) == DELTA_BATCH:
+            cur.close()
+            self.load(conn)
+            return
+
+        cur.execute(f'SELECT id FROM {SCHEMA}.cameras_registry WHERE id > %s ORDER BY id', (self.max_camera_id,))
+        for row in cur.fetchall():
+            self._ordinal(row['id'])
+
+        for delta in deltas:
+            if delta['assigned']:
+                self.assign(delta['camera_id'], delta['tag_id'])
+            else:
+                self.unassign(delta['camera_id'], delta['tag_id'])
+
+        self.min_xid = min_xid
+        self._load_tag_names(cur)
+        cur.close()
+
+    def universe(self) -> int:
+        return (1 << len(self.camera_ids)) - 1
+
+    def bitmap_for(self, term: str) -> int:
+        if term.isdigit():
+            return self.bitmaps.get(int(term), 0)
+        tag_id = self.tag_ids_by_name.get(term.lower())
+        if tag_id is None:
+            raise TagQueryError(f'Unknown tag: {term}')
+        return self.bitmaps.get(tag_id, 0)
+
+    def query(self, expression: str) -> List[int]:
+        '''Вычисляет булево выражение над тегами и возвращает ID камер по возрастанию'''
+        bitmap = _Parser(self, _tokenize(expression)).parse()
+        result: List[int] = []
+        while bitmap:
+            lowest = bitmap & -bitmap
+            result.append(self.camera_ids[lowest.bit_length() - 1])
+            bitmap ^= lowest
+        result.sort()
+        return result
+
+
+def _tokenize(expression: str) -> List[Tuple[str, str]]:
+    tokens: List[Tuple[str, str]] = []
+    pos = 0
+    expression = expression.strip()
+    while pos < len(expression):
+        match = TOKEN_RE.match(expression, pos)
+        if not match:
+            raise TagQueryError(f'Invalid tag query near: {expression[pos:]}')
+        lparen, rparen, quoted, word = match.groups()
+        if lparen:
+            tokens.append(('(', lparen))
+        elif rparen:
+            tokens.append((')', rparen))
+        elif quoted:
+            tokens.append(('TAG', quoted))
+        elif word.upper() in ('AND', 'OR', 'NOT'):
+            tokens.append((word.upper(), word))
+        else:
+            tokens.append(('TAG', word))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    '''Рекурсивный спуск: NOT связывает сильнее AND, AND сильнее OR'''
+
+    def __init__(self, index: TagBitmapIndex, tokens: List[Tuple[str, str]]) -> None:
+        self.index = index
+        self.tokens = tokens
+        self.pos = 0
+
+    def parse(self) -> int:
+        if not self.tokens:
+            raise TagQueryError('Empty tag query')
+        value = self._or()
+        if self.pos != len(self.tokens):
+            raise TagQueryError(f'Unexpected token: {self.tokens[self.pos][1]}')
+        return value
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def _or(self) -> int:
+        value = self._and()
+        while self._peek() == 'OR':
+            self.pos += 1
+            value |= self._and()
+        return value
+
+    def _and(self) -> int:
+        value = self._not()
+        while self._peek() == 'AND':
+            self.pos += 1
+            value &= self._not()
+        return value
+
+    def _not(self) -> int:
+        if self._peek() == 'NOT':
+            self.pos += 1
+            return self.index.universe() & ~self._not()
+        return self._atom()
+
+    def _atom(self) -> int:
+        kind = self._peek()
+        if kind == '(':
+            self.pos += 1
+            value = self._or()
+            if self._peek() != ')':
+                raise TagQueryError('Missing closing parenthesis')
+            self.pos += 1
+            return value
+        if kind == 'TAG':
+            term = self.tokens[self.pos][1]
+            self.pos += 1
+            return self.index.bitmap_for(term)
+        raise TagQueryError('Tag name expected')
+
+
+_index = TagBitmapIndex()
+
+
+def get_tag_index(conn) -> TagBitmapIndex:
+    '''Индекс уровня модуля, переживающий тёплые вызовы функции'''
+    _index.refresh(conn)
+    return _index
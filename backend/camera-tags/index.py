@@ -1,14 +1,128 @@
 import json
 import os
+from typing import Any, List
+
+import db
 import psycopg2
+from group_rules import SCHEMA, normalize_rule, compile_rule, refresh_rules_for_tags, sync_camera
 
 
 def get_conn():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+    return db.connect(os.environ['DATABASE_URL'])
+
+
+def parse_ids(values: Any, field: str) -> List[int]:
+    """Список целых id из тела запроса; ValueError при неверном формате"""
+    if not isinstance(values, list):
+        raise ValueError(f'{field} must be a list of integers')
+    try:
+        return [int(v) for v in values]
+    except (ValueError, TypeError):
+        raise ValueError(f'{field} must be a list of integers')
+
+
+def parse_id(value: Any, field: str) -> int:
+    """Целый id из тела запроса; ValueError, если он не задан или не число"""
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        raise ValueError(f'{field} must be an integer')
+
+
+def handle_assignments(body: dict, cors: dict) -> dict:
+    """Массовое назначение тегов камерам одним SQL-запросом"""
+    action = body['action']
+    try:
+        if action == 'set_camera_tags':
+            if not body.get('camera_id'):
+                return {'statusCode': 400, 'headers': cors, 'body': json.dumps({'error': 'camera_id required'})}
+            camera_id = parse_id(body['camera_id'], 'camera_id')
+            tag_ids = sorted(set(parse_ids(body.get('tag_ids', []), 'tag_ids')))
+        elif action in ('assign', 'unassign', 'assign_by_filter'):
+            if not body.get('tag_id'):
+                return {'statusCode': 400, 'headers': cors, 'body': json.dumps({'error': 'tag_id required'})}
+            tag_id = parse_id(body['tag_id'], 'tag_id')
+            if action == 'assign_by_filter':
+                rule = normalize_rule(body.get('filter') or {})
+                # Пустое правило превратилось бы в TRUE и назначило тег всем камерам
+                if not rule:
+                    return {'statusCode': 400, 'headers': cors, 'body': json.dumps({'error': 'filter required'})}
+                where_sql, params = compile_rule(rule)
+            else:
+                camera_ids = parse_ids(body.get('camera_ids', []), 'camera_ids')
+        else:
+            return {'statusCode': 400, 'headers': cors, 'body': json.dumps({'error': f'Unknown action: {action}'})}
+    except (ValueError, TypeError) as e:
+        return {'statusCode': 400, 'headers': cors, 'body': json.dumps({'error': str(e)})}
+
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        if action == 'set_camera_tags':
+            cur.execute(
+                '''
+                WITH removed AS (
+                    DELETE FROM camera_tag_assignments
+                    WHERE camera_id = %s AND tag_id <> ALL(%s::integer[])
+                    RETURNING tag_id
+                ), added AS (
+                    INSERT INTO camera_tag_assignments (camera_id, tag_id)
+                    SELECT %s, t FROM unnest(%s::integer[]) AS t
+                    ON CONFLICT (camera_id, tag_id) DO NOTHING
+                    RETURNING tag_id
+                )
+                SELECT (SELECT COUNT(*) FROM removed), (SELECT COUNT(*) FROM added)
+                ''',
+                (camera_id, tag_ids, camera_id, tag_ids),
+            )
+            removed, added = cur.fetchone()
+            if removed or added:
+                sync_camera(conn, camera_id, {'tags'})
+            result = {'success': True, 'added': added, 'removed': removed}
+
+        else:
+            if action == 'assign':
+                cur.execute(
+                    '''
+                    INSERT INTO camera_tag_assignments (camera_id, tag_id)
+                    SELECT c, %s FROM unnest(%s::integer[]) AS c
+                    ON CONFLICT (camera_id, tag_id) DO NOTHING
+                    ''',
+                    (tag_id, camera_ids),
+                )
+            elif action == 'unassign':
+                cur.execute(
+                    'DELETE FROM camera_tag_assignments WHERE tag_id = %s AND camera_id = ANY(%s::integer[])',
+                    (tag_id, camera_ids),
+                )
+            else:
+                cur.execute(
+                    f'''
+                    INSERT INTO camera_tag_assignments (camera_id, tag_id)
+                    SELECT cr.id, %s FROM {SCHEMA}.cameras_registry cr
+                    WHERE {where_sql}
+                    ON CONFLICT (camera_id, tag_id) DO NOTHING
+                    ''',
+                    [tag_id] + params,
+                )
+
+            changed = cur.rowcount
+            refreshed_groups = refresh_rules_for_tags(conn, [tag_id]) if changed else 0
+            result = {'success': True, 'changed': changed, 'refreshed_groups': refreshed_groups}
+
+        conn.commit()
+        return {'statusCode': 200, 'headers': cors, 'body': json.dumps(result)}
+    except psycopg2.IntegrityError:
+        # Внешний ключ: такой камеры или тега нет
+        conn.rollback()
+        return {'statusCode': 400, 'headers': cors, 'body': json.dumps({'error': 'Camera or tag not found'})}
+    finally:
+        cur.close()
+        conn.close()
 
 
 def handler(event: dict, context) -> dict:
-    """CRUD для тегов камер"""
+    """CRUD для тегов камер и массовое назначение тегов камерам"""
     cors = {
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
@@ -20,6 +134,22 @@ def handler(event: dict, context) -> dict:
 
     method = event.get('httpMethod', 'GET')
 
+    if method == 'GET' and (event.get('queryStringParameters') or {}).get('camera_id'):
+        camera_id_param = event['queryStringParameters']['camera_id']
+        if not camera_id_param.isdigit():
+            return {'statusCode': 400, 'headers': cors, 'body': json.dumps({'error': 'camera_id must be an integer'})}
+        camera_id = int(camera_id_param)
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute(
+            'SELECT tag_id FROM camera_tag_assignments WHERE camera_id=%s ORDER BY tag_id',
+            (camera_id,),
+        )
+        tag_ids = [r[0] for r in cur.fetchall()]
+        cur.close()
+        conn.close()
+        return {'statusCode': 200, 'headers': cors, 'body': json.dumps({'camera_id': camera_id, 'tag_ids': tag_ids})}
+
     if method == 'GET':
         conn = get_conn()
         cur = conn.cursor()
@@ -35,8 +165,19 @@ def handler(event: dict, context) -> dict:
         ]
         return {'statusCode': 200, 'headers': cors, 'body': json.dumps(tags)}
 
+    body = {}
+    if method in ('POST', 'PUT', 'DELETE'):
+        try:
+            body = json.loads(event.get('body') or '{}')
+        except json.JSONDecodeError:
+            body = None
+        if not isinstance(body, dict):
+            return {'statusCode': 400, 'headers': cors, 'body': json.dumps({'error': 'Invalid JSON body'})}
+
+    if method == 'POST' and body.get('action'):
+        return handle_assignments(body, cors)
+
     if method == 'POST':
-        body = json.loads(event.get('body') or '{}')
         name = body.get('name', '').strip()
         color = body.get('color', '#6366f1')
         description = body.get('description', '')
@@ -55,7 +196,6 @@ def handler(event: dict, context) -> dict:
         return {'statusCode': 201, 'headers': cors, 'body': json.dumps({'id': tag_id, 'name': name, 'color': color, 'description': description})}
 
     if method == 'PUT':
-        body = json.loads(event.get('body') or '{}')
         tag_id = body.get('id')
         name = body.get('name', '').strip()
         color = body.get('color', '#6366f1')
@@ -74,7 +214,6 @@ def handler(event: dict, context) -> dict:
         return {'statusCode': 200, 'headers': cors, 'body': json.dumps({'success': True})}
 
     if method == 'DELETE':
-        body = json.loads(event.get('body') or '{}')
         tag_id = body.get('id')
         if not tag_id:
             return {'statusCode': 400, 'headers': cors, 'body': json.dumps({'error': 'id required'})}
@@ -0,0 +1,82 @@
+'''
+Асинхронный пул соединений с PostgreSQL на psycopg 3 для index_async.py.
+Запросы выполняются без блокировки цикла событий: пока один запрос ждёт
+ответа сервера, процесс обслуживает другие, поэтому один экземпляр держит
+сотни одновременных запросов. Пул создаётся лениво для каждого DSN и цикла
+событий и переживает тёплые вызовы в том же цикле. Строки - словари,
+плейсхолдеры - %s, как в psycopg2, поэтому тексты запросов общие с синхронным
+index.py. psycopg 3 сам готовит на сервере запрос, выполненный на соединении
+prepare_threshold раз; как и в db.py, соединения открываются с
+plan_cache_mode = force_custom_plan. run_sync() передаёт запрос синхронному
+index.handler в потоке. Модуль копируется в каждую асинхронную функцию.
+'''
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+from psycopg import AsyncConnection
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = int(os.environ.get('DB_ASYNC_POOL_MAX_SIZE', 20))
+POOL_TIMEOUT_SECONDS = 10.0
+MAX_IDLE_SECONDS = 300.0
+
+SESSION_SETUP_SQL = 'SET plan_cache_mode = force_custom_plan'
+
+# Пул привязан к циклу событий, в котором открыт
+_pools: Dict[Tuple[int, str], AsyncConnectionPool] = {}
+# id цикла событий -> семафор вызовов синхронного обработчика
+_sync_slots: Dict[int, asyncio.Semaphore] = {}
+
+
+async def _setup_session(conn: AsyncConnection) -> None:
+    await conn.execute(SESSION_SETUP_SQL)
+    await conn.commit()
+
+
+async def get_pool(dsn: Optional[str] = None) -> AsyncConnectionPool:
+    dsn = dsn or os.environ['DATABASE_URL']
+    key = (id(asyncio.get_running_loop()), dsn)
+    pool = _pools.get(key)
+    if pool is None:
+        pool = _pools[key] = AsyncConnectionPool(
+            dsn,
+            min_size=POOL_MIN_SIZE,
+            max_size=POOL_MAX_SIZE,
+            timeout=POOL_TIMEOUT_SECONDS,
+            max_idle=MAX_IDLE_SECONDS,
+            kwargs={'row_factory': dict_row},
+            configure=_setup_session,
+            check=AsyncConnectionPool.check_connection,
+            open=False
+        )
+    # Повторное открытие уже открытого пула ничего не делает
+    await pool.open()
+    return pool
+
+
+@asynccontextmanager
+async def connection(dsn: Optional[str] = None) -> AsyncIterator[AsyncConnection]:
+    '''async with adb.connection() as conn: - соединение из пула, транзакция фиксируется на выходе'''
+    pool = await get_pool(dsn)
+    async with pool.connection() as conn:
+        yield conn
+
+
+async def run_sync(handler: Callable[..., Any], *args: Any) -> Any:
+    '''
+    Вызывает синхронный обработчик в потоке, не больше одного одновременно.
+    Его состояние уровня модуля (буферы heartbeat и присутствия, битмап-индекс
+    тегов) рассчитано на один вызов за раз, как на платформе, а пул db.py
+    не ждёт свободного соединения. Остальные вызовы ждут в цикле событий, не
+    занимая потоков.
+    '''
+    key = id(asyncio.get_running_loop())
+    slot = _sync_slots.get(key)
+    if slot is None:
+        slot = _sync_slots[key] = asyncio.Semaphore(1)
+    async with slot:
+        return await asyncio.to_thread(handler, *args)
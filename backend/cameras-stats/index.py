@@ -7,13 +7,57 @@ Returns: HTTP response dict со статистикой по камерам
 
 import json
 import os
-from typing import Dict, Any
-import psycopg2
+from typing import Dict, Any, List
+import db
 from psycopg2.extras import RealDictCursor
+from visibility import get_visible_camera_ids, VisibilityError
 
-def get_db_connection():
+# Запросы выполняются как подготовленные операторы (db.execute_prepared)
+STATS_TOTAL_SQL = '''
+    SELECT 
+        COUNT(*) as total,
+        0 as active,
+        0 as inactive,
+        0 as problem,
+        0 as total_traffic,
+        0 as avg_fps
+    FROM t_p76735805_video_surveillance_s.cameras_registry
+    WHERE %s::integer[] IS NULL OR id = ANY(%s::integer[])
+'''
+
+STATS_BY_OWNER_SQL = '''
+    SELECT owner, COUNT(*) as count
+    FROM t_p76735805_video_surveillance_s.cameras_registry
+    WHERE owner IS NOT NULL
+      AND (%s::integer[] IS NULL OR id = ANY(%s::integer[]))
+    GROUP BY owner
+    ORDER BY count DESC
+'''
+
+STATS_BY_GROUP_SQL = '''
+    SELECT territorial_division as group, COUNT(*) as count
+    FROM t_p76735805_video_surveillance_s.cameras_registry
+    WHERE territorial_division IS NOT NULL
+      AND (%s::integer[] IS NULL OR id = ANY(%s::integer[]))
+    GROUP BY territorial_division
+    ORDER BY count DESC
+'''
+
+def get_db_connection(event: Dict[str, Any]):
     database_url = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    return db.connect_read(database_url, cursor_factory=RealDictCursor, min_lsn=db.min_lsn_from_event(event))
+
+def stats_result(stats: Dict[str, Any], owners: List[Dict[str, Any]], groups: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        'total': stats['total'],
+        'active': stats['active'],
+        'inactive': stats['inactive'],
+        'problem': stats['problem'],
+        'total_traffic': float(stats['total_traffic']),
+        'avg_fps': float(stats['avg_fps']),
+        'by_owner': [dict(row) for row in owners],
+        'by_group': [dict(row) for row in groups]
+    }
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -24,7 +68,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token, X-Min-LSN',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -39,53 +83,22 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = get_db_connection()
+    conn = get_db_connection(event)
     cur = conn.cursor()
     
     try:
-        cur.execute('''
-            SELECT 
-                COUNT(*) as total,
-                0 as active,
-                0 as inactive,
-                0 as problem,
-                0 as total_traffic,
-                0 as avg_fps
-            FROM t_p76735805_video_surveillance_s.cameras_registry
-        ''')
+        visible_ids = get_visible_camera_ids(cur, event)
         
+        db.execute_prepared(cur, 'camera_stats_total', STATS_TOTAL_SQL, (visible_ids, visible_ids))
         stats = cur.fetchone()
         
-        cur.execute('''
-            SELECT owner, COUNT(*) as count
-            FROM t_p76735805_video_surveillance_s.cameras_registry
-            WHERE owner IS NOT NULL
-            GROUP BY owner
-            ORDER BY count DESC
-        ''')
-        
+        db.execute_prepared(cur, 'camera_stats_by_owner', STATS_BY_OWNER_SQL, (visible_ids, visible_ids))
         owners = cur.fetchall()
         
-        cur.execute('''
-            SELECT territorial_division as group, COUNT(*) as count
-            FROM t_p76735805_video_surveillance_s.cameras_registry
-            WHERE territorial_division IS NOT NULL
-            GROUP BY territorial_division
-            ORDER BY count DESC
-        ''')
-        
+        db.execute_prepared(cur, 'camera_stats_by_group', STATS_BY_GROUP_SQL, (visible_ids, visible_ids))
         groups = cur.fetchall()
         
-        result = {
-            'total': stats['total'],
-            'active': stats['active'],
-            'inactive': stats['inactive'],
-            'problem': stats['problem'],
-            'total_traffic': float(stats['total_traffic']),
-            'avg_fps': float(stats['avg_fps']),
-            'by_owner': [dict(row) for row in owners],
-            'by_group': [dict(row) for row in groups]
-        }
+        result = stats_result(stats, owners, groups)
         
         return {
             'statusCode': 200,
@@ -94,6 +107,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    except VisibilityError as e:
+        return {
+            'statusCode': e.status,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    
     except Exception as e:
         return {
             'statusCode': 500,
@@ -0,0 +1,59 @@
+'''
+Business: Асинхронный вариант API статистики по камерам на пуле psycopg 3
+Args: event - dict с httpMethod, queryStringParameters
+      context - объект с атрибутами request_id, function_name
+Returns: HTTP response dict со статистикой по камерам
+
+Запросы выполняются в цикле событий и не занимают поток на время ожидания БД:
+один процесс одновременно обслуживает много опросов дашборда.
+'''
+
+import json
+import os
+from typing import Dict, Any
+import adb
+import index
+from visibility import get_visible_camera_ids_async, VisibilityError
+
+async def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method != 'GET' or not os.environ.get('DATABASE_URL'):
+        return await adb.run_sync(index.handler, event, context)
+    
+    try:
+        async with adb.connection() as conn:
+            visible_ids = await get_visible_camera_ids_async(conn, event)
+            params = (visible_ids, visible_ids)
+            
+            cur = await conn.execute(index.STATS_TOTAL_SQL, params)
+            stats = await cur.fetchone()
+            
+            cur = await conn.execute(index.STATS_BY_OWNER_SQL, params)
+            owners = await cur.fetchall()
+            
+            cur = await conn.execute(index.STATS_BY_GROUP_SQL, params)
+            groups = await cur.fetchall()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps(index.stats_result(stats, owners, groups), default=str),
+            'isBase64Encoded': False
+        }
+    
+    except VisibilityError as e:
+        return {
+            'statusCode': e.status,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
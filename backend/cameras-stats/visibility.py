@@ -0,0 +1,67 @@
+'''
+Камеры, доступные пользователю запроса, из user_camera_visibility.
+Пользователь определяется только по подписанному X-Auth-Token: заголовок
+X-User-Id не подписан и без токена не принимается.
+Модуль копируется в функции, которые фильтруют камеры по видимости.
+'''
+
+from typing import Dict, Any, List, Optional
+import db
+from session_tokens import token_from_event, verify_token, verify_token_async
+
+VISIBILITY_SQL = '''
+    SELECT all_cameras, camera_ids
+    FROM t_p76735805_video_surveillance_s.user_camera_visibility
+    WHERE user_id = %s
+'''
+
+
+class VisibilityError(Exception):
+    '''Пользователь запроса указан неверно; status - HTTP-код ответа'''
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+def _user_id(claims: Optional[Dict[str, Any]], token: Optional[str], event: Dict[str, Any]) -> Optional[int]:
+    if claims:
+        return int(claims['uid'])
+    headers = event.get('headers') or {}
+    if token or headers.get('X-User-Id') or headers.get('x-user-id'):
+        raise VisibilityError(401, 'Valid X-Auth-Token required')
+    return None
+
+
+def _visible_ids(row: Optional[Dict[str, Any]]) -> Optional[List[int]]:
+    if not row:
+        return []
+    if row['all_cameras']:
+        return None
+    return row['camera_ids']
+
+
+def get_visible_camera_ids(cursor, event: Dict[str, Any]) -> Optional[List[int]]:
+    '''
+    Список id видимых камер; None - ограничений нет (пользователь не указан
+    или ему доступны все камеры). VisibilityError, если токен не прошёл
+    проверку или вместо него передан только X-User-Id.
+    '''
+    token = token_from_event(event)
+    claims = verify_token(cursor.connection, token) if token else None
+    user_id = _user_id(claims, token, event)
+    if user_id is None:
+        return None
+    db.execute_prepared(cursor, 'camera_visibility', VISIBILITY_SQL, (user_id,))
+    return _visible_ids(cursor.fetchone())
+
+
+async def get_visible_camera_ids_async(conn, event: Dict[str, Any]) -> Optional[List[int]]:
+    '''get_visible_camera_ids для асинхронного соединения psycopg 3'''
+    token = token_from_event(event)
+    claims = await verify_token_async(conn, token) if token else None
+    user_id = _user_id(claims, token, event)
+    if user_id is None:
+        return None
+    cur = await conn.execute(VISIBILITY_SQL, (user_id,))
+    return _visible_ids(await cur.fetchone())
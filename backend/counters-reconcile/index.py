@@ -0,0 +1,68 @@
+'''
+Business: Сверка кэшированных счётчиков (users_count, user_count, camera_count) с фактическими данными
+Args: event - dict с httpMethod
+      context - объект с атрибутами request_id, function_name
+Returns: HTTP response dict с количеством исправленных строк по таблицам
+'''
+
+import json
+import os
+from typing import Dict, Any
+import db
+from psycopg2.extras import RealDictCursor
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'POST')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    if method != 'POST':
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+    
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'DATABASE_URL not configured'}),
+            'isBase64Encoded': False
+        }
+    
+    conn = db.connect(dsn)
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    
+    try:
+        cursor.execute('SELECT table_name, fixed FROM t_p76735805_video_surveillance_s.reconcile_counters()')
+        fixed = {row['table_name']: row['fixed'] for row in cursor.fetchall()}
+        conn.commit()
+        
+        total = sum(fixed.values())
+        if total:
+            print(f"Counter drift corrected: {fixed}")
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'fixed': fixed, 'total': total}),
+            'isBase64Encoded': False
+        }
+    
+    finally:
+        cursor.close()
+        conn.close()
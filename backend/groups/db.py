@@ -0,0 +1,406 @@
+'''
+Пул соединений с PostgreSQL уровня процесса.
+Пул создаётся лениво при первом connect() и переживает тёплые вызовы функции,
+поэтому TCP/TLS и аутентификация выполняются один раз на соединение, а не на
+каждый запрос. connect() повторяет сигнатуру psycopg2.connect и возвращает
+обёртку, у которой close() возвращает соединение в пул: незавершённая
+транзакция откатывается, параметры соединения сбрасываются к значениям по
+умолчанию. Соединение, простоявшее дольше HEALTHCHECK_IDLE_SECONDS, перед
+выдачей проверяется запросом SELECT 1. Модуль копируется в каждую функцию.
+
+execute_prepared() выполняет горячие запросы через PREPARE/EXECUTE: текст
+разбирается и планируется сервером один раз на соединение пула. Список
+подготовленных операторов хранится для каждого соединения и теряется вместе с
+ним, после переподключения оператор готовится заново. Соединения пула открываются
+с plan_cache_mode = force_custom_plan: горячие запросы содержат условия вида
+(%s IS NULL OR ...), и общий план без значений параметров был бы плох для обоих
+вариантов. Разбор текста всё равно выполняется один раз.
+
+connect_read() для обработчиков, которые только читают, выбирает реплику из
+DATABASE_REPLICA_URLS (через запятую) по кругу. Недоступная реплика
+исключается на REPLICA_EJECT_SECONDS, отстающая больше чем на
+DB_REPLICA_MAX_LAG_SECONDS пропускается. Чтение своих записей: ответ на
+запись несёт позицию WAL в заголовке X-LSN (lsn_headers), клиент передаёт её в
+X-Min-LSN, и запрос уходит только на реплику, воспроизведшую эту позицию.
+Без реплик или если ни одна не подходит используется основной DSN. Для
+проверки достаточно двух локальных серверов: основного и потоковой реплики.
+'''
+
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import psycopg2
+import psycopg2.extensions
+
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 4))
+HEALTHCHECK_IDLE_SECONDS = 30.0
+MAX_IDLE_SECONDS = 300.0
+
+# Выполняется на каждом новом соединении пула вне транзакции
+SESSION_SETUP_SQL = 'SET plan_cache_mode = force_custom_plan'
+
+REPLICA_DSNS = [dsn.strip() for dsn in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if dsn.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('DB_REPLICA_MAX_LAG_SECONDS', 5))
+REPLICA_CHECK_SECONDS = 1.0
+REPLICA_EJECT_SECONDS = 30.0
+MIN_LSN_HEADER = 'X-Min-LSN'
+LSN_HEADER = 'X-LSN'
+LSN_RE = re.compile(r'^[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}$')
+
+
+class PoolExhausted(psycopg2.OperationalError):
+    '''Все POOL_MAX_SIZE соединений процесса заняты'''
+
+
+STATEMENT_NAME_RE = re.compile(r'^[a-z_][a-z0-9_]*$')
+PLACEHOLDER_RE = re.compile(r'%%|%s')
+
+# SQLSTATE invalid_sql_statement_name: оператор не подготовлен на этом соединении
+INVALID_STATEMENT_NAME = '26000'
+
+
+class _Entry:
+    __slots__ = ('raw', 'dsn', 'released_at')
+
+    def __init__(self, raw, dsn: str) -> None:
+        self.raw = raw
+        self.dsn = dsn
+        self.released_at = time.monotonic()
+
+
+# id(соединения psycopg2) -> {имя оператора: исходный SQL}
+_prepared: Dict[int, Dict[str, str]] = {}
+
+
+def _setup_session(raw) -> None:
+    cur = raw.cursor()
+    cur.execute(SESSION_SETUP_SQL)
+    cur.close()
+    raw.commit()
+
+
+def _open(dsn: str):
+    raw = psycopg2.connect(dsn)
+    try:
+        _setup_session(raw)
+    except Exception:
+        raw.close()
+        raise
+    return raw
+
+
+class ConnectionPool:
+    def __init__(self, max_size: int = POOL_MAX_SIZE) -> None:
+        self.max_size = max_size
+        self.idle: Dict[str, List[_Entry]] = {}
+        self.in_use = 0
+        self.lock = threading.Lock()
+
+    def _healthy(self, entry: _Entry) -> bool:
+        raw = entry.raw
+        if raw.closed or raw.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - entry.released_at < HEALTHCHECK_IDLE_SECONDS:
+            return True
+        try:
+            cur = raw.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            raw.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, entry: _Entry) -> None:
+        _prepared.pop(id(entry.raw), None)
+        try:
+            entry.raw.close()
+        except psycopg2.Error:
+            pass
+
+    def acquire(self, dsn: str) -> _Entry:
+        while True:
+            with self.lock:
+                idle = self.idle.get(dsn)
+                entry = idle.pop() if idle else None
+                if entry is None:
+                    if self.in_use + self._idle_count() >= self.max_size:
+                        self._evict_one()
+                    if self.in_use >= self.max_size:
+                        raise PoolExhausted(f'Connection pool exhausted ({self.max_size} in use)')
+                self.in_use += 1
+            if entry is None:
+                try:
+                    return _Entry(_open(dsn), dsn)
+                except Exception:
+                    with self.lock:
+                        self.in_use -= 1
+                    raise
+            if self._healthy(entry):
+                return entry
+            self._discard(entry)
+            with self.lock:
+                self.in_use -= 1
+
+    def _idle_count(self) -> int:
+        return sum(len(entries) for entries in self.idle.values())
+
+    def _evict_one(self) -> None:
+        '''Закрывает самое старое простаивающее соединение (к другому DSN) ради нового'''
+        oldest: Optional[_Entry] = None
+        for entries in self.idle.values():
+            for entry in entries:
+                if oldest is None or entry.released_at < oldest.released_at:
+                    oldest = entry
+        if oldest is not None:
+            self.idle[oldest.dsn].remove(oldest)
+            self._discard(oldest)
+
+    def release(self, entry: _Entry) -> None:
+        raw = entry.raw
+        reusable = not raw.closed
+        if reusable:
+            try:
+                if raw.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    raw.rollback()
+                if raw.autocommit:
+                    raw.autocommit = False
+                raw.cursor_factory = None
+            except psycopg2.Error:
+                reusable = False
+        now = time.monotonic()
+        with self.lock:
+            self.in_use -= 1
+            if reusable:
+                entry.released_at = now
+                self.idle.setdefault(entry.dsn, []).append(entry)
+            # Долго простаивающие соединения закрываются, чтобы не держать слоты сервера
+            for entries in self.idle.values():
+                while entries and now - entries[0].released_at > MAX_IDLE_SECONDS:
+                    self._discard(entries.pop(0))
+        if not reusable:
+            self._discard(entry)
+
+
+class PooledConnection:
+    '''Обёртка над соединением psycopg2; close() возвращает соединение в пул'''
+
+    def __init__(self, pool: ConnectionPool, entry: _Entry, cursor_factory: Any = None) -> None:
+        self._pool = pool
+        self._entry: Optional[_Entry] = entry
+        if cursor_factory is not None:
+            entry.raw.cursor_factory = cursor_factory
+
+    @property
+    def raw(self):
+        if self._entry is None:
+            raise psycopg2.InterfaceError('connection already closed')
+        return self._entry.raw
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.raw, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.raw, name, value)
+
+    @property
+    def closed(self) -> int:
+        return 1 if self._entry is None else self._entry.raw.closed
+
+    def close(self) -> None:
+        entry, self._entry = self._entry, None
+        if entry is not None:
+            self._pool.release(entry)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self._entry is not None:
+            if exc_type is None:
+                self.raw.commit()
+            else:
+                self.raw.rollback()
+
+    def __del__(self) -> None:
+        # Обработчик вернул ответ, не закрыв соединение: возвращаем его в пул
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+_pool = ConnectionPool()
+
+
+def connect(dsn: Optional[str] = None, cursor_factory: Any = None) -> PooledConnection:
+    '''Аналог psycopg2.connect(dsn, cursor_factory=...) с повторным использованием соединений'''
+    dsn = dsn or os.environ['DATABASE_URL']
+    return PooledConnection(_pool, _pool.acquire(dsn), cursor_factory)
+
+
+def _to_positional(sql: str) -> Tuple[str, int]:
+    '''Заменяет %s на $1..$n и %% на %; возвращает текст и число параметров'''
+    count = 0
+
+    def replace(match) -> str:
+        nonlocal count
+        if match.group(0) == '%%':
+            return '%'
+        count += 1
+        return f'${count}'
+
+    return PLACEHOLDER_RE.sub(replace, sql), count
+
+
+def _prepare(cur, name: str, sql: str, statements: Dict[str, str]) -> None:
+    if name in statements:
+        cur.execute(f'DEALLOCATE {name}')
+    text, _ = _to_positional(sql)
+    cur.execute(f'PREPARE {name} AS {text}')
+    statements[name] = sql
+
+
+def execute_prepared(cur, name: str, sql: str, params: Sequence[Any] = ()) -> None:
+    '''
+    Выполняет sql (с позиционными %s) как подготовленный оператор name.
+    Результат читается из cur обычными fetchone()/fetchall().
+    '''
+    if not STATEMENT_NAME_RE.match(name):
+        raise ValueError(f'Invalid statement name: {name}')
+    raw = cur.connection
+    statements = _prepared.setdefault(id(raw), {})
+    if statements.get(name) != sql:
+        _prepare(cur, name, sql, statements)
+
+    execute_sql = f'EXECUTE {name} ({", ".join(["%s"] * len(params))})' if params else f'EXECUTE {name}'
+    was_idle = raw.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    try:
+        cur.execute(execute_sql, tuple(params))
+    except psycopg2.Error as e:
+        # Оператор потерян на сервере (например, DISCARD ALL во внешнем пулере):
+        # повторяем, только если ошибка не оборвала уже начатую транзакцию
+        if getattr(e, 'pgcode', None) != INVALID_STATEMENT_NAME or not was_idle:
+            raise
+        raw.rollback()
+        statements.clear()
+        # DISCARD ALL сбросил и параметры сессии
+        _setup_session(raw)
+        _prepare(cur, name, sql, statements)
+        cur.execute(execute_sql, tuple(params))
+
+
+def lsn_to_int(lsn: str) -> int:
+    high, low = lsn.split('/')
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+class _ReplicaState:
+    __slots__ = ('ejected_until', 'checked_at', 'replay_lsn', 'lag')
+
+    def __init__(self) -> None:
+        self.ejected_until = 0.0
+        self.checked_at = float('-inf')
+        # None - сервер не в режиме восстановления (например, реплику повысили)
+        self.replay_lsn: Optional[int] = None
+        self.lag = 0.0
+
+
+class ReplicaRouter:
+    '''Выбор реплики для чтения: по кругу, без недоступных и отстающих'''
+
+    def __init__(self, dsns: Sequence[str]) -> None:
+        self.dsns = list(dsns)
+        self.states = {dsn: _ReplicaState() for dsn in self.dsns}
+        self.next = 0
+        self.lock = threading.Lock()
+
+    def _order(self) -> List[str]:
+        now = time.monotonic()
+        with self.lock:
+            start = self.next
+            self.next = (start + 1) % len(self.dsns)
+        ordered = self.dsns[start:] + self.dsns[:start]
+        return [dsn for dsn in ordered if self.states[dsn].ejected_until <= now]
+
+    def eject(self, dsn: str) -> None:
+        self.states[dsn].ejected_until = time.monotonic() + REPLICA_EJECT_SECONDS
+
+    def _check(self, raw, state: _ReplicaState) -> None:
+        cur = raw.cursor(cursor_factory=psycopg2.extensions.cursor)
+        # Если всё принятое воспроизведено, реплика не отстаёт, даже когда
+        # основной сервер давно ничего не писал
+        cur.execute('''
+            SELECT pg_is_in_recovery(),
+                   pg_last_wal_replay_lsn()::text,
+                   CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                   END
+        ''')
+        in_recovery, replay_lsn, lag = cur.fetchone()
+        cur.close()
+        raw.rollback()
+        state.replay_lsn = lsn_to_int(replay_lsn) if in_recovery and replay_lsn else None
+        state.lag = float(lag or 0) if in_recovery else 0.0
+        state.checked_at = time.monotonic()
+
+    def _usable(self, state: _ReplicaState, min_lsn: Optional[int]) -> bool:
+        if state.lag > REPLICA_MAX_LAG_SECONDS:
+            return False
+        return min_lsn is None or state.replay_lsn is None or state.replay_lsn >= min_lsn
+
+    def connect(self, primary_dsn: str, cursor_factory: Any = None, min_lsn: Optional[int] = None) -> PooledConnection:
+        for dsn in self._order():
+            state = self.states[dsn]
+            try:
+                conn = connect(dsn, cursor_factory)
+            except PoolExhausted:
+                raise
+            except psycopg2.OperationalError:
+                self.eject(dsn)
+                continue
+            if time.monotonic() - state.checked_at >= REPLICA_CHECK_SECONDS or not self._usable(state, min_lsn):
+                try:
+                    self._check(conn.raw, state)
+                except psycopg2.Error:
+                    conn.close()
+                    self.eject(dsn)
+                    continue
+            if self._usable(state, min_lsn):
+                return conn
+            conn.close()
+        return connect(primary_dsn, cursor_factory)
+
+
+_replicas = ReplicaRouter(REPLICA_DSNS)
+
+
+def connect_read(dsn: Optional[str] = None, cursor_factory: Any = None, min_lsn: Optional[str] = None) -> PooledConnection:
+    '''Соединение для запросов только на чтение: подходящая реплика или основной DSN'''
+    dsn = dsn or os.environ['DATABASE_URL']
+    if not _replicas.dsns:
+        return connect(dsn, cursor_factory)
+    return _replicas.connect(dsn, cursor_factory, lsn_to_int(min_lsn) if min_lsn else None)
+
+
+def min_lsn_from_event(event: Dict[str, Any]) -> Optional[str]:
+    '''Позиция WAL из заголовка X-Min-LSN, полученная клиентом в ответе на запись'''
+    headers = event.get('headers') or {}
+    value = headers.get(MIN_LSN_HEADER) or headers.get(MIN_LSN_HEADER.lower())
+    return value if value and LSN_RE.match(value) else None
+
+
+def lsn_headers(conn) -> Dict[str, str]:
+    '''Заголовки ответа на зафиксированную запись; без реплик - пустые'''
+    if not _replicas.dsns:
+        return {}
+    cur = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+    cur.execute('SELECT pg_current_wal_lsn()::text')
+    lsn = cur.fetchone()[0]
+    cur.close()
+    return {LSN_HEADER: lsn, 'Access-Control-Expose-Headers': LSN_HEADER}
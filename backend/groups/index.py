@@ -8,12 +8,12 @@ Returns: HTTP response dict со списком групп или результ
 import json
 import os
 from typing import Dict, Any, List
-import psycopg2
+import db
 from psycopg2.extras import RealDictCursor
 
 def get_db_connection():
     database_url = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    return db.connect(database_url, cursor_factory=RealDictCursor)
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -39,12 +39,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             cur.execute('''
                 SELECT 
                     g.*,
-                    pg.name as parent_group_name,
-                    COUNT(DISTINCT cgm.camera_id) as camera_count
+                    pg.name as parent_group_name
                 FROM camera_groups g
                 LEFT JOIN camera_groups pg ON g.parent_group_id = pg.id
-                LEFT JOIN camera_group_members cgm ON g.id = cgm.group_id
-                GROUP BY g.id, pg.name
                 ORDER BY g.name
             ''')
             
@@ -1,6 +1,6 @@
 import json
 import os
-import psycopg2
+import db
 from typing import Dict, Any
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -46,7 +46,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         dsn = os.environ['DATABASE_URL']
-        conn = psycopg2.connect(dsn)
+        conn = db.connect(dsn)
         cur = conn.cursor()
         
         cur.execute('''
@@ -0,0 +1,297 @@
+'''
+Нагрузочный прогон сценариев из backend/*/tests.json.
+Сценарии выбираются случайно с весами --mix и выполняются --concurrency
+потоками: в процессе через обработчики функций (как в local_gateway) или по
+HTTP на запущенный шлюз (--url). По умолчанию берутся только GET: записи из
+tests.json повторяются с одними и теми же телами и после первого прогона
+упираются в конфликты; --methods GET POST включает их, базу тогда стоит
+наполнять заново через --seed-sql. Для каждой пары функция/метод печатаются
+пропускная способность (по запросам, завершённым в окне замера), p50/p95/p99
+задержки и число ответов с кодом, не совпавшим с expectedStatus. --save-baseline сохраняет результат, --baseline
+сравнивает с сохранённым и завершается с кодом 1, если p95 вырос или
+пропускная способность упала больше чем на --threshold.
+
+Запуск: DATABASE_URL=postgresql://... python backend/local_bench.py \
+    --seed-sql seed.sql --duration 30 --concurrency 32 --mix camera-registry=5 sessions=3
+'''
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import local_gateway
+
+BACKEND_DIR = local_gateway.BACKEND_DIR
+PERCENTILES = (50, 95, 99)
+MIN_COMPARED_SAMPLES = 20
+
+
+class Scenario:
+    def __init__(self, function: str, test: Dict[str, Any], weight: float) -> None:
+        self.function = function
+        self.name = test.get('name', '')
+        self.method = test.get('method', 'GET').upper()
+        self.path = test.get('path', '/')
+        body = test.get('body')
+        self.body = b'' if body is None else (body if isinstance(body, str) else json.dumps(body)).encode('utf-8')
+        self.headers = test.get('headers') or {}
+        self.expected_status = test.get('expectedStatus')
+        self.weight = weight
+
+    @property
+    def key(self) -> str:
+        return f'{self.function} {self.method}'
+
+
+def load_scenarios(functions: List[str], weights: Dict[str, float], methods: Optional[List[str]]) -> List[Scenario]:
+    scenarios = []
+    for function in functions:
+        path = os.path.join(BACKEND_DIR, function, 'tests.json')
+        if not os.path.isfile(path):
+            continue
+        with open(path) as tests_file:
+            tests = json.load(tests_file).get('tests', [])
+        for test in tests:
+            scenario = Scenario(function, test, weights.get(function, 1.0))
+            if scenario.weight > 0 and (not methods or scenario.method in methods):
+                scenarios.append(scenario)
+    return scenarios
+
+
+def parse_mix(items: List[str]) -> Dict[str, float]:
+    '''camera-registry=5 sessions=3 -> веса функций; не указанные имеют вес 1'''
+    weights = {}
+    for item in items or []:
+        name, _, weight = item.partition('=')
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def seed_database(path: str) -> None:
+    import psycopg2
+    with open(path) as seed_file:
+        sql = seed_file.read()
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(sql)
+    finally:
+        conn.close()
+
+
+class InProcessTarget:
+    '''Вызывает обработчики напрямую, без HTTP'''
+
+    def __init__(self, functions: List[str], use_async: bool) -> None:
+        self.functions: Dict[str, local_gateway.Function] = {}
+        for name in functions:
+            try:
+                self.functions[name] = local_gateway.load_function(name, use_async)
+            except ImportError as e:
+                print(f'Skipping {name}: {e}', file=sys.stderr)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        if any(function.is_async for function in self.functions.values()):
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(target=self.loop.run_forever, name='bench-loop', daemon=True).start()
+
+    def call(self, scenario: Scenario, headers: Dict[str, str]) -> int:
+        function = self.functions[scenario.function]
+        _, event = local_gateway.build_event(
+            scenario.method, f'/{scenario.function}{scenario.path}', {**headers, **scenario.headers}, scenario.body
+        )
+        context = SimpleNamespace(request_id=event['requestContext']['requestId'], function_name=function.name)
+        if function.is_async:
+            response = asyncio.run_coroutine_threadsafe(function.handler(event, context), self.loop).result()
+        else:
+            response = function.call(event, context)
+        return int(response.get('statusCode', 200))
+
+
+class HttpTarget:
+    '''Запросы на запущенный local_gateway'''
+
+    def __init__(self, url: str) -> None:
+        self.url = url.rstrip('/')
+
+    def call(self, scenario: Scenario, headers: Dict[str, str]) -> int:
+        request = urllib.request.Request(
+            f'{self.url}/{scenario.function}{scenario.path}',
+            data=scenario.body or None,
+            headers={'Content-Type': 'application/json', **headers, **scenario.headers},
+            method=scenario.method
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def add(self, key: str, seconds: float, ok: bool) -> None:
+        with self.lock:
+            self.latencies.setdefault(key, []).append(seconds)
+            if not ok:
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    '''Перцентиль по ближайшему рангу'''
+    rank = max(1, math.ceil(p / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def run(target, scenarios: List[Scenario], concurrency: int, duration: float, warmup: float,
+        headers: Dict[str, str], seed: int) -> Recorder:
+    recorder = Recorder()
+    weights = [scenario.weight for scenario in scenarios]
+    started = time.monotonic()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    def worker(index: int) -> None:
+        rng = random.Random(seed + index)
+        while True:
+            if time.monotonic() >= deadline:
+                return
+            scenario = rng.choices(scenarios, weights)[0]
+            begin = time.perf_counter()
+            try:
+                status = target.call(scenario, headers)
+            except Exception:
+                status = None
+            elapsed = time.perf_counter() - begin
+            # Учитываются запросы, завершившиеся в окне замера: rps делится на его длину
+            if measure_from <= time.monotonic() <= deadline:
+                ok = status is not None and (scenario.expected_status is None or status == scenario.expected_status)
+                recorder.add(scenario.key, elapsed, ok)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='bench') as executor:
+        for future in [executor.submit(worker, index) for index in range(concurrency)]:
+            future.result()
+    return recorder
+
+
+def summarize(recorder: Recorder, duration: float) -> Dict[str, Dict[str, float]]:
+    report = {}
+    for key, values in sorted(recorder.latencies.items()):
+        values.sort()
+        row = {'requests': len(values), 'errors': recorder.errors.get(key, 0), 'rps': len(values) / duration}
+        for p in PERCENTILES:
+            row[f'p{p}_ms'] = percentile(values, p) * 1000
+        report[key] = row
+    return report
+
+
+def print_report(report: Dict[str, Dict[str, float]]) -> None:
+    header = f'{"handler":<32}{"requests":>10}{"errors":>8}{"rps":>10}' + ''.join(f'{f"p{p} ms":>10}' for p in PERCENTILES)
+    print(header)
+    print('-' * len(header))
+    for key, row in report.items():
+        print(
+            f'{key:<32}{row["requests"]:>10}{row["errors"]:>8}{row["rps"]:>10.1f}'
+            + ''.join(f'{row[f"p{p}_ms"]:>10.2f}' for p in PERCENTILES)
+        )
+
+
+def compare(report: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    '''Регрессии относительно базовой линии; пары с малым числом замеров не сравниваются'''
+    regressions = []
+    for key, row in report.items():
+        base = baseline.get(key)
+        if not base or min(row['requests'], base['requests']) < MIN_COMPARED_SAMPLES:
+            continue
+        if row['p95_ms'] > base['p95_ms'] * (1 + threshold):
+            regressions.append(f'{key}: p95 {base["p95_ms"]:.2f} -> {row["p95_ms"]:.2f} ms')
+        if row['rps'] < base['rps'] * (1 - threshold):
+            regressions.append(f'{key}: rps {base["rps"]:.1f} -> {row["rps"]:.1f}')
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон сценариев tests.json')
+    parser.add_argument('--functions', nargs='*', help='только эти функции (по умолчанию все)')
+    parser.add_argument('--mix', nargs='*', default=[], help='веса функций: camera-registry=5 sessions=3 auth=0')
+    parser.add_argument('--methods', nargs='+', default=['GET'],
+                        help='только эти методы (по умолчанию GET; записи повторяются с одинаковыми телами)')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30.0, help='секунд замера')
+    parser.add_argument('--warmup', type=float, default=3.0, help='секунд прогрева без замера')
+    parser.add_argument('--header', action='append', default=[], help='заголовок для всех запросов: "X-User-Id: 1"')
+    parser.add_argument('--url', help='адрес запущенного local_gateway; по умолчанию обработчики вызываются в процессе')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='index_async.py, где он есть')
+    parser.add_argument('--seed-sql', help='SQL для наполнения базы перед прогоном')
+    parser.add_argument('--random-seed', type=int, default=1)
+    parser.add_argument('--json', dest='json_path', help='сохранить отчёт в файл')
+    parser.add_argument('--save-baseline', help='сохранить отчёт как базовую линию')
+    parser.add_argument('--baseline', help='сравнить с базовой линией')
+    parser.add_argument('--threshold', type=float, default=0.2, help='допустимое ухудшение, доля')
+    parser.add_argument('--max-db-connections', type=int, default=80,
+                        help='общий предел соединений всех функций с БД при прогоне в процессе')
+    args = parser.parse_args(argv)
+
+    headers = {}
+    for item in args.header:
+        name, _, value = item.partition(':')
+        headers[name.strip()] = value.strip()
+
+    functions = local_gateway.discover_functions(args.functions)
+    scenarios = load_scenarios(functions, parse_mix(args.mix), [m.upper() for m in args.methods])
+    if not scenarios:
+        print('No scenarios selected', file=sys.stderr)
+        return 2
+
+    if args.seed_sql:
+        seed_database(args.seed_sql)
+    if args.url:
+        target = HttpTarget(args.url)
+    else:
+        names = sorted({scenario.function for scenario in scenarios})
+        local_gateway.configure_db_pools(names, args.use_async, args.max_db_connections)
+        target = InProcessTarget(names, args.use_async)
+        scenarios = [scenario for scenario in scenarios if scenario.function in target.functions]
+        if not scenarios:
+            print('No loadable functions', file=sys.stderr)
+            return 2
+
+    recorder = run(target, scenarios, args.concurrency, args.duration, args.warmup, headers, args.random_seed)
+    report = summarize(recorder, args.duration)
+    print_report(report)
+
+    for path in (args.json_path, args.save_baseline):
+        if path:
+            with open(path, 'w') as out:
+                json.dump(report, out, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.threshold)
+        if regressions:
+            print('\nRegressions:')
+            for line in regressions:
+                print(f'  {line}')
+            return 1
+        print('\nNo regressions against baseline')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,252 @@
+'''
+Локальный шлюз: все функции backend/*/index.py за одним HTTP-сервером.
+Запрос /<функция>/<путь>?<параметры> превращается в event (httpMethod, path,
+headers, queryStringParameters, body) и context (request_id, function_name),
+как на платформе, ответ функции - в HTTP-ответ. Запросы обслуживаются пулом
+из --workers потоков; с --async функции, у которых есть index_async.py,
+выполняются в общем цикле событий. Синхронный обработчик, как и на платформе,
+выполняет один вызов за раз: его состояние уровня модуля не рассчитано на
+параллельные потоки, параллельно работают разные функции. Пулы соединений
+функций делят --max-db-connections. Подключение к БД - из DATABASE_URL.
+
+Запуск: DATABASE_URL=postgresql://... python backend/local_gateway.py --workers 32
+'''
+
+import argparse
+import asyncio
+import base64
+import importlib
+import json
+import os
+import sys
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Синхронной функции, вызываемой по одному разу, хватает двух соединений:
+# основной сервер и реплика
+SYNC_POOL_SIZE = 2
+
+
+class Function:
+    def __init__(self, name: str, handler: Callable, is_async: bool) -> None:
+        self.name = name
+        self.handler = handler
+        self.is_async = is_async
+        self.lock = threading.Lock()
+
+    def call(self, event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        '''Вызов синхронного обработчика; параллельные вызовы ждут своей очереди'''
+        with self.lock:
+            return self.handler(event, context)
+
+
+def _local_modules(function_dir: str) -> List[str]:
+    return [name[:-3] for name in os.listdir(function_dir) if name.endswith('.py')]
+
+
+def load_function(name: str, use_async: bool = False) -> Function:
+    '''
+    Импортирует index.py (или index_async.py) функции. Общие модули (db,
+    session_tokens, ...) лежат копиями в каждой функции, поэтому перед импортом
+    и после него они убираются из sys.modules: у каждой функции свои копии и
+    своё состояние, как при отдельном развёртывании.
+    '''
+    function_dir = os.path.join(BACKEND_DIR, name)
+    local = _local_modules(function_dir)
+    module_name = 'index_async' if use_async and 'index_async' in local else 'index'
+    for module in local:
+        sys.modules.pop(module, None)
+    sys.path.insert(0, function_dir)
+    try:
+        handler = importlib.import_module(module_name).handler
+    finally:
+        sys.path.remove(function_dir)
+        for module in local:
+            sys.modules.pop(module, None)
+    return Function(name, handler, module_name == 'index_async')
+
+
+def has_async(name: str) -> bool:
+    return os.path.isfile(os.path.join(BACKEND_DIR, name, 'index_async.py'))
+
+
+def configure_db_pools(names: List[str], use_async: bool, max_connections: int) -> int:
+    '''
+    Размеры пулов соединений через переменные окружения, до импорта функций:
+    у каждой функции свой пул, и вместе они не должны превысить
+    max_connections сервера. Возвращает наибольшее возможное число соединений.
+    '''
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(SYNC_POOL_SIZE))
+    total = len(names) * int(os.environ['DB_POOL_MAX_SIZE'])
+    async_names = [name for name in names if use_async and has_async(name)]
+    if async_names:
+        share = (max_connections - total) // len(async_names)
+        if share < 1:
+            raise SystemExit(f'--max-db-connections {max_connections} is too small for {len(names)} functions')
+        os.environ.setdefault('DB_ASYNC_POOL_MAX_SIZE', str(share))
+        total += len(async_names) * int(os.environ['DB_ASYNC_POOL_MAX_SIZE'])
+    return total
+
+
+def discover_functions(names: Optional[List[str]] = None) -> List[str]:
+    found = sorted(
+        entry for entry in os.listdir(BACKEND_DIR)
+        if os.path.isfile(os.path.join(BACKEND_DIR, entry, 'index.py'))
+    )
+    if names:
+        unknown = set(names) - set(found)
+        if unknown:
+            raise SystemExit(f'Unknown functions: {", ".join(sorted(unknown))}')
+        return [name for name in found if name in names]
+    return found
+
+
+def build_event(method: str, raw_path: str, headers: Dict[str, str], body: bytes) -> Tuple[str, Dict[str, Any]]:
+    '''Имя функции и event в формате платформы'''
+    url = urlsplit(raw_path)
+    parts = url.path.lstrip('/').split('/', 1)
+    function_name = parts[0]
+    try:
+        text, is_base64 = body.decode('utf-8'), False
+    except UnicodeDecodeError:
+        text, is_base64 = base64.b64encode(body).decode(), True
+    event = {
+        'httpMethod': method,
+        'path': '/' + (parts[1] if len(parts) > 1 else ''),
+        'headers': headers,
+        'queryStringParameters': dict(parse_qsl(url.query, keep_blank_values=True)),
+        'body': text,
+        'isBase64Encoded': is_base64,
+        'requestContext': {'requestId': uuid.uuid4().hex, 'httpMethod': method}
+    }
+    return function_name, event
+
+
+class GatewayServer(HTTPServer):
+    request_queue_size = 1024
+
+    def __init__(self, address: Tuple[str, int], functions: Dict[str, Function], workers: int, quiet: bool) -> None:
+        super().__init__(address, GatewayRequestHandler)
+        self.functions = functions
+        self.quiet = quiet
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='gateway')
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        if any(function.is_async for function in functions.values()):
+            # Один цикл на весь шлюз: асинхронные пулы соединений привязаны к циклу
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(target=self.loop.run_forever, name='gateway-loop', daemon=True).start()
+
+    def process_request(self, request, client_address) -> None:
+        self.executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def invoke(self, function: Function, event: Dict[str, Any]) -> Dict[str, Any]:
+        context = SimpleNamespace(request_id=event['requestContext']['requestId'], function_name=function.name)
+        if function.is_async:
+            return asyncio.run_coroutine_threadsafe(function.handler(event, context), self.loop).result()
+        return function.call(event, context)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.executor.shutdown(wait=False)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class GatewayRequestHandler(BaseHTTPRequestHandler):
+    server: GatewayServer
+
+    def _dispatch(self) -> None:
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        function_name, event = build_event(self.command, self.path, dict(self.headers.items()), body)
+
+        if not function_name:
+            self._send(200, {'Content-Type': 'application/json'}, json.dumps(sorted(self.server.functions)).encode())
+            return
+        function = self.server.functions.get(function_name)
+        if function is None:
+            self._send(404, {'Content-Type': 'application/json'}, json.dumps({'error': 'Function not found'}).encode())
+            return
+
+        try:
+            response = self.server.invoke(function, event)
+        except Exception:
+            traceback.print_exc()
+            self._send(502, {'Content-Type': 'application/json'}, json.dumps({'error': 'Handler failed'}).encode())
+            return
+
+        payload = response.get('body') or ''
+        if response.get('isBase64Encoded'):
+            data = base64.b64decode(payload)
+        else:
+            data = payload.encode('utf-8') if isinstance(payload, str) else json.dumps(payload).encode('utf-8')
+        self._send(int(response.get('statusCode', 200)), response.get('headers') or {}, data)
+
+    def _send(self, status: int, headers: Dict[str, str], data: bytes) -> None:
+        self.send_response(status)
+        for name, value in headers.items():
+            if name.lower() != 'content-length':
+                self.send_header(name, str(value))
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = do_OPTIONS = do_HEAD = _dispatch
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Локальный шлюз для функций backend/')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=32, help='число потоков, обслуживающих запросы')
+    parser.add_argument('--functions', nargs='*', help='только эти функции (по умолчанию все)')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='использовать index_async.py, где он есть')
+    parser.add_argument('--quiet', action='store_true', help='не печатать строку на каждый запрос')
+    parser.add_argument('--max-db-connections', type=int, default=80,
+                        help='общий предел соединений всех функций с БД (ниже max_connections сервера)')
+    args = parser.parse_args(argv)
+
+    names = discover_functions(args.functions)
+    connections = configure_db_pools(names, args.use_async, args.max_db_connections)
+
+    functions: Dict[str, Function] = {}
+    for name in names:
+        try:
+            functions[name] = load_function(name, args.use_async)
+        except ImportError as e:
+            # Зависимость из requirements.txt функции не установлена
+            print(f'Skipping {name}: {e}', file=sys.stderr)
+    server = GatewayServer((args.host, args.port), functions, args.workers, args.quiet)
+    print(f'Gateway on http://{args.host}:{args.port}/<function>/ with {args.workers} workers, '
+          f'up to {connections} DB connections: {", ".join(functions)}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
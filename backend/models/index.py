@@ -8,12 +8,12 @@ Returns: HTTP response dict со списком моделей или резул
 import json
 import os
 from typing import Dict, Any, List
-import psycopg2
+import db
 from psycopg2.extras import RealDictCursor
 
 def get_db_connection():
     database_url = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    return db.connect(database_url, cursor_factory=RealDictCursor)
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -1,8 +1,9 @@
 import json
 import os
-import psycopg2
+import db
 from typing import Dict, Any
 from datetime import datetime
+from permissions import engine, containment_filter
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -28,24 +29,63 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     try:
         dsn = os.environ['DATABASE_URL']
-        conn = psycopg2.connect(dsn)
+        conn = db.connect(dsn)
         cur = conn.cursor()
         
         if method == 'GET':
             query_params = event.get('queryStringParameters', {})
             role_id = query_params.get('id') if query_params else None
             
+            if query_params and query_params.get('permission') and query_params.get('user_id'):
+                permission = query_params['permission']
+                if not str(query_params['user_id']).isdigit():
+                    cur.close()
+                    conn.close()
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'user_id must be an integer'}),
+                        'isBase64Encoded': False
+                    }
+                user_id = int(query_params['user_id'])
+                allowed = engine.check(conn, user_id, permission)
+                cur.close()
+                conn.close()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'user_id': user_id, 'permission': permission, 'allowed': allowed}),
+                    'isBase64Encoded': False
+                }
+            
+            if query_params and query_params.get('granting'):
+                cur.execute('''
+                    SELECT id, name
+                    FROM t_p76735805_video_surveillance_s.roles
+                    WHERE permissions @> %s::jsonb
+                    ORDER BY name
+                ''', (containment_filter(query_params['granting']),))
+                result = [{'id': row[0], 'name': row[1]} for row in cur.fetchall()]
+                cur.close()
+                conn.close()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps(result),
+                    'isBase64Encoded': False
+                }
+            
             if role_id:
                 cur.execute('''
-                    SELECT id, name, description, permissions, created_at, updated_at,
-                           (SELECT COUNT(*) FROM t_p76735805_video_surveillance_s.system_users WHERE role_id = roles.id) as users_count
+                    SELECT id, name, description, permissions, created_at, updated_at, users_count
                     FROM t_p76735805_video_surveillance_s.roles 
                     WHERE id = %s
                 ''', (role_id,))
             else:
                 cur.execute('''
-                    SELECT id, name, description, permissions, created_at, updated_at,
-                           (SELECT COUNT(*) FROM t_p76735805_video_surveillance_s.system_users WHERE role_id = roles.id) as users_count
+                    SELECT id, name, description, permissions, created_at, updated_at, users_count
                     FROM t_p76735805_video_surveillance_s.roles
                     ORDER BY created_at DESC
                 ''')
@@ -159,7 +199,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 UPDATE t_p76735805_video_surveillance_s.roles 
                 SET {', '.join(updates)}
                 WHERE id = %s
-                RETURNING id, name, description, permissions, created_at, updated_at
+                RETURNING id, name, description, permissions, created_at, updated_at, users_count
             ''', values)
             
             row = cur.fetchone()
@@ -176,10 +216,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             result['created_at'] = result['created_at'].isoformat()
             result['updated_at'] = result['updated_at'].isoformat()
             
-            cur.execute('SELECT COUNT(*) FROM t_p76735805_video_surveillance_s.system_users WHERE role_id = %s', (role_id,))
-            result['users_count'] = cur.fetchone()[0]
-            
             conn.commit()
+            engine.invalidate(int(role_id))
             cur.close()
             conn.close()
             
@@ -225,6 +263,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
             
             conn.commit()
+            engine.invalidate(int(role_id))
             cur.close()
             conn.close()
             
@@ -0,0 +1,121 @@
+'''
+Движок проверки прав по roles.permissions.
+JSONB роли компилируется в frozenset путей вида "parameters.camera_sources.cameras.edit"
+для всех листьев со значением true. Скомпилированные роли кэшируются в памяти
+процесса по версии (roles.updated_at) и переживают тёплые вызовы функции.
+'''
+
+import json
+import time
+from typing import Dict, Any, FrozenSet, Optional, Tuple, Union
+from psycopg2.extras import RealDictCursor
+
+SCHEMA = 't_p76735805_video_surveillance_s'
+
+VERSION_TTL_SECONDS = 5.0
+USER_TTL_SECONDS = 30.0
+
+
+def compile_permissions(permissions: Any, prefix: str = '') -> FrozenSet[str]:
+    '''Разворачивает вложенный JSON прав в множество путей с разрешением'''
+    if isinstance(permissions, str):
+        permissions = json.loads(permissions)
+    granted = set()
+    if isinstance(permissions, dict):
+        for key, value in permissions.items():
+            path = f'{prefix}.{key}' if prefix else key
+            if value is True:
+                granted.add(path)
+            elif isinstance(value, dict):
+                granted |= compile_permissions(value, path)
+    return frozenset(granted)
+
+
+def permission_key(action: str, resource: str) -> str:
+    return f'{resource}.{action}' if resource else action
+
+
+def containment_filter(key: str) -> str:
+    '''JSON для поиска ролей через permissions @> ... по GIN-индексу'''
+    value: Any = True
+    for part in reversed(key.split('.')):
+        value = {part: value}
+    return json.dumps(value)
+
+
+class PermissionEngine:
+    def __init__(self) -> None:
+        self.roles: Dict[int, Tuple[Any, FrozenSet[str]]] = {}
+        self.versions: Dict[int, Any] = {}
+        self.versions_checked_at = 0.0
+        self.user_roles: Dict[int, Tuple[Optional[int], float]] = {}
+
+    def _sync_versions(self, cur) -> None:
+        if time.monotonic() - self.versions_checked_at < VERSION_TTL_SECONDS:
+            return
+        cur.execute(f'SELECT id, updated_at FROM {SCHEMA}.roles')
+        self.versions = {row['id']: row['updated_at'] for row in cur.fetchall()}
+        self.roles = {
+            role_id: compiled for role_id, compiled in self.roles.items()
+            if self.versions.get(role_id) == compiled[0]
+        }
+        self.versions_checked_at = time.monotonic()
+
+    def role_permissions(self, conn, role_id: Optional[int]) -> FrozenSet[str]:
+        if role_id is None:
+            return frozenset()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            self._sync_versions(cur)
+            cached = self.roles.get(role_id)
+            if cached:
+                return cached[1]
+            cur.execute(f'SELECT permissions, updated_at FROM {SCHEMA}.roles WHERE id = %s', (role_id,))
+            row = cur.fetchone()
+            if not row:
+                return frozenset()
+            compiled = compile_permissions(row['permissions'])
+            self.roles[role_id] = (row['updated_at'], compiled)
+            self.versions[role_id] = row['updated_at']
+            return compiled
+        finally:
+            cur.close()
+
+    def user_role(self, conn, user_id: int) -> Optional[int]:
+        cached = self.user_roles.get(user_id)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(f'SELECT role_id FROM {SCHEMA}.system_users WHERE id = %s', (user_id,))
+        row = cur.fetchone()
+        cur.close()
+        role_id = row['role_id'] if row else None
+        self.user_roles[user_id] = (role_id, time.monotonic() + USER_TTL_SECONDS)
+        return role_id
+
+    def check(self, conn, user: Union[int, Dict[str, Any]], action: str, resource: str = '') -> bool:
+        '''
+        user - ID пользователя, dict с role_id либо claims подписанного токена
+        (session_tokens.decode_token), где роль лежит в rid.
+        check(conn, 5, 'edit', 'parameters.camera_sources.cameras')
+        '''
+        if isinstance(user, dict):
+            role_id = user['role_id'] if 'role_id' in user else user.get('rid')
+        else:
+            role_id = self.user_role(conn, int(user))
+        return permission_key(action, resource) in self.role_permissions(conn, role_id)
+
+    def invalidate(self, role_id: Optional[int] = None) -> None:
+        if role_id is None:
+            self.roles.clear()
+            self.user_roles.clear()
+        else:
+            self.roles.pop(role_id, None)
+        self.versions_checked_at = 0.0
+
+
+engine = PermissionEngine()
+
+
+def check(conn, user: Union[int, Dict[str, Any]], action: str, resource: str = '') -> bool:
+    return engine.check(conn, user, action, resource)
@@ -0,0 +1,103 @@
+'''
+Business: Перенос истёкших сессий в секционированную историю и удаление старых секций
+Args: event - dict с httpMethod
+      context - объект с атрибутами request_id, function_name
+Returns: HTTP response dict с количеством перенесённых сессий и удалённых секций
+'''
+
+import json
+import os
+from typing import Dict, Any
+import db
+from psycopg2.extras import RealDictCursor
+
+DEFAULT_RETENTION_MONTHS = int(os.environ.get('SESSION_RETENTION_MONTHS', '6'))
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'POST')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    if method != 'POST':
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+    
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'DATABASE_URL not configured'}),
+            'isBase64Encoded': False
+        }
+    
+    try:
+        body_data = json.loads(event.get('body') or '{}')
+        retention_months = int(body_data.get('retention_months', DEFAULT_RETENTION_MONTHS))
+    except (ValueError, TypeError, AttributeError):
+        retention_months = 0
+    
+    # Нулевой срок удалил бы всю историю сессий и журнал посещений
+    if retention_months < 1:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'retention_months must be a positive integer'}),
+            'isBase64Encoded': False
+        }
+    
+    conn = db.connect(dsn)
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    
+    try:
+        cursor.execute(
+            'SELECT moved, dropped FROM t_p76735805_video_surveillance_s.reap_user_sessions(%s)',
+            (retention_months,)
+        )
+        result = dict(cursor.fetchone())
+        
+        # Журнал посещений разделов хранится столько же, сколько история сессий;
+        # дневная свёртка route_usage_daily не удаляется
+        cursor.execute('''
+            DELETE FROM t_p76735805_video_surveillance_s.route_visits
+            WHERE entered_at < date_trunc('month', NOW()) - make_interval(months => %s)
+        ''', (retention_months,))
+        result['visits_pruned'] = cursor.rowcount
+        conn.commit()
+        
+        print(f"Sessions reaped: {result}")
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps(result),
+            'isBase64Encoded': False
+        }
+    
+    except Exception as e:
+        conn.rollback()
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    
+    finally:
+        cursor.close()
+        conn.close()
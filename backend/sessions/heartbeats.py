@@ -0,0 +1,166 @@
+'''
+Буфер heartbeat-запросов сессий.
+Первый heartbeat сессии в процессе записывается сразу через
+INSERT ... ON CONFLICT (session_token) DO UPDATE, последующие только обновляют
+буфер в памяти. Фонового сброса нет: буфер сбрасывается одним
+UPDATE ... FROM (VALUES ...) при обработке запроса, если с прошлого сброса
+прошло FLUSH_INTERVAL_SECONDS, при переполнении и перед чтением списка сессий.
+Пока процесс не получает запросов, last_activity может отставать сильнее.
+Сессии, удалённые другим процессом, при сбросе создаются заново через upsert.
+Смена маршрута в том же запросе дописывает завершённое посещение в route_visits.
+jti подписанного токена запоминается в строке сессии, смена токена пишется сразу.
+'''
+
+import time
+from typing import Dict, Optional, Tuple
+from psycopg2.extras import RealDictCursor, execute_values
+
+SCHEMA = 't_p76735805_video_surveillance_s'
+
+FLUSH_INTERVAL_SECONDS = 5.0
+MAX_BUFFERED = 500
+MAX_KNOWN_SESSIONS = 20000
+SESSION_TTL = "INTERVAL '24 hours'"
+
+# session_token -> (id строки user_sessions, уже записанной этим процессом, jti токена)
+known_sessions: Dict[str, Tuple[int, Optional[str]]] = {}
+# session_token -> (user_id, ip_address, user_agent, current_route,
+# time.monotonic() момента heartbeat, jti токена, срок токена)
+pending: Dict[str, Tuple[int, str, str, str, float, Optional[str], Optional[int]]] = {}
+last_flush = time.monotonic()
+
+
+def upsert_session(conn, user_id: int, session_token: str, ip_address: str,
+                   user_agent: str, current_route: str,
+                   token_jti: Optional[str] = None, token_exp: Optional[int] = None) -> int:
+    '''Создаёт или продлевает сессию одним параметризованным запросом'''
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur.execute(f'''
+        WITH prev AS (
+            SELECT id, user_id, current_route, route_entered_at
+            FROM {SCHEMA}.user_sessions
+            WHERE session_token = %(token)s
+            FOR UPDATE
+        ), up AS (
+            INSERT INTO {SCHEMA}.user_sessions AS s
+            (user_id, session_token, ip_address, user_agent, current_route, route_entered_at, expires_at,
+             token_jti, token_expires_at)
+            VALUES (%(user_id)s, %(token)s, %(ip)s, %(ua)s, %(route)s, NOW(), NOW() + {SESSION_TTL},
+                    %(jti)s, to_timestamp(%(exp)s))
+            ON CONFLICT (session_token) DO UPDATE
+            SET current_route = EXCLUDED.current_route,
+                token_jti = COALESCE(EXCLUDED.token_jti, s.token_jti),
+                token_expires_at = COALESCE(EXCLUDED.token_expires_at, s.token_expires_at),
+                route_entered_at = CASE
+                    WHEN s.current_route IS DISTINCT FROM EXCLUDED.current_route THEN NOW()
+                    ELSE s.route_entered_at
+                END,
+                last_activity = NOW(),
+                expires_at = NOW() + {SESSION_TTL}
+            RETURNING id
+        ), visit AS (
+            INSERT INTO {SCHEMA}.route_visits (session_id, user_id, route, entered_at, left_at)
+            SELECT id, user_id, current_route, route_entered_at, NOW()
+            FROM prev
+            WHERE current_route IS NOT NULL
+              AND route_entered_at IS NOT NULL
+              AND current_route IS DISTINCT FROM %(route)s
+        )
+        SELECT id FROM up
+    ''', {'user_id': user_id, 'token': session_token, 'ip': ip_address, 'ua': user_agent, 'route': current_route,
+          'jti': token_jti, 'exp': token_exp})
+    session_id = cur.fetchone()['id']
+    cur.close()
+    if len(known_sessions) >= MAX_KNOWN_SESSIONS:
+        known_sessions.clear()
+    known_sessions[session_token] = (session_id, token_jti)
+    pending.pop(session_token, None)
+    return session_id
+
+
+def record_heartbeat(conn, user_id: int, session_token: str, ip_address: str,
+                     user_agent: str, current_route: str,
+                     token_jti: Optional[str] = None, token_exp: Optional[int] = None) -> int:
+    '''Возвращает id сессии; для известной сессии с тем же токеном только откладывает запись'''
+    known = known_sessions.get(session_token)
+    if known is None or (token_jti and known[1] != token_jti):
+        session_id = upsert_session(conn, user_id, session_token, ip_address, user_agent, current_route,
+                                    token_jti, token_exp)
+        conn.commit()
+        return session_id
+    session_id = known[0]
+
+    buffered = pending.get(session_token)
+    if buffered and buffered[3] != current_route:
+        # Промежуточный маршрут не должен потеряться при слиянии heartbeat
+        flush(conn, force=True)
+    pending[session_token] = (user_id, ip_address, user_agent, current_route, time.monotonic(),
+                              token_jti, token_exp)
+    flush(conn)
+    return session_id
+
+
+def flush(conn, force: bool = False) -> int:
+    '''Сбрасывает накопленные heartbeat одним UPDATE; возвращает число сессий'''
+    global last_flush
+    if not pending:
+        return 0
+    if not force and len(pending) < MAX_BUFFERED and time.monotonic() - last_flush < FLUSH_INTERVAL_SECONDS:
+        return 0
+
+    now = time.monotonic()
+    buffered = dict(pending)
+    batch = [(token, entry[3], now - entry[4]) for token, entry in buffered.items()]
+    pending.clear()
+    last_flush = now
+
+    cur = conn.cursor()
+    missing_rows = execute_values(cur, f'''
+        WITH v (session_token, route, age) AS (
+            VALUES %s
+        ), prev AS (
+            SELECT s.id, s.user_id, s.current_route, s.route_entered_at,
+                   v.route AS new_route, NOW() - v.age * INTERVAL '1 second' AS seen_at
+            FROM {SCHEMA}.user_sessions s
+            JOIN v ON v.session_token = s.session_token
+            WHERE s.last_activity < NOW() - v.age * INTERVAL '1 second'
+            FOR UPDATE OF s
+        ), upd AS (
+            UPDATE {SCHEMA}.user_sessions AS s
+            SET current_route = prev.new_route,
+                route_entered_at = CASE
+                    WHEN prev.current_route IS DISTINCT FROM prev.new_route THEN prev.seen_at
+                    ELSE s.route_entered_at
+                END,
+                last_activity = prev.seen_at,
+                expires_at = prev.seen_at + {SESSION_TTL}
+            FROM prev
+            WHERE s.id = prev.id
+        ), visit AS (
+            INSERT INTO {SCHEMA}.route_visits (session_id, user_id, route, entered_at, left_at)
+            SELECT id, user_id, current_route, route_entered_at, seen_at
+            FROM prev
+            WHERE current_route IS NOT NULL
+              AND route_entered_at IS NOT NULL
+              AND current_route IS DISTINCT FROM new_route
+        )
+        SELECT v.session_token FROM v
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {SCHEMA}.user_sessions s WHERE s.session_token = v.session_token
+        )
+    ''', batch, template='(%s, %s, %s::float8)', page_size=MAX_BUFFERED, fetch=True)
+    missing = [row[0] for row in missing_rows]
+    cur.close()
+
+    # Сессию удалили в другом процессе: UPDATE её не нашёл, heartbeat пишется upsert
+    for token in missing:
+        known_sessions.pop(token, None)
+        user_id, ip_address, user_agent, route, _, token_jti, token_exp = buffered[token]
+        upsert_session(conn, user_id, token, ip_address, user_agent, route, token_jti, token_exp)
+    conn.commit()
+    return len(batch)
+
+
+def forget(session_token: str) -> None:
+    known_sessions.pop(session_token, None)
+    pending.pop(session_token, None)
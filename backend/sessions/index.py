@@ -5,16 +5,92 @@
 
 import json
 import os
-from typing import Dict, Any
-import psycopg2
+from typing import Dict, Any, Optional
+import db
 from psycopg2.extras import RealDictCursor
 from datetime import datetime
+from session_tokens import token_from_event, verify_token, revoke_jti
+import heartbeats
+from presence import tracker
+
+# Список активных сессий выполняется как подготовленный оператор (db.execute_prepared)
+ACTIVE_SESSIONS_SQL = """
+    SELECT 
+        s.id,
+        s.user_id,
+        s.session_token,
+        s.ip_address,
+        s.user_agent,
+        s.current_route,
+        s.last_activity,
+        s.created_at,
+        u.full_name,
+        u.login,
+        u.email
+    FROM t_p76735805_video_surveillance_s.user_sessions s
+    JOIN t_p76735805_video_surveillance_s.system_users u ON s.user_id = u.id
+    WHERE s.expires_at > NOW()
+    ORDER BY s.last_activity DESC
+"""
+
+
+LOGIN_HISTORY_SQL = """
+    SELECT day, sessions, active_seconds
+    FROM t_p76735805_video_surveillance_s.login_history_daily
+    WHERE user_id = %s
+    ORDER BY day DESC
+    LIMIT 366
+"""
+
+
+def history_item(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {'day': row['day'].isoformat(), 'sessions': row['sessions'], 'active_seconds': row['active_seconds']}
+
+
+def route_usage_sql(group_by_day: bool) -> str:
+    day_column = 'day,' if group_by_day else ''
+    return f"""
+        SELECT {day_column} route, SUM(visits) AS visits, SUM(seconds) AS seconds,
+               COUNT(DISTINCT user_id) AS users
+        FROM t_p76735805_video_surveillance_s.route_usage_daily
+        WHERE day >= COALESCE(%s::date, CURRENT_DATE - 29)
+          AND day <= COALESCE(%s::date, CURRENT_DATE)
+          AND (%s::integer IS NULL OR user_id = %s::integer)
+        GROUP BY {day_column} route
+        ORDER BY {day_column} seconds DESC
+    """
+
+
+def invalid_user_param(params: Dict[str, Any]) -> Optional[str]:
+    '''Имя параметра с нечисловым id пользователя; значение уходит в SQL как integer'''
+    for key in ('history_user_id', 'user_id'):
+        value = params.get(key)
+        if value and not str(value).isdigit():
+            return key
+    return None
+
+
+def route_usage_params(params: Dict[str, Any]) -> tuple:
+    return (params.get('date_from'), params.get('date_to'), params.get('user_id'), params.get('user_id'))
+
+
+def route_usage_item(row: Dict[str, Any], group_by_day: bool) -> Dict[str, Any]:
+    item = {
+        'route': row['route'],
+        'visits': int(row['visits']),
+        'seconds': int(row['seconds']),
+        'users': row['users']
+    }
+    if group_by_day:
+        item['day'] = row['day'].isoformat()
+    return item
 
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Управление сессиями пользователей
-    GET - получить список активных сессий
+    GET - получить список активных сессий (?presence=online - пользователи в сети,
+          ?analytics=routes - время в разделах из дневной свёртки)
     POST - создать/обновить сессию
     DELETE - завершить сессию
     """
@@ -26,7 +102,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token, X-User-Id, X-Auth-Token, X-Min-LSN',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -34,29 +110,87 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        query = event.get('queryStringParameters') or {}
+        bad_param = invalid_user_param(query) if method == 'GET' else None
+        if bad_param:
+            return {
+                'statusCode': 400,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json.dumps({'error': f'{bad_param} должен быть числом'}),
+                'isBase64Encoded': False
+            }
+        if method == 'GET' and (query.get('history_user_id') or query.get('analytics') == 'routes'):
+            # Дневные свёртки только читаются и могут отдаваться репликой
+            conn = db.connect_read(os.environ['DATABASE_URL'], min_lsn=db.min_lsn_from_event(event))
+        else:
+            conn = db.connect(os.environ['DATABASE_URL'])
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        if method == 'GET':
+        if method == 'GET' and (event.get('queryStringParameters') or {}).get('history_user_id'):
+            # История входов пользователя из дневной свёртки
+            cur.execute(LOGIN_HISTORY_SQL, (int(event['queryStringParameters']['history_user_id']),))
+            result = [history_item(row) for row in cur.fetchall()]
+            
+            cur.close()
+            conn.close()
+            
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json.dumps(result),
+                'isBase64Encoded': False
+            }
+        
+        elif method == 'GET' and (event.get('queryStringParameters') or {}).get('analytics') == 'routes':
+            # Время в разделах по данным route_usage_daily, без обращения к user_sessions
+            params = event['queryStringParameters']
+            group_by_day = params.get('group_by') == 'day'
+            cur.execute(route_usage_sql(group_by_day), route_usage_params(params))
+            result = [route_usage_item(row, group_by_day) for row in cur.fetchall()]
+            
+            cur.close()
+            conn.close()
+            
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json.dumps(result),
+                'isBase64Encoded': False
+            }
+        
+        elif method == 'GET' and (event.get('queryStringParameters') or {}).get('presence') == 'online':
+            users = [dict(row) for row in tracker.online_users(conn)]
+            for user in users:
+                if user.get('last_seen_at'):
+                    user['last_seen_at'] = user['last_seen_at'].isoformat()
+            
+            cur.close()
+            conn.close()
+            
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json.dumps({'count': len(users), 'users': users}),
+                'isBase64Encoded': False
+            }
+        
+        elif method == 'GET':
+            heartbeats.flush(conn, force=True)
+            
             # Получить все активные сессии (не истекшие)
-            cur.execute('''
-                SELECT 
-                    s.id,
-                    s.user_id,
-                    s.session_token,
-                    s.ip_address,
-                    s.user_agent,
-                    s.current_route,
-                    s.last_activity,
-                    s.created_at,
-                    u.full_name,
-                    u.login,
-                    u.email
-                FROM t_p76735805_video_surveillance_s.user_sessions s
-                JOIN t_p76735805_video_surveillance_s.system_users u ON s.user_id = u.id
-                WHERE s.expires_at > NOW()
-                ORDER BY s.last_activity DESC
-            ''')
+            db.execute_prepared(cur, 'active_sessions', ACTIVE_SESSIONS_SQL)
             
             sessions = cur.fetchall()
             result = [dict(row) for row in sessions]
@@ -95,7 +229,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             except json.JSONDecodeError:
                 body_data = {}
             
-            user_id = body_data.get('user_id')
+            claims = verify_token(conn, token_from_event(event) or '')
+            user_id = claims['uid'] if claims else body_data.get('user_id')
             session_token = body_data.get('session_token')
             ip_address = body_data.get('ip_address', '')
             user_agent = body_data.get('user_agent', '')
@@ -112,45 +247,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            # Экранирование данных
-            session_token_escaped = session_token.replace("'", "''")
-            ip_escaped = ip_address.replace("'", "''") if ip_address else ''
-            user_agent_escaped = user_agent.replace("'", "''") if user_agent else ''
-            route_escaped = current_route.replace("'", "''") if current_route else '/'
-            
-            # Проверяем существующую сессию
-            check_query = f"""
-                SELECT id FROM t_p76735805_video_surveillance_s.user_sessions 
-                WHERE session_token = '{session_token_escaped}'
-            """
-            cur.execute(check_query)
-            existing = cur.fetchone()
-            
-            if existing:
-                # Обновляем существующую сессию
-                update_query = f"""
-                    UPDATE t_p76735805_video_surveillance_s.user_sessions 
-                    SET current_route = '{route_escaped}',
-                        last_activity = NOW(),
-                        expires_at = NOW() + INTERVAL '24 hours'
-                    WHERE session_token = '{session_token_escaped}'
-                    RETURNING id
-                """
-                cur.execute(update_query)
-                conn.commit()
-                session_id = cur.fetchone()['id']
-            else:
-                # Создаем новую сессию
-                insert_query = f"""
-                    INSERT INTO t_p76735805_video_surveillance_s.user_sessions 
-                    (user_id, session_token, ip_address, user_agent, current_route, expires_at)
-                    VALUES ({user_id}, '{session_token_escaped}', '{ip_escaped}', 
-                            '{user_agent_escaped}', '{route_escaped}', NOW() + INTERVAL '24 hours')
-                    RETURNING id
-                """
-                cur.execute(insert_query)
-                conn.commit()
-                session_id = cur.fetchone()['id']
+            session_id = heartbeats.record_heartbeat(
+                conn, int(user_id), session_token, ip_address or '', user_agent or '', current_route or '/',
+                claims['jti'] if claims else None, claims['exp'] if claims else None
+            )
+            tracker.touch(int(user_id))
+            tracker.sync(conn)
             
             cur.close()
             conn.close()
@@ -181,17 +283,34 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            token_escaped = session_token.replace("'", "''")
+            heartbeats.forget(session_token)
             
             # Устанавливаем expires_at в прошлое для завершения сессии
-            delete_query = f"""
-                UPDATE t_p76735805_video_surveillance_s.user_sessions 
+            cur.execute('''
+                UPDATE t_p76735805_video_surveillance_s.user_sessions s
                 SET expires_at = NOW() - INTERVAL '1 hour'
-                WHERE session_token = '{token_escaped}'
-            """
-            cur.execute(delete_query)
+                WHERE session_token = %s
+                RETURNING s.user_id, s.token_jti,
+                    EXTRACT(EPOCH FROM s.token_expires_at)::bigint AS token_exp,
+                    EXISTS (
+                    SELECT 1 FROM t_p76735805_video_surveillance_s.user_sessions o
+                    WHERE o.user_id = s.user_id
+                      AND o.session_token <> s.session_token
+                      AND o.expires_at > NOW()
+                ) AS has_other_sessions
+            ''', (session_token,))
+            ended = cur.fetchone()
+            # Отзывается токен завершаемой сессии: у администратора, завершающего
+            # чужую сессию, в заголовке свой токен, и его трогать нельзя
+            if ended and ended['token_jti']:
+                revoke_jti(conn, ended['token_jti'], ended['user_id'], ended['token_exp'])
             conn.commit()
             
+            # Последняя сессия пользователя завершена - он больше не в сети
+            if ended and ended['user_id'] is not None and not ended['has_other_sessions']:
+                tracker.leave(int(ended['user_id']))
+                tracker.sync(conn, force=True)
+            
             cur.close()
             conn.close()
             
@@ -0,0 +1,69 @@
+"""
+Асинхронный вариант API сессий на пуле psycopg 3
+История входов (?history_user_id=) и время в разделах (?analytics=routes)
+читаются в цикле событий. Список сессий, присутствие и запись работают с
+буферами heartbeat и присутствия процесса и передаются синхронному
+index.handler в потоке по одному вызову за раз (adb.run_sync).
+"""
+
+import json
+import os
+from typing import Dict, Any
+import adb
+import index
+
+
+async def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+    params = event.get('queryStringParameters') or {}
+    
+    if method != 'GET' or not os.environ.get('DATABASE_URL'):
+        return await adb.run_sync(index.handler, event, context)
+    
+    bad_param = index.invalid_user_param(params)
+    if bad_param:
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': f'{bad_param} должен быть числом'}),
+            'isBase64Encoded': False
+        }
+    
+    try:
+        if params.get('history_user_id'):
+            async with adb.connection() as conn:
+                cur = await conn.execute(index.LOGIN_HISTORY_SQL, (int(params['history_user_id']),))
+                result = [index.history_item(row) for row in await cur.fetchall()]
+        
+        elif params.get('analytics') == 'routes':
+            group_by_day = params.get('group_by') == 'day'
+            async with adb.connection() as conn:
+                cur = await conn.execute(index.route_usage_sql(group_by_day), index.route_usage_params(params))
+                result = [index.route_usage_item(row, group_by_day) for row in await cur.fetchall()]
+        
+        else:
+            return await adb.run_sync(index.handler, event, context)
+    
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps(result),
+        'isBase64Encoded': False
+    }
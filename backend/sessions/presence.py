@@ -0,0 +1,129 @@
+'''
+Присутствие пользователей в сети.
+Последний heartbeat каждого пользователя хранится в памяти процесса вместе с
+кучей сроков истечения (ленивое удаление устаревших записей). Изменения
+присутствия сбрасываются в system_users одним UPDATE ... FROM (VALUES ...) не
+чаще раза в SYNC_INTERVAL_SECONDS; там же снимается is_online с пользователей,
+которых не видел ни один экземпляр функции дольше PRESENCE_TTL_SECONDS.
+Пользователь, завершивший последнюю сессию (leave), снимается с is_online
+при ближайшей синхронизации без ожидания PRESENCE_TTL_SECONDS.
+'''
+
+import heapq
+import time
+from typing import Dict, List, Set, Tuple
+from psycopg2.extras import RealDictCursor, execute_values
+
+SCHEMA = 't_p76735805_video_surveillance_s'
+
+# Клиент шлёт heartbeat раз в 30 секунд; три пропуска подряд - пользователь не в сети
+PRESENCE_TTL_SECONDS = 90.0
+SYNC_INTERVAL_SECONDS = 10.0
+
+
+class PresenceTracker:
+    def __init__(self) -> None:
+        # user_id -> time.monotonic() последнего heartbeat
+        self.last_seen: Dict[int, float] = {}
+        # (момент истечения, user_id); устаревшие записи отбрасываются при извлечении
+        self.expiry: List[Tuple[float, int]] = []
+        # Пользователи, чьё присутствие ещё не записано в БД: user_id -> онлайн
+        self.dirty: Dict[int, bool] = {}
+        # Пользователи, вышедшие из системы после последней синхронизации
+        self.left: Set[int] = set()
+        self.synced_at = time.monotonic()
+
+    def touch(self, user_id: int) -> None:
+        now = time.monotonic()
+        # Пакет на синхронизацию содержит не больше одной строки на пользователя
+        self.dirty[user_id] = True
+        self.left.discard(user_id)
+        self.last_seen[user_id] = now
+        heapq.heappush(self.expiry, (now + PRESENCE_TTL_SECONDS, user_id))
+
+    def leave(self, user_id: int) -> None:
+        '''Пользователь вышел: is_online снимается, даже если heartbeat был недавно'''
+        self.last_seen.pop(user_id, None)
+        self.dirty.pop(user_id, None)
+        self.left.add(user_id)
+
+    def expire(self) -> None:
+        '''Извлекает из кучи истёкшие записи за O(k log n)'''
+        now = time.monotonic()
+        while self.expiry and self.expiry[0][0] <= now:
+            deadline, user_id = heapq.heappop(self.expiry)
+            seen = self.last_seen.get(user_id)
+            if seen is not None and seen + PRESENCE_TTL_SECONDS <= now:
+                del self.last_seen[user_id]
+                self.dirty[user_id] = False
+        # Куча хранит по записи на heartbeat; пересобираем, когда мусора становится много
+        if len(self.expiry) > 4 * len(self.last_seen) + 1024:
+            self.expiry = [(seen + PRESENCE_TTL_SECONDS, user_id) for user_id, seen in self.last_seen.items()]
+            heapq.heapify(self.expiry)
+
+    def online(self) -> Set[int]:
+        self.expire()
+        return set(self.last_seen)
+
+    def sync(self, conn, force: bool = False) -> int:
+        '''Записывает изменения присутствия одним запросом; возвращает число строк в пакете'''
+        self.expire()
+        if not force and time.monotonic() - self.synced_at < SYNC_INTERVAL_SECONDS:
+            return 0
+
+        now = time.monotonic()
+        batch = [
+            (user_id, online, now - self.last_seen.get(user_id, now))
+            for user_id, online in self.dirty.items()
+        ]
+        left = sorted(self.left)
+        self.dirty.clear()
+        self.left.clear()
+        self.synced_at = now
+
+        cur = conn.cursor()
+        if batch:
+            execute_values(cur, f'''
+                UPDATE {SCHEMA}.system_users AS u
+                SET is_online = v.online,
+                    last_seen_at = CASE
+                        WHEN v.online THEN GREATEST(u.last_seen_at, NOW() - v.age * INTERVAL '1 second')
+                        ELSE u.last_seen_at
+                    END
+                FROM (VALUES %s) AS v(id, online, age)
+                WHERE u.id = v.id
+                  AND (v.online OR u.last_seen_at IS NULL
+                       OR u.last_seen_at < NOW() - INTERVAL '{int(PRESENCE_TTL_SECONDS)} seconds')
+            ''', batch, template='(%s, %s, %s::float8)')
+        if left:
+            cur.execute(
+                f'UPDATE {SCHEMA}.system_users SET is_online = false WHERE id = ANY(%s::integer[])',
+                (left,)
+            )
+        # Пользователи, heartbeat которых не получил ни один экземпляр функции
+        cur.execute(f'''
+            UPDATE {SCHEMA}.system_users
+            SET is_online = false
+            WHERE is_online
+              AND (last_seen_at IS NULL OR last_seen_at < NOW() - %s * INTERVAL '1 second')
+        ''', (PRESENCE_TTL_SECONDS,))
+        cur.close()
+        conn.commit()
+        return len(batch) + len(left)
+
+    def online_users(self, conn) -> List[Dict]:
+        '''Пользователи в сети: локальные heartbeat плюс отмеченные другими экземплярами'''
+        self.sync(conn)
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(f'''
+            SELECT id, full_name, login, last_seen_at
+            FROM {SCHEMA}.system_users
+            WHERE is_online OR id = ANY(%s::integer[])
+            ORDER BY full_name
+        ''', (sorted(self.online()),))
+        users = cur.fetchall()
+        cur.close()
+        return users
+
+
+tracker = PresenceTracker()
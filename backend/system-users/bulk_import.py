@@ -0,0 +1,187 @@
+'''
+Массовый импорт пользователей из JSON-списка или CSV.
+Все строки проверяются пакетом: обязательные поля, дубликаты внутри файла,
+уже занятые логины и email (один запрос), имена ролей и групп (один запрос на
+таблицу). Пароли хэшируются параллельно, вставка выполняется одним
+INSERT ... VALUES через execute_values. Возвращается отчёт по каждой строке.
+'''
+
+import csv
+import io
+from typing import Dict, Any, List, Optional, Tuple
+from psycopg2.extras import execute_values
+from passwords import hash_passwords
+
+MAX_ROWS = 2000
+
+REQUIRED_FIELDS = ('full_name', 'email', 'login', 'password')
+TEXT_FIELDS = ('full_name', 'position', 'email', 'login', 'password', 'company',
+               'work_phone', 'mobile_phone', 'note')
+
+# поле-ссылка -> (поле с именем, таблица)
+REFERENCES = {
+    'role_id': ('role', 'roles'),
+    'user_group_id': ('user_group', 'user_groups'),
+    'camera_group_id': ('camera_group', 'camera_groups'),
+}
+
+
+def parse_rows(body: Dict[str, Any]) -> List[Dict[str, Any]]:
+    '''Строки из body.users (список объектов) или body.csv (текст с заголовком)'''
+    if body.get('csv'):
+        text = body['csv']
+        dialect = csv.Sniffer().sniff(text.split('\n', 1)[0], delimiters=',;\t')
+        return [dict(row) for row in csv.DictReader(io.StringIO(text), dialect=dialect)]
+    users = body.get('users')
+    if not isinstance(users, list):
+        raise ValueError('users (list) or csv is required')
+    return users
+
+
+def _clean(raw: Dict[str, Any]) -> Dict[str, Any]:
+    row: Dict[str, Any] = {}
+    for field in TEXT_FIELDS:
+        value = raw.get(field)
+        row[field] = str(value).strip() if value not in (None, '') else None
+    for id_field, (name_field, _) in REFERENCES.items():
+        value = raw.get(id_field)
+        row[id_field] = int(value) if value not in (None, '') else None
+        name = raw.get(name_field)
+        row[name_field] = str(name).strip() if name not in (None, '') else None
+    return row
+
+
+def _lookup(cur, table: str, names: List[str], ids: List[int]) -> Tuple[Dict[str, int], Dict[int, str]]:
+    '''Один запрос на таблицу: id по именам и имена по id'''
+    if not names and not ids:
+        return {}, {}
+    cur.execute(f'SELECT id, name FROM {table} WHERE name = ANY(%s) OR id = ANY(%s::integer[])',
+                (names, ids))
+    by_name: Dict[str, int] = {}
+    by_id: Dict[int, str] = {}
+    for row_id, name in cur.fetchall():
+        by_name.setdefault(name, row_id)
+        by_id[row_id] = name
+    return by_name, by_id
+
+
+def import_users(conn, raw_rows: List[Dict[str, Any]], dry_run: bool = False) -> Dict[str, Any]:
+    if len(raw_rows) > MAX_ROWS:
+        raise ValueError(f'Too many rows: {len(raw_rows)} (max {MAX_ROWS})')
+
+    report: List[Dict[str, Any]] = []
+    rows: List[Dict[str, Any]] = []
+    for index, raw in enumerate(raw_rows, start=1):
+        entry = {'row': index, 'login': raw.get('login') if isinstance(raw, dict) else None, 'status': 'error'}
+        report.append(entry)
+        if not isinstance(raw, dict):
+            entry['error'] = 'row must be an object'
+            continue
+        try:
+            row = _clean(raw)
+        except (TypeError, ValueError) as e:
+            entry['error'] = f'Invalid value: {e}'
+            continue
+        missing = [field for field in REQUIRED_FIELDS if not row[field]]
+        if missing:
+            entry['error'] = f'{", ".join(missing)} is required'
+            continue
+        row['_entry'] = entry
+        rows.append(row)
+
+    cur = conn.cursor()
+    seen_logins: Dict[str, int] = {}
+    seen_emails: Dict[str, int] = {}
+    logins = [row['login'] for row in rows]
+    emails = [row['email'] for row in rows]
+    cur.execute('SELECT login, email FROM system_users WHERE login = ANY(%s) OR email = ANY(%s)',
+                (logins, emails))
+    taken_logins, taken_emails = set(), set()
+    for login, email in cur.fetchall():
+        taken_logins.add(login)
+        taken_emails.add(email)
+
+    lookups = {}
+    for id_field, (name_field, table) in REFERENCES.items():
+        names = sorted({row[name_field] for row in rows if row[name_field]})
+        ids = sorted({row[id_field] for row in rows if row[id_field]})
+        lookups[id_field] = _lookup(cur, table, names, ids)
+
+    valid: List[Dict[str, Any]] = []
+    for row in rows:
+        entry = row['_entry']
+        error: Optional[str] = None
+        if row['login'] in taken_logins:
+            error = 'login already exists'
+        elif row['email'] in taken_emails:
+            error = 'email already exists'
+        elif row['login'] in seen_logins:
+            error = f'duplicate login (row {seen_logins[row["login"]]})'
+        elif row['email'] in seen_emails:
+            error = f'duplicate email (row {seen_emails[row["email"]]})'
+        seen_logins.setdefault(row['login'], entry['row'])
+        seen_emails.setdefault(row['email'], entry['row'])
+
+        for id_field, (name_field, _) in REFERENCES.items():
+            by_name, by_id = lookups[id_field]
+            if error:
+                break
+            if row[name_field] and not row[id_field]:
+                row[id_field] = by_name.get(row[name_field])
+                if row[id_field] is None:
+                    error = f'{name_field} not found: {row[name_field]}'
+            elif row[id_field] and row[id_field] not in by_id:
+                error = f'{id_field} not found: {row[id_field]}'
+            if row[id_field]:
+                row[name_field] = by_id.get(row[id_field], row[name_field])
+
+        if error:
+            entry['error'] = error
+        else:
+            valid.append(row)
+
+    created = 0
+    if valid and not dry_run:
+        password_hashes = hash_passwords([row['password'] for row in valid])
+        inserted = execute_values(cur, '''
+            INSERT INTO system_users
+            (full_name, position, email, login, password_hash, company, role_id,
+             user_group_id, camera_group_id, work_phone, mobile_phone, note)
+            VALUES %s
+            ON CONFLICT DO NOTHING
+            RETURNING id, login
+        ''', [
+            (row['full_name'], row['position'], row['email'], row['login'], password_hash,
+             row['company'], row['role_id'], row['user_group_id'], row['camera_group_id'],
+             row['work_phone'], row['mobile_phone'], row['note'])
+            for row, password_hash in zip(valid, password_hashes)
+        ], page_size=len(valid), fetch=True)
+        ids_by_login = {login: user_id for user_id, login in inserted}
+        for row in valid:
+            entry = row['_entry']
+            user_id = ids_by_login.get(row['login'])
+            if user_id is None:
+                # Логин или email заняли параллельно с импортом
+                entry['error'] = 'login or email already exists'
+                continue
+            entry.update({
+                'status': 'created',
+                'id': user_id,
+                'role_name': row['role'],
+                'user_group_name': row['user_group'],
+                'camera_group_name': row['camera_group'],
+            })
+            created += 1
+        conn.commit()
+    elif dry_run:
+        for row in valid:
+            row['_entry']['status'] = 'valid'
+    cur.close()
+
+    return {
+        'total': len(report),
+        'created': created,
+        'failed': sum(1 for entry in report if entry['status'] == 'error'),
+        'dry_run': dry_run,
+        'results': report,
+    }
@@ -1,12 +1,34 @@
+import csv
 import json
 import os
-import psycopg2
+import db
 from typing import Dict, Any
 from datetime import datetime
-import hashlib
+from passwords import hash_password, verify_password, PasswordHasherBusy
+from bulk_import import parse_rows, import_users
+from returning import write_returning_json, select_json
+from user_directory import is_page_request, list_page
 
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+USER_PROJECTION = '''
+    u.id, u.full_name, u.position, u.email, u.login, u.company,
+    u.role_id, r.name AS role_name,
+    u.user_group_id, ug.name AS user_group_name,
+    u.camera_group_id, cg.name AS camera_group_name,
+    u.work_phone, u.mobile_phone, u.note, u.attached_files, u.attachment_ids,
+    u.is_online, u.last_login, u.created_at, u.updated_at
+'''
+
+# Сохраняются только id существующих вложений
+ATTACHMENT_IDS_SQL = '''ARRAY(
+    SELECT a.id FROM t_p76735805_video_surveillance_s.attachments a
+    WHERE a.id = ANY(%s::integer[]) ORDER BY a.id
+)'''
+
+USER_JOINS = '''
+    LEFT JOIN roles r ON u.role_id = r.id
+    LEFT JOIN user_groups ug ON u.user_group_id = ug.id
+    LEFT JOIN camera_groups cg ON u.camera_group_id = cg.id
+'''
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -32,7 +54,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     try:
         dsn = os.environ['DATABASE_URL']
-        conn = psycopg2.connect(dsn)
+        conn = db.connect(dsn)
         cur = conn.cursor()
         
         if method == 'GET':
@@ -40,18 +62,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             user_id = query_params.get('id') if query_params else None
             
             if user_id:
-                cur.execute('''
-                    SELECT u.id, u.full_name, u.position, u.email, u.login, u.company, 
-                           u.role_id, r.name as role_name,
-                           u.user_group_id, ug.name as user_group_name,
-                           u.camera_group_id, cg.name as camera_group_name,
-                           u.work_phone, u.mobile_phone, u.note, u.attached_files,
-                           u.is_online, u.last_login, u.created_at, u.updated_at
-                    FROM system_users u
-                    LEFT JOIN roles r ON u.role_id = r.id
-                    LEFT JOIN user_groups ug ON u.user_group_id = ug.id
-                    LEFT JOIN camera_groups cg ON u.camera_group_id = cg.id
-                    WHERE u.id = %s
+                cur.execute(f'''
+                    SELECT row_to_json(user_row)::text
+                    FROM (SELECT {USER_PROJECTION} FROM system_users u {USER_JOINS} WHERE u.id = %s) AS user_row
                 ''', (user_id,))
                 row = cur.fetchone()
                 
@@ -63,36 +76,26 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
-                columns = [desc[0] for desc in cur.description]
-                result = dict(zip(columns, row))
-                
-                for date_field in ['last_login', 'created_at', 'updated_at']:
-                    if result.get(date_field):
-                        result[date_field] = result[date_field].isoformat()
+                result = row[0]
+            elif is_page_request(query_params or {}):
+                try:
+                    result = json.dumps(list_page(cur, query_params, USER_PROJECTION, USER_JOINS))
+                except ValueError as e:
+                    cur.close()
+                    conn.close()
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': str(e)}),
+                        'isBase64Encoded': False
+                    }
             else:
-                cur.execute('''
-                    SELECT u.id, u.full_name, u.position, u.email, u.login, u.company, 
-                           u.role_id, r.name as role_name,
-                           u.user_group_id, ug.name as user_group_name,
-                           u.camera_group_id, cg.name as camera_group_name,
-                           u.work_phone, u.mobile_phone, u.note, u.attached_files,
-                           u.is_online, u.last_login, u.created_at, u.updated_at
+                result = select_json(cur, f'''
+                    SELECT {USER_PROJECTION}
                     FROM system_users u
-                    LEFT JOIN roles r ON u.role_id = r.id
-                    LEFT JOIN user_groups ug ON u.user_group_id = ug.id
-                    LEFT JOIN camera_groups cg ON u.camera_group_id = cg.id
+                    {USER_JOINS}
                     ORDER BY u.created_at DESC
                 ''')
-                rows = cur.fetchall()
-                columns = [desc[0] for desc in cur.description]
-                result = []
-                
-                for row in rows:
-                    user = dict(zip(columns, row))
-                    for date_field in ['last_login', 'created_at', 'updated_at']:
-                        if user.get(date_field):
-                            user[date_field] = user[date_field].isoformat()
-                    result.append(user)
             
             cur.close()
             conn.close()
@@ -100,7 +103,32 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result),
+                'body': result,
+                'isBase64Encoded': False
+            }
+        
+        elif method == 'POST' and json.loads(event.get('body') or '{}').get('action') == 'import':
+            body = json.loads(event.get('body', '{}'))
+            
+            try:
+                report = import_users(conn, parse_rows(body), dry_run=bool(body.get('dry_run')))
+            except (ValueError, csv.Error) as e:
+                cur.close()
+                conn.close()
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': str(e)}),
+                    'isBase64Encoded': False
+                }
+            
+            cur.close()
+            conn.close()
+            
+            return {
+                'statusCode': 200 if body.get('dry_run') or not report['created'] else 201,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps(report),
                 'isBase64Encoded': False
             }
         
@@ -119,15 +147,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             password_hash = hash_password(body['password'])
             
-            cur.execute('''
+            result = write_returning_json(cur, f'''
                 INSERT INTO system_users 
                 (full_name, position, email, login, password_hash, company, role_id, 
                  user_group_id, camera_group_id, work_phone, mobile_phone, 
-                 note, attached_files, created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id, full_name, position, email, login, company, role_id, 
-                          user_group_id, camera_group_id, work_phone, mobile_phone,
-                          note, attached_files, is_online, last_login, created_at, updated_at
+                 note, attached_files, attachment_ids, created_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, {ATTACHMENT_IDS_SQL}, %s, %s)
             ''', (
                 body['full_name'],
                 body.get('position'),
@@ -142,29 +167,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 body.get('mobile_phone'),
                 body.get('note'),
                 body.get('attached_files'),
+                [int(i) for i in body.get('attachment_ids') or []],
                 datetime.utcnow(),
                 datetime.utcnow()
-            ))
-            
-            row = cur.fetchone()
-            columns = [desc[0] for desc in cur.description]
-            result = dict(zip(columns, row))
-            
-            for date_field in ['last_login', 'created_at', 'updated_at']:
-                if result.get(date_field):
-                    result[date_field] = result[date_field].isoformat()
-            
-            cur.execute('SELECT name FROM roles WHERE id = %s', (result.get('role_id'),))
-            role_row = cur.fetchone()
-            result['role_name'] = role_row[0] if role_row else None
-            
-            cur.execute('SELECT name FROM user_groups WHERE id = %s', (result.get('user_group_id'),))
-            ug_row = cur.fetchone()
-            result['user_group_name'] = ug_row[0] if ug_row else None
-            
-            cur.execute('SELECT name FROM camera_groups WHERE id = %s', (result.get('camera_group_id'),))
-            cg_row = cur.fetchone()
-            result['camera_group_name'] = cg_row[0] if cg_row else None
+            ), USER_PROJECTION, USER_JOINS, alias='u')
             
             conn.commit()
             cur.close()
@@ -173,7 +179,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 201,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result),
+                'body': result,
                 'isBase64Encoded': False
             }
         
@@ -215,11 +221,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     updates.append(f'{db_field} = %s')
                     values.append(body[field])
             
+            if 'attachment_ids' in body:
+                updates.append(f'attachment_ids = {ATTACHMENT_IDS_SQL}')
+                values.append([int(i) for i in body['attachment_ids'] or []])
+            
             if 'password' in body and body['password']:
                 if 'current_password' in body:
                     cur.execute('SELECT password_hash FROM system_users WHERE id = %s', (user_id,))
                     row = cur.fetchone()
-                    if not row or row[0] != hash_password(body['current_password']):
+                    if not row or not verify_password(body['current_password'], row[0]):
                         cur.close()
                         conn.close()
                         return {
@@ -235,17 +245,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             values.append(datetime.utcnow())
             values.append(user_id)
             
-            cur.execute(f'''
+            result = write_returning_json(cur, f'''
                 UPDATE system_users 
                 SET {', '.join(updates)}
                 WHERE id = %s
-                RETURNING id, full_name, email, login, company, role_id, 
-                          user_group_id, camera_group_id, work_phone, mobile_phone,
-                          is_online, last_login, created_at, updated_at
-            ''', values)
+            ''', values, USER_PROJECTION, USER_JOINS, alias='u')
             
-            row = cur.fetchone()
-            if not row:
+            if not result:
                 return {
                     'statusCode': 404,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -253,25 +259,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            columns = [desc[0] for desc in cur.description]
-            result = dict(zip(columns, row))
-            
-            for date_field in ['last_login', 'created_at', 'updated_at']:
-                if result.get(date_field):
-                    result[date_field] = result[date_field].isoformat()
-            
-            cur.execute('SELECT name FROM roles WHERE id = %s', (result.get('role_id'),))
-            role_row = cur.fetchone()
-            result['role_name'] = role_row[0] if role_row else None
-            
-            cur.execute('SELECT name FROM user_groups WHERE id = %s', (result.get('user_group_id'),))
-            ug_row = cur.fetchone()
-            result['user_group_name'] = ug_row[0] if ug_row else None
-            
-            cur.execute('SELECT name FROM camera_groups WHERE id = %s', (result.get('camera_group_id'),))
-            cg_row = cur.fetchone()
-            result['camera_group_name'] = cg_row[0] if cg_row else None
-            
             conn.commit()
             cur.close()
             conn.close()
@@ -279,7 +266,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result),
+                'body': result,
                 'isBase64Encoded': False
             }
         
@@ -324,6 +311,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    except PasswordHasherBusy as e:
+        return {
+            'statusCode': 503,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Retry-After': '1'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    
     except Exception as e:
         return {
             'statusCode': 500,
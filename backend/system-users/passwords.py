@@ -0,0 +1,135 @@
+'''
+Хэширование паролей.
+Текущий формат - scrypt со случайной солью:
+    scrypt$<n>$<r>$<p>$<соль base64>$<хэш base64>
+Старые хэши - SHA-256 без соли (64 hex-символа); они принимаются при входе и
+перехэшируются после успешной проверки. Вычисление scrypt выполняется в
+ограниченном пуле потоков (hashlib.scrypt отпускает GIL) с лимитом очереди и
+таймаутом ожидания, чтобы всплеск входов не блокировал обработчик.
+'''
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import List, Optional, Tuple
+
+SCRYPT_N = int(os.environ.get('PASSWORD_SCRYPT_N', 2 ** 14))
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+HASH_QUEUE_LIMIT = HASH_WORKERS * 8
+HASH_TIMEOUT_SECONDS = 5.0
+# Общий срок пакетного хэширования, не зависящий от числа паролей
+BULK_HASH_TIMEOUT_SECONDS = 60.0
+
+
+class PasswordHasherBusy(RuntimeError):
+    '''Очередь вычисления хэшей переполнена или не успела за таймаут'''
+
+
+_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='scrypt')
+_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE_LIMIT)
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def _derive(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p, dklen=KEY_BYTES)
+
+
+def _submit(password: str, salt: bytes, n: int, r: int, p: int, wait: Optional[float] = None) -> Future:
+    '''Занимает слот очереди и ставит вычисление в пул; wait - сколько ждать слота'''
+    acquired = _slots.acquire(blocking=False) if wait is None else _slots.acquire(timeout=max(wait, 0))
+    if not acquired:
+        raise PasswordHasherBusy('Password hashing queue is full')
+    try:
+        future = _pool.submit(_derive, password, salt, n, r, p)
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+def _run(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    future = _submit(password, salt, n, r, p)
+    try:
+        return future.result(timeout=HASH_TIMEOUT_SECONDS)
+    except FutureTimeout:
+        future.cancel()
+        raise PasswordHasherBusy('Password hashing timed out')
+
+
+def _parse(stored: str) -> Tuple[int, int, int, bytes, bytes]:
+    _, n, r, p, salt, key = stored.split('$')
+    return int(n), int(r), int(p), base64.b64decode(salt), base64.b64decode(key)
+
+
+def hash_password(password: str) -> str:
+    salt = secrets.token_bytes(SALT_BYTES)
+    key = _run(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f'scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(key)}'
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    '''
+    Пакетное хэширование (импорт пользователей) на том же пуле. Каждый пароль
+    занимает слот очереди, а в работе одновременно не больше HASH_WORKERS
+    паролей пакета, так что входам остаётся место в очереди.
+    '''
+    salts = [secrets.token_bytes(SALT_BYTES) for _ in passwords]
+    deadline = time.monotonic() + BULK_HASH_TIMEOUT_SECONDS
+    futures: List[Future] = []
+    try:
+        for index, (password, salt) in enumerate(zip(passwords, salts)):
+            if index >= HASH_WORKERS:
+                futures[index - HASH_WORKERS].result(timeout=max(deadline - time.monotonic(), 0))
+            futures.append(_submit(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P, wait=deadline - time.monotonic()))
+        keys = [future.result(timeout=max(deadline - time.monotonic(), 0)) for future in futures]
+    except (FutureTimeout, PasswordHasherBusy):
+        for future in futures:
+            future.cancel()
+        raise PasswordHasherBusy('Password hashing timed out')
+    return [
+        f'scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(key)}'
+        for salt, key in zip(salts, keys)
+    ]
+
+
+def verify_password(password: str, stored: str) -> bool:
+    if not stored:
+        return False
+    if stored.startswith('scrypt$'):
+        try:
+            n, r, p, salt, key = _parse(stored)
+        except (ValueError, TypeError):
+            return False
+        return hmac.compare_digest(_run(password, salt, n, r, p), key)
+    # Устаревший формат: SHA-256 без соли
+    return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+
+
+def needs_rehash(stored: str) -> bool:
+    '''True для устаревшего формата и для scrypt с параметрами ниже текущих'''
+    if not stored or not stored.startswith('scrypt$'):
+        return True
+    try:
+        n, r, p, _, _ = _parse(stored)
+    except (ValueError, TypeError):
+        return True
+    return n < SCRYPT_N or r < SCRYPT_R or p < SCRYPT_P
+
+
+# Хэш для выравнивания времени ответа, когда логин не найден
+DUMMY_HASH = f'scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(bytes(SALT_BYTES))}${_b64(bytes(KEY_BYTES))}'
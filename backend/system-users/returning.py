@@ -0,0 +1,35 @@
+'''
+Запись с возвратом обогащённой строки за один запрос.
+INSERT/UPDATE/DELETE оборачивается в CTE, к RETURNING присоединяются
+справочники, и результат сразу сериализуется в JSON на стороне PostgreSQL
+(даты - в ISO 8601), поэтому обработчику не нужны дополнительные SELECT и
+преобразования в Python. Модуль не зависит от таблиц и копируется в другие
+функции как есть.
+'''
+
+from typing import Any, Optional, Sequence
+
+
+def write_returning_json(cur, write_sql: str, params: Sequence[Any], projection: str,
+                         joins: str = '', alias: str = 'w') -> Optional[str]:
+    '''
+    write_sql - INSERT/UPDATE/DELETE без RETURNING;
+    projection и joins ссылаются на записанную строку через alias.
+    Возвращает JSON-объект строкой или None, если ни одна строка не затронута.
+    '''
+    cur.execute(f'''
+        WITH {alias} AS (
+            {write_sql}
+            RETURNING *
+        )
+        SELECT row_to_json(enriched)::text
+        FROM (SELECT {projection} FROM {alias} {joins}) AS enriched
+    ''', params)
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def select_json(cur, sql: str, params: Sequence[Any] = ()) -> str:
+    '''Выполняет SELECT и возвращает все строки одним JSON-массивом'''
+    cur.execute(f'SELECT COALESCE(json_agg(rows), \'[]\')::text FROM ({sql}) AS rows', params)
+    return cur.fetchone()[0]
@@ -0,0 +1,100 @@
+'''
+Постраничный справочник пользователей.
+Keyset-пагинация по (created_at DESC, id DESC): курсор - последняя строка
+страницы, следующая страница начинается строго после неё без OFFSET.
+Поиск q - подстрока без учёта регистра по ФИО, логину, email и должности,
+обслуживается триграммным GIN-индексом по выражению SEARCH_EXPRESSION.
+'''
+
+import base64
+import json
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+# Должно совпадать с выражением индекса idx_system_users_search_trgm
+SEARCH_EXPRESSION = (
+    "lower(u.full_name || ' ' || u.login || ' ' || u.email || ' ' || COALESCE(u.position, ''))"
+)
+
+PAGE_PARAMS = ('limit', 'cursor', 'q', 'role_id', 'user_group_id', 'camera_group_id', 'company', 'is_online')
+
+
+def is_page_request(params: Dict[str, Any]) -> bool:
+    '''Без параметров страницы GET отдаёт прежний полный список'''
+    return any(params.get(name) not in (None, '') for name in PAGE_PARAMS)
+
+
+def encode_cursor(created_at: str, user_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([created_at, user_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    '''(created_at, id) из курсора; ValueError, если курсор повреждён или подделан'''
+    try:
+        created_at, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(user_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+def _escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def build_filters(params: Dict[str, Any]) -> Tuple[List[str], List[Any]]:
+    clauses: List[str] = []
+    args: List[Any] = []
+    for name in ('role_id', 'user_group_id', 'camera_group_id'):
+        if params.get(name):
+            clauses.append(f'u.{name} = %s')
+            args.append(int(params[name]))
+    if params.get('company'):
+        clauses.append('u.company = %s')
+        args.append(params['company'])
+    if params.get('is_online') in ('true', 'false'):
+        clauses.append('u.is_online = %s')
+        args.append(params['is_online'] == 'true')
+    if params.get('q'):
+        clauses.append(f"{SEARCH_EXPRESSION} LIKE %s")
+        args.append(f"%{_escape_like(params['q'].strip().lower())}%")
+    if params.get('cursor'):
+        created_at, user_id = decode_cursor(params['cursor'])
+        clauses.append('(u.created_at, u.id) < (%s::timestamp, %s)')
+        args.extend([created_at, user_id])
+    return clauses, args
+
+
+def page_limit(params: Dict[str, Any]) -> int:
+    try:
+        limit = int(params.get('limit') or DEFAULT_LIMIT)
+    except ValueError:
+        raise ValueError('Invalid limit')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def list_page(cur, params: Dict[str, Any], projection: str, joins: str) -> Dict[str, Any]:
+    '''Страница пользователей и курсор следующей страницы (None на последней)'''
+    clauses, args = build_filters(params)
+    limit = page_limit(params)
+    where_sql = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    # Лишняя строка показывает, есть ли следующая страница
+    cur.execute(f'''
+        SELECT COALESCE(json_agg(page ORDER BY page.created_at DESC, page.id DESC), '[]')::text
+        FROM (
+            SELECT {projection}
+            FROM system_users u
+            {joins}
+            {where_sql}
+            ORDER BY u.created_at DESC, u.id DESC
+            LIMIT %s
+        ) AS page
+    ''', args + [limit + 1])
+    items = json.loads(cur.fetchone()[0])
+    next_cursor: Optional[str] = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1]['created_at'], items[-1]['id'])
+    return {'items': items, 'next_cursor': next_cursor}
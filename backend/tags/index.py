@@ -8,12 +8,12 @@ Returns: HTTP response dict со списком тегов или результ
 import json
 import os
 from typing import Dict, Any, List
-import psycopg2
+import db
 from psycopg2.extras import RealDictCursor
 
 def get_db_connection():
     database_url = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    return db.connect(database_url, cursor_factory=RealDictCursor)
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -40,12 +40,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 SELECT 
                     ct.*,
                     tg.name as tag_group_name,
-                    tg.color as tag_group_color,
-                    COUNT(DISTINCT cta.camera_id) as camera_count
+                    tg.color as tag_group_color
                 FROM camera_tags ct
                 LEFT JOIN tag_groups tg ON ct.tag_group_id = tg.id
-                LEFT JOIN camera_tag_assignments cta ON ct.id = cta.tag_id
-                GROUP BY ct.id, tg.name, tg.color
                 ORDER BY tg.name, ct.name
             ''')
             
@@ -1,7 +1,7 @@
 import json
 import os
 from typing import Dict, Any, Optional
-import psycopg2
+import db
 from psycopg2.extras import RealDictCursor
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -34,7 +34,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Database configuration missing'})
         }
     
-    conn = psycopg2.connect(database_url)
+    conn = db.connect(database_url)
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
     if method == 'GET':
@@ -9,28 +9,37 @@ import json
 import os
 from typing import Dict, Any, Optional
 from pydantic import BaseModel, Field
-import psycopg2
+import db
+from psycopg2.errors import CheckViolation
 from psycopg2.extras import RealDictCursor
 
 class UserGroupCreate(BaseModel):
     name: str = Field(..., min_length=1)
     description: Optional[str] = None
     parent_id: Optional[int] = None
-    user_count: int = 0
 
 class UserGroupUpdate(BaseModel):
     id: int
     name: str = Field(..., min_length=1)
     description: Optional[str] = None
     parent_id: Optional[int] = None
-    user_count: int = 0
 
 class UserGroupDelete(BaseModel):
     id: int
+    cascade: bool = False
 
 def get_db_connection():
     dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    return db.connect(dsn, cursor_factory=RealDictCursor)
+
+def build_tree(rows) -> list:
+    '''Собирает вложенное дерево из плоского списка за один проход'''
+    nodes = {row['id']: {**dict(row), 'children': []} for row in rows}
+    roots = []
+    for node in nodes.values():
+        parent = nodes.get(node['parent_id'])
+        (parent['children'] if parent else roots).append(node)
+    return roots
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -51,11 +60,74 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     conn = get_db_connection()
     
     try:
+        params = event.get('queryStringParameters') or {}
+        
+        if method == 'GET' and params.get('view') == 'tree':
+            # Прямое и суммарное по поддереву количество пользователей одним запросом по замыканию
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT ug.id, ug.name, ug.description, ug.parent_id,
+                       ug.user_count AS direct_user_count,
+                       SUM(d.user_count)::int AS subtree_user_count,
+                       (COUNT(*) - 1)::int AS descendant_count,
+                       ug.created_at, ug.updated_at
+                FROM t_p76735805_video_surveillance_s.user_groups ug
+                JOIN t_p76735805_video_surveillance_s.user_group_closure c ON c.ancestor_id = ug.id
+                JOIN t_p76735805_video_surveillance_s.user_groups d ON d.id = c.descendant_id
+                GROUP BY ug.id
+                ORDER BY ug.name
+            ''')
+            groups = cursor.fetchall()
+            cursor.close()
+            
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'isBase64Encoded': False,
+                'body': json.dumps(build_tree(groups), default=str)
+            }
+        
+        if method == 'GET' and params.get('ancestors_of'):
+            # Цепочка от корня до группы включительно - для наследования доступа
+            if not str(params['ancestors_of']).isdigit():
+                return {
+                    'statusCode': 400,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'ancestors_of must be a group id'})
+                }
+            
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT ug.id, ug.name, ug.parent_id, c.depth
+                FROM t_p76735805_video_surveillance_s.user_group_closure c
+                JOIN t_p76735805_video_surveillance_s.user_groups ug ON ug.id = c.ancestor_id
+                WHERE c.descendant_id = %s
+                ORDER BY c.depth DESC
+            ''', (int(params['ancestors_of']),))
+            ancestors = cursor.fetchall()
+            cursor.close()
+            
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'isBase64Encoded': False,
+                'body': json.dumps([dict(row) for row in ancestors])
+            }
+        
         if method == 'GET':
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT ug.id, ug.name, ug.description, ug.parent_id, 
-                       (SELECT COUNT(*) FROM t_p76735805_video_surveillance_s.system_users WHERE user_group_id = ug.id) as user_count,
+                SELECT ug.id, ug.name, ug.description, ug.parent_id, ug.user_count,
                        ug.created_at, ug.updated_at
                 FROM t_p76735805_video_surveillance_s.user_groups ug
                 ORDER BY ug.parent_id NULLS FIRST, ug.name
@@ -80,10 +152,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO t_p76735805_video_surveillance_s.user_groups 
-                (name, description, parent_id, user_count)
-                VALUES (%s, %s, %s, %s)
+                (name, description, parent_id)
+                VALUES (%s, %s, %s)
                 RETURNING id, name, description, parent_id, user_count, created_at, updated_at
-            ''', (group.name, group.description, group.parent_id, group.user_count))
+            ''', (group.name, group.description, group.parent_id))
             
             result = cursor.fetchone()
             conn.commit()
@@ -104,13 +176,23 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             group = UserGroupUpdate(**body_data)
             
             cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE t_p76735805_video_surveillance_s.user_groups
-                SET name = %s, description = %s, parent_id = %s, 
-                    user_count = %s, updated_at = CURRENT_TIMESTAMP
-                WHERE id = %s
-                RETURNING id, name, description, parent_id, user_count, created_at, updated_at
-            ''', (group.name, group.description, group.parent_id, group.user_count, group.id))
+            try:
+                cursor.execute('''
+                    UPDATE t_p76735805_video_surveillance_s.user_groups
+                    SET name = %s, description = %s, parent_id = %s, 
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                    RETURNING id, name, description, parent_id, user_count, created_at, updated_at
+                ''', (group.name, group.description, group.parent_id, group.id))
+            except CheckViolation:
+                conn.rollback()
+                cursor.close()
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'Group cannot be moved under its own subgroup'})
+                }
             
             result = cursor.fetchone()
             conn.commit()
@@ -141,24 +223,40 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             cursor = conn.cursor()
             
             cursor.execute('''
-                SELECT COUNT(*) as count 
-                FROM t_p76735805_video_surveillance_s.user_groups 
-                WHERE parent_id = %s
+                SELECT COUNT(*) FILTER (WHERE c.depth > 0) AS descendant_count,
+                       COALESCE(SUM(ug.user_count), 0) AS subtree_user_count
+                FROM t_p76735805_video_surveillance_s.user_group_closure c
+                JOIN t_p76735805_video_surveillance_s.user_groups ug ON ug.id = c.descendant_id
+                WHERE c.ancestor_id = %s
             ''', (group.id,))
-            children_count = cursor.fetchone()['count']
+            subtree = cursor.fetchone()
             
-            if children_count > 0:
+            if subtree['descendant_count'] > 0 and not group.cascade:
                 cursor.close()
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                     'isBase64Encoded': False,
-                    'body': json.dumps({'error': 'Cannot delete group with children'})
+                    'body': json.dumps({
+                        'error': 'Cannot delete group with children',
+                        'descendant_count': subtree['descendant_count'],
+                        'subtree_user_count': int(subtree['subtree_user_count'])
+                    })
                 }
             
+            # Пользователи удаляемого поддерева остаются без группы
             cursor.execute('''
+                WITH subtree AS (
+                    SELECT descendant_id AS id
+                    FROM t_p76735805_video_surveillance_s.user_group_closure
+                    WHERE ancestor_id = %s
+                ), unassigned AS (
+                    UPDATE t_p76735805_video_surveillance_s.system_users
+                    SET user_group_id = NULL
+                    WHERE user_group_id IN (SELECT id FROM subtree)
+                )
                 DELETE FROM t_p76735805_video_surveillance_s.user_groups 
-                WHERE id = %s 
+                WHERE id IN (SELECT id FROM subtree)
                 RETURNING id
             ''', (group.id,))
             result = cursor.fetchone()
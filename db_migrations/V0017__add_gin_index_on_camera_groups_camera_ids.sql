@@ -0,0 +1,8 @@
+-- GIN-индекс для обратного поиска: в каких группах состоит камера
+CREATE INDEX IF NOT EXISTS idx_camera_groups_camera_ids
+    ON t_p76735805_video_surveillance_s.camera_groups USING GIN (camera_ids);
+
+UPDATE t_p76735805_video_surveillance_s.camera_groups SET camera_ids = '{}' WHERE camera_ids IS NULL;
+
+ALTER TABLE t_p76735805_video_surveillance_s.camera_groups
+    ALTER COLUMN camera_ids SET NOT NULL;
@@ -0,0 +1,9 @@
+-- Правило динамической группы камер (NULL - группа ведётся вручную)
+ALTER TABLE t_p76735805_video_surveillance_s.camera_groups
+    ADD COLUMN IF NOT EXISTS rule JSONB;
+
+CREATE INDEX IF NOT EXISTS idx_camera_groups_rule
+    ON t_p76735805_video_surveillance_s.camera_groups USING GIN (rule)
+    WHERE rule IS NOT NULL;
+
+COMMENT ON COLUMN t_p76735805_video_surveillance_s.camera_groups.rule IS 'Предикат динамической группы: owners, divisions, model_ids, tag_ids, bbox';
@@ -0,0 +1,110 @@
+-- Предвычисленная видимость камер для каждого пользователя
+CREATE TABLE IF NOT EXISTS t_p76735805_video_surveillance_s.user_camera_visibility (
+    user_id INTEGER PRIMARY KEY REFERENCES t_p76735805_video_surveillance_s.system_users(id) ON DELETE CASCADE,
+    all_cameras BOOLEAN NOT NULL DEFAULT false,
+    camera_ids INTEGER[] NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE t_p76735805_video_surveillance_s.user_camera_visibility IS 'Множество камер, доступных пользователю (роль + группа камер)';
+COMMENT ON COLUMN t_p76735805_video_surveillance_s.user_camera_visibility.all_cameras IS 'Пользователю доступны все камеры, camera_ids не используется';
+COMMENT ON COLUMN t_p76735805_video_surveillance_s.user_camera_visibility.camera_ids IS 'Отсортированный массив ID камер без повторов';
+
+-- Пересчёт видимости для набора пользователей.
+-- Камеры видны, если роль даёт monitoring.view или parameters.camera_sources.cameras.view;
+-- без группы камер пользователю доступны все камеры, иначе - состав его группы.
+CREATE OR REPLACE FUNCTION t_p76735805_video_surveillance_s.refresh_user_camera_visibility(p_user_ids INTEGER[])
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    affected INTEGER;
+BEGIN
+    INSERT INTO t_p76735805_video_surveillance_s.user_camera_visibility (user_id, all_cameras, camera_ids, updated_at)
+    SELECT u.id,
+           v.can_view AND u.camera_group_id IS NULL,
+           CASE WHEN v.can_view AND u.camera_group_id IS NOT NULL
+                THEN ARRAY(SELECT DISTINCT c FROM unnest(cg.camera_ids) AS c ORDER BY c)
+                ELSE '{}'::integer[]
+           END,
+           NOW()
+    FROM t_p76735805_video_surveillance_s.system_users u
+    LEFT JOIN t_p76735805_video_surveillance_s.roles r ON r.id = u.role_id
+    LEFT JOIN t_p76735805_video_surveillance_s.camera_groups cg ON cg.id = u.camera_group_id
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(r.permissions #>> '{monitoring,view}' = 'true', false)
+            OR COALESCE(r.permissions #>> '{parameters,camera_sources,cameras,view}' = 'true', false) AS can_view
+    ) v
+    WHERE u.id = ANY(p_user_ids)
+    ON CONFLICT (user_id) DO UPDATE
+    SET all_cameras = EXCLUDED.all_cameras,
+        camera_ids = EXCLUDED.camera_ids,
+        updated_at = EXCLUDED.updated_at;
+
+    GET DIAGNOSTICS affected = ROW_COUNT;
+    RETURN affected;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION t_p76735805_video_surveillance_s.trg_visibility_system_users()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM t_p76735805_video_surveillance_s.refresh_user_camera_visibility(ARRAY[NEW.id]);
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION t_p76735805_video_surveillance_s.trg_visibility_camera_groups()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM t_p76735805_video_surveillance_s.refresh_user_camera_visibility(ARRAY(
+        SELECT id FROM t_p76735805_video_surveillance_s.system_users WHERE camera_group_id = OLD.id
+    ));
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION t_p76735805_video_surveillance_s.trg_visibility_roles()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM t_p76735805_video_surveillance_s.refresh_user_camera_visibility(ARRAY(
+        SELECT id FROM t_p76735805_video_surveillance_s.system_users WHERE role_id = OLD.id
+    ));
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_system_users_visibility
+    AFTER INSERT OR UPDATE OF role_id, camera_group_id
+    ON t_p76735805_video_surveillance_s.system_users
+    FOR EACH ROW
+    EXECUTE FUNCTION t_p76735805_video_surveillance_s.trg_visibility_system_users();
+
+CREATE TRIGGER trg_camera_groups_visibility
+    AFTER UPDATE OF camera_ids
+    ON t_p76735805_video_surveillance_s.camera_groups
+    FOR EACH ROW
+    WHEN (OLD.camera_ids IS DISTINCT FROM NEW.camera_ids)
+    EXECUTE FUNCTION t_p76735805_video_surveillance_s.trg_visibility_camera_groups();
+
+CREATE TRIGGER trg_camera_groups_visibility_delete
+    AFTER DELETE
+    ON t_p76735805_video_surveillance_s.camera_groups
+    FOR EACH ROW
+    EXECUTE FUNCTION t_p76735805_video_surveillance_s.trg_visibility_camera_groups();
+
+CREATE TRIGGER trg_roles_visibility
+    AFTER UPDATE OF permissions OR DELETE
+    ON t_p76735805_video_surveillance_s.roles
+    FOR EACH ROW
+    EXECUTE FUNCTION t_p76735805_video_surveillance_s.trg_visibility_roles();
+
+SELECT t_p76735805_video_surveillance_s.refresh_user_camera_visibility(
+    ARRAY(SELECT id FROM t_p76735805_video_surveillance_s.system_users)
+);
@@ -0,0 +1,53 @@
+-- Журнал изменений назначений тегов для инкрементального обновления битмап-индекса
+CREATE TABLE IF NOT EXISTS t_p76735805_video_surveillance_s.camera_tag_assignment_log (
+    id BIGSERIAL PRIMARY KEY,
+    camera_id INTEGER NOT NULL,
+    tag_id INTEGER NOT NULL,
+    assigned BOOLEAN NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_camera_tag_assignment_log_created
+    ON t_p76735805_video_surveillance_s.camera_tag_assignment_log(created_at);
+
+COMMENT ON TABLE t_p76735805_video_surveillance_s.camera_tag_assignment_log IS 'Журнал назначений/снятий тегов, хранится сутки';
+
+CREATE OR REPLACE FUNCTION t_p76735805_video_surveillance_s.trg_log_tag_assignments_insert()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO t_p76735805_video_surveillance_s.camera_tag_assignment_log (camera_id, tag_id, assigned)
+    SELECT camera_id, tag_id, true FROM new_rows;
+
+    DELETE FROM t_p76735805_video_surveillance_s.camera_tag_assignment_log
+    WHERE created_at < NOW() - INTERVAL '1 day';
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION t_p76735805_video_surveillance_s.trg_log_tag_assignments_delete()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO t_p76735805_video_surveillance_s.camera_tag_assignment_log (camera_id, tag_id, assigned)
+    SELECT camera_id, tag_id, false FROM old_rows;
+
+    DELETE FROM t_p76735805_video_surveillance_s.camera_tag_assignment_log
+    WHERE created_at < NOW() - INTERVAL '1 day';
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_camera_tag_assignments_log_insert
+    AFTER INSERT ON camera_tag_assignments
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION t_p76735805_video_surveillance_s.trg_log_tag_assignments_insert();
+
+CREATE TRIGGER trg_camera_tag_assignments_log_delete
+    AFTER DELETE ON camera_tag_assignments
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION t_p76735805_video_surveillance_s.trg_log_tag_assignments_delete();
@@ -0,0 +1,187 @@
+-- Кэш счётчиков для списков ролей, групп пользователей, тегов и групп камер.
+-- Значения поддерживаются триггерами, расхождения исправляет reconcile_counters().
+ALTER TABLE t_p76735805_video_surveillance_s.roles
+    ADD COLUMN IF NOT EXISTS users_count INTEGER NOT NULL DEFAULT 0;
+
+ALTER TABLE t_p76735805_video_surveillance_s.user_groups
+    ALTER COLUMN user_count SET DEFAULT 0;
+
+ALTER TABLE camera_tags
+    ADD COLUMN IF NOT EXISTS camera_count INTEGER NOT NULL DEFAULT 0;
+
+ALTER TABLE camera_groups
+    ADD COLUMN IF NOT EXISTS camera_count INTEGER NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_camera_group_members_group ON camera_group_members(group_id);
+CREATE INDEX IF NOT EXISTS idx_camera_tag_assignments_tag ON camera_tag_assignments(tag_id);
+
+-- system_users -> roles.users_count, user_groups.user_count
+CREATE OR REPLACE FUNCTION t_p76735805_video_surveillance_s.trg_count_system_users()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        IF TG_OP = 'DELETE' OR OLD.role_id IS DISTINCT FROM NEW.role_id THEN
+            UPDATE t_p76735805_video_surveillance_s.roles
+            SET users_count = users_count - 1 WHERE id = OLD.role_id;
+        END IF;
+        IF TG_OP = 'DELETE' OR OLD.user_group_id IS DISTINCT FROM NEW.user_group_id THEN
+            UPDATE t_p76735805_video_surveillance_s.user_groups
+            SET user_count = user_count - 1 WHERE id = OLD.user_group_id;
+        END IF;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        IF TG_OP = 'INSERT' OR OLD.role_id IS DISTINCT FROM NEW.role_id THEN
+            UPDATE t_p76735805_video_surveillance_s.roles
+            SET users_count = users_count + 1 WHERE id = NEW.role_id;
+        END IF;
+        IF TG_OP = 'INSERT' OR OLD.user_group_id IS DISTINCT FROM NEW.user_group_id THEN
+            UPDATE t_p76735805_video_surveillance_s.user_groups
+            SET user_count = user_count + 1 WHERE id = NEW.user_group_id;
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_system_users_counters
+    AFTER INSERT OR DELETE OR UPDATE OF role_id, user_group_id
+    ON t_p76735805_video_surveillance_s.system_users
+    FOR EACH ROW
+    EXECUTE FUNCTION t_p76735805_video_surveillance_s.trg_count_system_users();
+
+-- camera_tag_assignments -> camera_tags.camera_count (одна дельта на тег за оператор)
+CREATE OR REPLACE FUNCTION t_p76735805_video_surveillance_s.trg_count_tag_assignments_insert()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE camera_tags t SET camera_count = t.camera_count + d.n
+    FROM (SELECT tag_id, COUNT(*) AS n FROM new_rows GROUP BY tag_id) d
+    WHERE t.id = d.tag_id;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION t_p76735805_video_surveillance_s.trg_count_tag_assignments_delete()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE camera_tags t SET camera_count = t.camera_count - d.n
+    FROM (SELECT tag_id, COUNT(*) AS n FROM old_rows GROUP BY tag_id) d
+    WHERE t.id = d.tag_id;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_camera_tag_assignments_count_insert
+    AFTER INSERT ON camera_tag_assignments
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION t_p76735805_video_surveillance_s.trg_count_tag_assignments_insert();
+
+CREATE TRIGGER trg_camera_tag_assignments_count_delete
+    AFTER DELETE ON camera_tag_assignments
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION t_p76735805_video_surveillance_s.trg_count_tag_assignments_delete();
+
+-- camera_group_members -> camera_groups.camera_count
+CREATE OR REPLACE FUNCTION t_p76735805_video_surveillance_s.trg_count_group_members_insert()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE camera_groups g SET camera_count = g.camera_count + d.n
+    FROM (SELECT group_id, COUNT(*) AS n FROM new_rows GROUP BY group_id) d
+    WHERE g.id = d.group_id;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION t_p76735805_video_surveillance_s.trg_count_group_members_delete()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE camera_groups g SET camera_count = g.camera_count - d.n
+    FROM (SELECT group_id, COUNT(*) AS n FROM old_rows GROUP BY group_id) d
+    WHERE g.id = d.group_id;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_camera_group_members_count_insert
+    AFTER INSERT ON camera_group_members
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION t_p76735805_video_surveillance_s.trg_count_group_members_insert();
+
+CREATE TRIGGER trg_camera_group_members_count_delete
+    AFTER DELETE ON camera_group_members
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION t_p76735805_video_surveillance_s.trg_count_group_members_delete();
+
+-- Сверка счётчиков с фактическими данными, возвращает число исправленных строк по таблицам
+CREATE OR REPLACE FUNCTION t_p76735805_video_surveillance_s.reconcile_counters()
+RETURNS TABLE (table_name TEXT, fixed INTEGER)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    n INTEGER;
+BEGIN
+    UPDATE t_p76735805_video_surveillance_s.roles r
+    SET users_count = c.actual
+    FROM (
+        SELECT r2.id, COUNT(u.id) AS actual
+        FROM t_p76735805_video_surveillance_s.roles r2
+        LEFT JOIN t_p76735805_video_surveillance_s.system_users u ON u.role_id = r2.id
+        GROUP BY r2.id
+    ) c
+    WHERE r.id = c.id AND r.users_count <> c.actual;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    table_name := 'roles'; fixed := n; RETURN NEXT;
+
+    UPDATE t_p76735805_video_surveillance_s.user_groups ug
+    SET user_count = c.actual
+    FROM (
+        SELECT g.id, COUNT(u.id) AS actual
+        FROM t_p76735805_video_surveillance_s.user_groups g
+        LEFT JOIN t_p76735805_video_surveillance_s.system_users u ON u.user_group_id = g.id
+        GROUP BY g.id
+    ) c
+    WHERE ug.id = c.id AND ug.user_count IS DISTINCT FROM c.actual;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    table_name := 'user_groups'; fixed := n; RETURN NEXT;
+
+    UPDATE camera_tags t
+    SET camera_count = c.actual
+    FROM (
+        SELECT ct.id, COUNT(cta.camera_id) AS actual
+        FROM camera_tags ct
+        LEFT JOIN camera_tag_assignments cta ON cta.tag_id = ct.id
+        GROUP BY ct.id
+    ) c
+    WHERE t.id = c.id AND t.camera_count <> c.actual;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    table_name := 'camera_tags'; fixed := n; RETURN NEXT;
+
+    UPDATE camera_groups g
+    SET camera_count = c.actual
+    FROM (
+        SELECT cg.id, COUNT(cgm.camera_id) AS actual
+        FROM camera_groups cg
+        LEFT JOIN camera_group_members cgm ON cgm.group_id = cg.id
+        GROUP BY cg.id
+    ) c
+    WHERE g.id = c.id AND g.camera_count <> c.actual;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    table_name := 'camera_groups'; fixed := n; RETURN NEXT;
+END;
+$$;
+
+SELECT * FROM t_p76735805_video_surveillance_s.reconcile_counters();
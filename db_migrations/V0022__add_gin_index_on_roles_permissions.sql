@@ -0,0 +1,3 @@
+-- GIN-индекс для поиска ролей, выдающих право: permissions @> '{"monitoring": {"view": true}}'
+CREATE INDEX IF NOT EXISTS idx_roles_permissions
+    ON t_p76735805_video_surveillance_s.roles USING GIN (permissions jsonb_path_ops);
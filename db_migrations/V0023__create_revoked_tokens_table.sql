@@ -0,0 +1,12 @@
+-- Отозванные подписанные токены сессий (хранятся до истечения срока токена)
+CREATE TABLE IF NOT EXISTS t_p76735805_video_surveillance_s.revoked_tokens (
+    jti VARCHAR(64) PRIMARY KEY,
+    user_id INTEGER,
+    expires_at TIMESTAMPTZ NOT NULL,
+    revoked_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_revoked_tokens_revoked_at ON t_p76735805_video_surveillance_s.revoked_tokens(revoked_at);
+CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires_at ON t_p76735805_video_surveillance_s.revoked_tokens(expires_at);
+
+COMMENT ON TABLE t_p76735805_video_surveillance_s.revoked_tokens IS 'Список отзыва подписанных токенов, зеркалируется в кэш обработчиков';
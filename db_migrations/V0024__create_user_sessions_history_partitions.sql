@@ -0,0 +1,126 @@
+-- История завершённых сессий, секционированная по месяцам created_at.
+-- В user_sessions остаются только живые сессии, истёкшие переносит reap_user_sessions().
+CREATE TABLE IF NOT EXISTS t_p76735805_video_surveillance_s.user_sessions_history (
+    id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    session_token VARCHAR(255) NOT NULL,
+    ip_address VARCHAR(45),
+    user_agent TEXT,
+    current_route VARCHAR(255),
+    last_activity TIMESTAMP,
+    created_at TIMESTAMP NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT NOW()
+) PARTITION BY RANGE (created_at);
+
+CREATE INDEX IF NOT EXISTS idx_user_sessions_history_user
+    ON t_p76735805_video_surveillance_s.user_sessions_history(user_id, created_at);
+
+-- Свёртка входов по пользователям и дням, переживает удаление старых секций
+CREATE TABLE IF NOT EXISTS t_p76735805_video_surveillance_s.login_history_daily (
+    user_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    active_seconds BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+
+COMMENT ON TABLE t_p76735805_video_surveillance_s.user_sessions_history IS 'Завершённые сессии, секции по месяцам';
+COMMENT ON TABLE t_p76735805_video_surveillance_s.login_history_daily IS 'Количество и длительность сессий пользователя по дням';
+
+-- Создаёт недостающие месячные секции, покрывающие интервал [p_from, p_to]
+CREATE OR REPLACE FUNCTION t_p76735805_video_surveillance_s.ensure_session_history_partitions(p_from DATE, p_to DATE)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    month_start DATE;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    FOR month_start IN
+        SELECT generate_series(date_trunc('month', p_from), date_trunc('month', p_to), INTERVAL '1 month')::date
+    LOOP
+        partition_name := 'user_sessions_history_' || to_char(month_start, 'YYYYMM');
+        IF to_regclass('t_p76735805_video_surveillance_s.' || partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE t_p76735805_video_surveillance_s.%I PARTITION OF t_p76735805_video_surveillance_s.user_sessions_history FOR VALUES FROM (%L) TO (%L)',
+                partition_name,
+                month_start,
+                (month_start + INTERVAL '1 month')::date
+            );
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+-- Переносит истёкшие сессии в историю со свёрткой по дням и удаляет секции старше p_retention_months
+CREATE OR REPLACE FUNCTION t_p76735805_video_surveillance_s.reap_user_sessions(p_retention_months INTEGER DEFAULT 6)
+RETURNS TABLE (moved INTEGER, dropped INTEGER)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    oldest_created DATE;
+    cutoff DATE := (date_trunc('month', NOW()) - make_interval(months => p_retention_months))::date;
+    part RECORD;
+BEGIN
+    moved := 0;
+    dropped := 0;
+
+    SELECT MIN(created_at)::date INTO oldest_created
+    FROM t_p76735805_video_surveillance_s.user_sessions
+    WHERE expires_at < NOW();
+
+    IF oldest_created IS NOT NULL THEN
+        PERFORM t_p76735805_video_surveillance_s.ensure_session_history_partitions(
+            GREATEST(oldest_created, cutoff),
+            (NOW() + INTERVAL '1 month')::date
+        );
+
+        WITH expired AS (
+            DELETE FROM t_p76735805_video_surveillance_s.user_sessions
+            WHERE expires_at < NOW()
+            RETURNING *
+        ), archived AS (
+            INSERT INTO t_p76735805_video_surveillance_s.user_sessions_history
+            (id, user_id, session_token, ip_address, user_agent, current_route, last_activity, created_at, expires_at)
+            SELECT id, user_id, session_token, ip_address, user_agent, current_route, last_activity,
+                   COALESCE(created_at, NOW()), expires_at
+            FROM expired
+            WHERE COALESCE(created_at, NOW()) >= cutoff
+        ), rolled AS (
+            INSERT INTO t_p76735805_video_surveillance_s.login_history_daily AS d (user_id, day, sessions, active_seconds)
+            SELECT user_id, COALESCE(created_at, NOW())::date, COUNT(*),
+                   SUM(GREATEST(EXTRACT(EPOCH FROM (COALESCE(last_activity, created_at) - created_at)), 0))::bigint
+            FROM expired
+            GROUP BY user_id, COALESCE(created_at, NOW())::date
+            ON CONFLICT (user_id, day) DO UPDATE
+            SET sessions = d.sessions + EXCLUDED.sessions,
+                active_seconds = d.active_seconds + EXCLUDED.active_seconds
+        )
+        SELECT COUNT(*) INTO moved FROM expired;
+    END IF;
+
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        JOIN pg_namespace n ON n.oid = p.relnamespace
+        WHERE n.nspname = 't_p76735805_video_surveillance_s'
+          AND p.relname = 'user_sessions_history'
+          AND c.relname < 'user_sessions_history_' || to_char(cutoff, 'YYYYMM')
+    LOOP
+        EXECUTE format('ALTER TABLE t_p76735805_video_surveillance_s.user_sessions_history DETACH PARTITION t_p76735805_video_surveillance_s.%I', part.relname);
+        EXECUTE format('DROP TABLE t_p76735805_video_surveillance_s.%I', part.relname);
+        dropped := dropped + 1;
+    END LOOP;
+
+    RETURN NEXT;
+END;
+$$;
+
+SELECT t_p76735805_video_surveillance_s.ensure_session_history_partitions(CURRENT_DATE, (CURRENT_DATE + INTERVAL '1 month')::date);
+SELECT * FROM t_p76735805_video_surveillance_s.reap_user_sessions(6);
@@ -0,0 +1,21 @@
+-- Присутствие пользователей: время последнего heartbeat и быстрый поиск тех, кто в сети
+ALTER TABLE t_p76735805_video_surveillance_s.system_users
+    ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMPTZ;
+
+UPDATE t_p76735805_video_surveillance_s.system_users u
+SET last_seen_at = s.last_activity
+FROM (
+    SELECT user_id, MAX(last_activity) AS last_activity
+    FROM t_p76735805_video_surveillance_s.user_sessions
+    GROUP BY user_id
+) s
+WHERE s.user_id = u.id;
+
+UPDATE t_p76735805_video_surveillance_s.system_users
+SET is_online = false
+WHERE is_online
+  AND (last_seen_at IS NULL OR last_seen_at < NOW() - INTERVAL '90 seconds');
+
+CREATE INDEX IF NOT EXISTS idx_system_users_online
+    ON t_p76735805_video_surveillance_s.system_users (id)
+    WHERE is_online;
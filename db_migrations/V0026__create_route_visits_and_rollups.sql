@@ -0,0 +1,81 @@
+-- Журнал посещений разделов: строка пишется при уходе из маршрута (append-only).
+-- Свёртка по пользователю, дню и маршруту поддерживается триггером уровня оператора.
+ALTER TABLE t_p76735805_video_surveillance_s.user_sessions
+    ADD COLUMN IF NOT EXISTS route_entered_at TIMESTAMP;
+
+UPDATE t_p76735805_video_surveillance_s.user_sessions
+SET route_entered_at = COALESCE(last_activity, created_at)
+WHERE route_entered_at IS NULL;
+
+ALTER TABLE t_p76735805_video_surveillance_s.user_sessions
+    ALTER COLUMN route_entered_at SET DEFAULT CURRENT_TIMESTAMP;
+
+CREATE TABLE IF NOT EXISTS t_p76735805_video_surveillance_s.route_visits (
+    id BIGSERIAL PRIMARY KEY,
+    session_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    route VARCHAR(255) NOT NULL,
+    entered_at TIMESTAMP NOT NULL,
+    left_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_route_visits_entered_at ON t_p76735805_video_surveillance_s.route_visits(entered_at);
+
+CREATE TABLE IF NOT EXISTS t_p76735805_video_surveillance_s.route_usage_daily (
+    day DATE NOT NULL,
+    user_id INTEGER NOT NULL,
+    route VARCHAR(255) NOT NULL,
+    visits INTEGER NOT NULL DEFAULT 0,
+    seconds BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user_id, route)
+);
+
+CREATE INDEX IF NOT EXISTS idx_route_usage_daily_user ON t_p76735805_video_surveillance_s.route_usage_daily(user_id, day);
+
+CREATE OR REPLACE FUNCTION t_p76735805_video_surveillance_s.trg_rollup_route_visits()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO t_p76735805_video_surveillance_s.route_usage_daily (day, user_id, route, visits, seconds)
+    SELECT entered_at::date, user_id, route, COUNT(*),
+           SUM(GREATEST(EXTRACT(EPOCH FROM (left_at - entered_at)), 0))::bigint
+    FROM new_rows
+    GROUP BY entered_at::date, user_id, route
+    ON CONFLICT (day, user_id, route) DO UPDATE
+    SET visits = route_usage_daily.visits + EXCLUDED.visits,
+        seconds = route_usage_daily.seconds + EXCLUDED.seconds;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_route_visits_rollup
+    AFTER INSERT ON t_p76735805_video_surveillance_s.route_visits
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION t_p76735805_video_surveillance_s.trg_rollup_route_visits();
+
+COMMENT ON TABLE t_p76735805_video_surveillance_s.route_visits IS 'Завершённые посещения разделов, пишутся пакетно при смене маршрута';
+COMMENT ON TABLE t_p76735805_video_surveillance_s.route_usage_daily IS 'Время в разделах по пользователям и дням';
+
+-- Последнее посещение удаляемой (архивируемой) сессии закрывается её последней активностью
+CREATE OR REPLACE FUNCTION t_p76735805_video_surveillance_s.trg_close_route_visits()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO t_p76735805_video_surveillance_s.route_visits (session_id, user_id, route, entered_at, left_at)
+    SELECT id, user_id, current_route, route_entered_at, last_activity
+    FROM old_rows
+    WHERE current_route IS NOT NULL
+      AND route_entered_at IS NOT NULL
+      AND last_activity > route_entered_at;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_user_sessions_close_visits
+    AFTER DELETE ON t_p76735805_video_surveillance_s.user_sessions
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION t_p76735805_video_surveillance_s.trg_close_route_visits();
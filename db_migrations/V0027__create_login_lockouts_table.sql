@@ -0,0 +1,9 @@
+-- Общие блокировки логинов после серии неудачных попыток (используются при LOGIN_THROTTLE_SHARED=1)
+CREATE TABLE IF NOT EXISTS t_p76735805_video_surveillance_s.login_lockouts (
+    login VARCHAR(100) PRIMARY KEY,
+    failures INTEGER NOT NULL DEFAULT 0,
+    locked_until TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE t_p76735805_video_surveillance_s.login_lockouts IS 'Счётчики неудачных входов и блокировки, общие для всех экземпляров auth';
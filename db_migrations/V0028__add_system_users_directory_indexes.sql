@@ -0,0 +1,13 @@
+-- Индексы справочника пользователей: keyset-пагинация, фильтр по компании, триграммный поиск
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_system_users_created_id
+    ON system_users (created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_system_users_company
+    ON system_users (company);
+
+-- Выражение совпадает с SEARCH_EXPRESSION в backend/system-users/user_directory.py
+CREATE INDEX IF NOT EXISTS idx_system_users_search_trgm
+    ON system_users
+    USING GIN (lower(full_name || ' ' || login || ' ' || email || ' ' || COALESCE(position, '')) gin_trgm_ops);
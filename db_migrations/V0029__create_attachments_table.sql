@@ -0,0 +1,19 @@
+-- Метаданные вложений; содержимое хранится по SHA-256 вне БД (функция attachments)
+CREATE TABLE IF NOT EXISTS t_p76735805_video_surveillance_s.attachments (
+    id SERIAL PRIMARY KEY,
+    sha256 CHAR(64) NOT NULL,
+    size BIGINT NOT NULL,
+    file_name VARCHAR(255) NOT NULL,
+    content_type VARCHAR(255) NOT NULL DEFAULT 'application/octet-stream',
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_attachments_sha256 ON t_p76735805_video_surveillance_s.attachments(sha256);
+
+-- Пользователь ссылается на вложения по id; attached_files остаётся для старых записей
+ALTER TABLE system_users
+    ADD COLUMN IF NOT EXISTS attachment_ids INTEGER[] NOT NULL DEFAULT '{}';
+
+CREATE INDEX IF NOT EXISTS idx_system_users_attachment_ids ON system_users USING GIN (attachment_ids);
+
+COMMENT ON TABLE t_p76735805_video_surveillance_s.attachments IS 'Вложения: одно содержимое (sha256) может использоваться несколькими записями';
@@ -0,0 +1,102 @@
+-- Таблица замыкания иерархии групп пользователей: все пары (предок, потомок) с глубиной,
+-- включая саму группу с глубиной 0. Поддерживается триггерами на user_groups.
+CREATE TABLE IF NOT EXISTS t_p76735805_video_surveillance_s.user_group_closure (
+    ancestor_id INTEGER NOT NULL REFERENCES t_p76735805_video_surveillance_s.user_groups(id) ON DELETE CASCADE,
+    descendant_id INTEGER NOT NULL REFERENCES t_p76735805_video_surveillance_s.user_groups(id) ON DELETE CASCADE,
+    depth INTEGER NOT NULL,
+    PRIMARY KEY (ancestor_id, descendant_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_group_closure_descendant
+    ON t_p76735805_video_surveillance_s.user_group_closure(descendant_id, depth);
+
+CREATE INDEX IF NOT EXISTS idx_user_groups_parent_id
+    ON t_p76735805_video_surveillance_s.user_groups(parent_id);
+
+INSERT INTO t_p76735805_video_surveillance_s.user_group_closure (ancestor_id, descendant_id, depth)
+WITH RECURSIVE tree AS (
+    SELECT id AS ancestor_id, id AS descendant_id, 0 AS depth
+    FROM t_p76735805_video_surveillance_s.user_groups
+    UNION ALL
+    SELECT tree.ancestor_id, g.id, tree.depth + 1
+    FROM tree
+    JOIN t_p76735805_video_surveillance_s.user_groups g ON g.parent_id = tree.descendant_id
+)
+SELECT ancestor_id, descendant_id, depth FROM tree
+ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION t_p76735805_video_surveillance_s.trg_user_group_closure_insert()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO t_p76735805_video_surveillance_s.user_group_closure (ancestor_id, descendant_id, depth)
+    SELECT NEW.id, NEW.id, 0
+    UNION ALL
+    SELECT ancestor_id, NEW.id, depth + 1
+    FROM t_p76735805_video_surveillance_s.user_group_closure
+    WHERE descendant_id = NEW.parent_id;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_user_groups_closure_insert
+    AFTER INSERT ON t_p76735805_video_surveillance_s.user_groups
+    FOR EACH ROW
+    EXECUTE FUNCTION t_p76735805_video_surveillance_s.trg_user_group_closure_insert();
+
+-- Перенос группы под собственного потомка образовал бы цикл
+CREATE OR REPLACE FUNCTION t_p76735805_video_surveillance_s.trg_user_group_check_cycle()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF NEW.parent_id IS NOT NULL AND EXISTS (
+        SELECT 1 FROM t_p76735805_video_surveillance_s.user_group_closure
+        WHERE ancestor_id = NEW.id AND descendant_id = NEW.parent_id
+    ) THEN
+        RAISE EXCEPTION 'Group % cannot be moved under its own descendant %', NEW.id, NEW.parent_id
+            USING ERRCODE = 'check_violation';
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+CREATE TRIGGER trg_user_groups_check_cycle
+    BEFORE UPDATE OF parent_id ON t_p76735805_video_surveillance_s.user_groups
+    FOR EACH ROW
+    WHEN (OLD.parent_id IS DISTINCT FROM NEW.parent_id)
+    EXECUTE FUNCTION t_p76735805_video_surveillance_s.trg_user_group_check_cycle();
+
+-- Перенос поддерева: связи поддерева со старыми предками заменяются связями с новыми
+CREATE OR REPLACE FUNCTION t_p76735805_video_surveillance_s.trg_user_group_closure_move()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    DELETE FROM t_p76735805_video_surveillance_s.user_group_closure c
+    USING t_p76735805_video_surveillance_s.user_group_closure sub,
+          t_p76735805_video_surveillance_s.user_group_closure sup
+    WHERE sub.ancestor_id = NEW.id
+      AND sup.descendant_id = NEW.id
+      AND sup.ancestor_id <> NEW.id
+      AND c.ancestor_id = sup.ancestor_id
+      AND c.descendant_id = sub.descendant_id;
+
+    INSERT INTO t_p76735805_video_surveillance_s.user_group_closure (ancestor_id, descendant_id, depth)
+    SELECT sup.ancestor_id, sub.descendant_id, sup.depth + sub.depth + 1
+    FROM t_p76735805_video_surveillance_s.user_group_closure sup
+    CROSS JOIN t_p76735805_video_surveillance_s.user_group_closure sub
+    WHERE sup.descendant_id = NEW.parent_id
+      AND sub.ancestor_id = NEW.id;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_user_groups_closure_move
+    AFTER UPDATE OF parent_id ON t_p76735805_video_surveillance_s.user_groups
+    FOR EACH ROW
+    WHEN (OLD.parent_id IS DISTINCT FROM NEW.parent_id)
+    EXECUTE FUNCTION t_p76735805_video_surveillance_s.trg_user_group_closure_move();
+
+COMMENT ON TABLE t_p76735805_video_surveillance_s.user_group_closure IS 'Замыкание иерархии групп пользователей для поддеревьев и наследования доступа';
@@ -0,0 +1,8 @@
+-- Идентификатор транзакции записи журнала: битмап-индекс догружает все записи
+-- транзакций, которые ещё не были завершены при прошлом чтении, независимо от
+-- того, как долго они шли до фиксации
+ALTER TABLE t_p76735805_video_surveillance_s.camera_tag_assignment_log
+    ADD COLUMN IF NOT EXISTS xid XID8 NOT NULL DEFAULT pg_current_xact_id();
+
+CREATE INDEX IF NOT EXISTS idx_camera_tag_assignment_log_xid
+    ON t_p76735805_video_surveillance_s.camera_tag_assignment_log(xid);
@@ -0,0 +1,6 @@
+-- Идентификатор транзакции отзыва: кэш отзывов в обработчиках догружает все
+-- отзывы транзакций, которые ещё не были завершены при прошлой синхронизации
+ALTER TABLE t_p76735805_video_surveillance_s.revoked_tokens
+    ADD COLUMN IF NOT EXISTS xid XID8 NOT NULL DEFAULT pg_current_xact_id();
+
+CREATE INDEX IF NOT EXISTS idx_revoked_tokens_xid ON t_p76735805_video_surveillance_s.revoked_tokens(xid);
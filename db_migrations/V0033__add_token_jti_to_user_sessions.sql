@@ -0,0 +1,5 @@
+-- Подписанный токен, с которым шли heartbeat сессии: при завершении сессии
+-- отзывается именно он, а не токен того, кто завершает сессию
+ALTER TABLE t_p76735805_video_surveillance_s.user_sessions
+    ADD COLUMN IF NOT EXISTS token_jti VARCHAR(64),
+    ADD COLUMN IF NOT EXISTS token_expires_at TIMESTAMPTZ;